@@ -5,3 +5,6 @@ from django.utils.translation import ugettext_lazy as _
 class BookingConfig(AppConfig):
     name = 'app.booking'
     verbose_name = _("Booking")
+
+    def ready(self):
+        import app.booking.signals
@@ -0,0 +1,170 @@
+import datetime
+import logging
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import ugettext_noop
+
+from app.booking.models import Surcharge, FreightRate
+from app.core.models import Company, Role, EmailNotificationSetting
+from app.websockets.models import Notification
+from app.websockets.tasks import create_and_assign_notifications, send_digest_emails
+from config import settings
+
+logger = logging.getLogger("acemaven.task.logging")
+
+EXPIRATION_NOTIFICATION_DAYS = 5
+EXPIRATION_COMPANIES_CHUNK_SIZE = 200
+
+
+class ExpirationDigest:
+    """
+    Class, that provides set based notification of users about expiring items of their companies.
+    Companies are processed in chunks with a constant number of queries per chunk, notifications
+    about items expiring in EXPIRATION_NOTIFICATION_DAYS are created in bulk and every user gets
+    a single digest email with the items expiring at that date or at the date of the user's
+    email notification setting.
+    """
+
+    section = None
+    action_path = None
+    message_body = None
+    setting_field = None
+    path = None
+
+    def __init__(self, chunk_size=EXPIRATION_COMPANIES_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.today = timezone.localtime().date()
+        self.notification_date = self.today + datetime.timedelta(days=EXPIRATION_NOTIFICATION_DAYS)
+
+    def get_items(self, companies_ids, dates):
+        """
+        Returns list of dicts with id, company_id, expiration_date and description of items
+        of companies expiring at one of dates.
+        """
+
+        raise NotImplementedError
+
+    def get_item_link(self, item_id):
+        return f'{settings.DOMAIN_ADDRESS}services/{self.path}/{item_id}'
+
+    def get_companies_ids_chunks(self):
+        last_company_id = 0
+        while True:
+            companies_ids = list(Company.objects.filter(
+                type=Company.FREIGHT_FORWARDER,
+                id__gt=last_company_id,
+            ).order_by('id').values_list('id', flat=True)[:self.chunk_size])
+            if not companies_ids:
+                return
+            yield companies_ids
+            last_company_id = companies_ids[-1]
+
+    def get_companies_users(self, companies_ids):
+        companies_users = dict()
+        for company_id, user_id in Role.objects.filter(
+                company_id__in=companies_ids,
+                groups__name__in=('master', 'agent'),
+        ).values_list('company_id', 'user_id').distinct():
+            companies_users.setdefault(company_id, []).append(user_id)
+        return companies_users
+
+    def get_users_dates(self, users_ids):
+        return {
+            user_id: self.today + datetime.timedelta(days=days)
+            for user_id, days in EmailNotificationSetting.objects.filter(
+                user_id__in=users_ids,
+                **{self.setting_field: True},
+            ).values_list('user_id', f'{self.setting_field}_days')
+        }
+
+    def process_chunk(self, companies_ids):
+        companies_users = self.get_companies_users(companies_ids)
+        users_dates = self.get_users_dates([user_id for users_ids in companies_users.values() for user_id in users_ids])
+        items = self.get_items(companies_ids, {self.notification_date, *users_dates.values()})
+
+        companies_items = dict()
+        for item in items:
+            companies_items.setdefault(item['company_id'], []).append(item)
+
+        notifications = []
+        digests = []
+        for company_id, company_items in companies_items.items():
+            users_ids = companies_users.get(company_id, [])
+            notifications.extend(
+                (item['id'], users_ids) for item in {
+                    item['id']: item for item in company_items if item['expiration_date'] == self.notification_date
+                }.values()
+            )
+            for user_id in users_ids:
+                user_items = {
+                    item['id']: item for item in company_items
+                    if item['expiration_date'] in (self.notification_date, users_dates.get(user_id))
+                }
+                if not user_items:
+                    continue
+                data = [(item['description'], self.get_item_link(item_id)) for item_id, item in user_items.items()]
+                link = self.get_item_link(next(iter(user_items))) if len(user_items) == 1 else None
+                digests.append((user_id, link, data))
+
+        notifications = [(item_id, users_ids) for item_id, users_ids in notifications if users_ids]
+        if notifications:
+            create_and_assign_notifications.delay(self.section, self.message_body, {}, notifications,
+                                                  self.action_path)
+        if digests:
+            send_digest_emails.delay(self.message_body, {}, digests)
+        return len(notifications), len(digests)
+
+    def run(self):
+        notifications_number = digests_number = 0
+        for companies_ids in self.get_companies_ids_chunks():
+            chunk_notifications_number, chunk_digests_number = self.process_chunk(companies_ids)
+            notifications_number += chunk_notifications_number
+            digests_number += chunk_digests_number
+        logger.info(f'{self.__class__.__name__}: {notifications_number} notifications created, '
+                    f'{digests_number} digest emails scheduled.')
+
+
+class SurchargesExpirationDigest(ExpirationDigest):
+    section = Notification.SURCHARGES
+    action_path = Notification.SURCHARGE
+    message_body = ugettext_noop('Surcharges are about to expire. '
+                                 'Please, extend its expiration rate or create a new one with the updated costs.')
+    setting_field = 'surcharge_expiration'
+    path = 'surcharge'
+
+    def get_items(self, companies_ids, dates):
+        surcharges = list(Surcharge.objects.filter(
+            company_id__in=companies_ids,
+            temporary=False,
+            is_archived=False,
+            expiration_date__in=dates,
+        ).values('id', 'company_id', 'expiration_date', 'direction', location_code=F('location__code'),
+                 carrier_title=F('carrier__title')))
+        for surcharge in surcharges:
+            surcharge['description'] = f'{surcharge["carrier_title"]}, {surcharge["location_code"]} ' \
+                                       f'{surcharge["direction"]}, {surcharge["expiration_date"]}'
+        return surcharges
+
+
+class FreightRatesExpirationDigest(ExpirationDigest):
+    section = Notification.FREIGHT_RATES
+    action_path = Notification.FREIGHT_RATE
+    message_body = ugettext_noop('Rates are about to expire.'
+                                 'Please, extend its expiration rate or create a new one with the updated costs.')
+    setting_field = 'freight_rate_expiration'
+    path = 'rate'
+
+    def get_items(self, companies_ids, dates):
+        freight_rates = list(FreightRate.objects.filter(
+            company_id__in=companies_ids,
+            is_active=True,
+            temporary=False,
+            is_archived=False,
+            rates__expiration_date__in=dates,
+        ).values('id', 'company_id', expiration_date=F('rates__expiration_date'), origin_code=F('origin__code'),
+                 destination_code=F('destination__code'), carrier_title=F('carrier__title')).distinct())
+        for freight_rate in freight_rates:
+            freight_rate['description'] = f'{freight_rate["carrier_title"]}, {freight_rate["origin_code"]} - ' \
+                                          f'{freight_rate["destination_code"]}, {freight_rate["expiration_date"]}'
+        return freight_rates
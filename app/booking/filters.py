@@ -5,13 +5,15 @@ from django.db.models import Q
 
 from app.booking.models import FreightRate, Surcharge, Quote, Booking, TrackStatus
 from app.core.models import Company
+from app.handling.filters import SearchMatchFilter
+from app.handling.search import PortSearch, CarrierSearch, CompanySearch
 
 
 class SurchargeFilterSet(django_filters.FilterSet):
     shipping_type = django_filters.CharFilter(field_name='shipping_mode__shipping_type__title')
     shipping_mode = django_filters.CharFilter(field_name='shipping_mode__title', lookup_expr='icontains')
-    carrier = django_filters.CharFilter(field_name='carrier__title', lookup_expr='icontains')
-    location = django_filters.CharFilter(field_name='location__code', lookup_expr='icontains')
+    carrier = SearchMatchFilter(CarrierSearch, field_name='carrier')
+    location = SearchMatchFilter(PortSearch, field_name='location')
 
     class Meta:
         model = Surcharge
@@ -30,9 +32,9 @@ class FreightRateFilterSet(django_filters.FilterSet):
     direction = django_filters.CharFilter(label='Import or Export')
     shipping_type = django_filters.CharFilter(field_name='shipping_mode__shipping_type__title')
     shipping_mode = django_filters.CharFilter(field_name='shipping_mode__title', lookup_expr='icontains')
-    carrier = django_filters.CharFilter(field_name='carrier__title', lookup_expr='icontains')
-    origin = django_filters.CharFilter(field_name='origin__code', lookup_expr='icontains')
-    destination = django_filters.CharFilter(field_name='destination__code', lookup_expr='icontains')
+    carrier = SearchMatchFilter(CarrierSearch, field_name='carrier')
+    origin = SearchMatchFilter(PortSearch, field_name='origin')
+    destination = SearchMatchFilter(PortSearch, field_name='destination')
 
     class Meta:
         model = FreightRate
@@ -49,8 +51,8 @@ class FreightRateFilterSet(django_filters.FilterSet):
 class QuoteFilterSet(django_filters.FilterSet):
     shipping_type = django_filters.CharFilter(field_name='shipping_mode__shipping_type__title')
     shipping_mode = django_filters.CharFilter(field_name='shipping_mode__title', lookup_expr='icontains')
-    origin = django_filters.CharFilter(field_name='origin__code', lookup_expr='icontains')
-    destination = django_filters.CharFilter(field_name='destination__code', lookup_expr='icontains')
+    origin = SearchMatchFilter(PortSearch, field_name='origin')
+    destination = SearchMatchFilter(PortSearch, field_name='destination')
     route = django_filters.CharFilter(method='route_filter', label='Route filter')
 
     class Meta:
@@ -64,7 +66,8 @@ class QuoteFilterSet(django_filters.FilterSet):
         )
 
     def route_filter(self, queryset, _, value):
-        return queryset.filter(Q(origin__code__icontains=value) | Q(destination__code__icontains=value))
+        ports_ids = PortSearch(value).get_ids()
+        return queryset.filter(Q(origin__in=ports_ids) | Q(destination__in=ports_ids))
 
 
 class QuoteOrderingFilterBackend(filters.BaseFilterBackend):
@@ -92,7 +95,7 @@ class QuoteOrderingFilterBackend(filters.BaseFilterBackend):
 class BookingFilterSet(django_filters.FilterSet):
     shipping_type = django_filters.CharFilter(field_name='freight_rate__shipping_mode__shipping_type__title')
     route = django_filters.CharFilter(method='route_filter', label='Route filter')
-    client = django_filters.CharFilter(field_name='client_contact_person__companies__name', lookup_expr='icontains')
+    client = SearchMatchFilter(CompanySearch, field_name='client_contact_person__companies')
 
     class Meta:
         model = Booking
@@ -103,9 +106,8 @@ class BookingFilterSet(django_filters.FilterSet):
         )
 
     def route_filter(self, queryset, _, value):
-        return queryset.filter(
-            Q(freight_rate__origin__code__icontains=value) | Q(freight_rate__destination__code__icontains=value)
-        ).distinct()
+        ports_ids = PortSearch(value).get_ids()
+        return queryset.filter(Q(freight_rate__origin__in=ports_ids) | Q(freight_rate__destination__in=ports_ids))
 
 
 class BookingOrderingFilterBackend(filters.BaseFilterBackend):
@@ -134,7 +136,7 @@ class OperationFilterSet(django_filters.FilterSet):
     shipping_type = django_filters.CharFilter(field_name='freight_rate__shipping_mode__shipping_type__title')
     my_operations = django_filters.BooleanFilter(method='my_operations_filter', label='My Operations')
     aceid = django_filters.CharFilter(field_name='aceid', lookup_expr='icontains')
-    carrier = django_filters.CharFilter(field_name='freight_rate__carrier__title', lookup_expr='icontains')
+    carrier = SearchMatchFilter(CarrierSearch, field_name='freight_rate__carrier')
     status = django_filters.CharFilter(method='status_filter', label='Operation statuses')
     route = django_filters.CharFilter(method='route_filter', label='Route filter')
 
@@ -149,9 +151,8 @@ class OperationFilterSet(django_filters.FilterSet):
         )
 
     def route_filter(self, queryset, _, value):
-        return queryset.filter(
-            Q(freight_rate__origin__code__icontains=value) | Q(freight_rate__destination__code__icontains=value)
-        ).distinct()
+        ports_ids = PortSearch(value).get_ids()
+        return queryset.filter(Q(freight_rate__origin__in=ports_ids) | Q(freight_rate__destination__in=ports_ids))
 
     def my_operations_filter(self, queryset, _, value):
         if value:
@@ -0,0 +1,98 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def get_offers(offer_model, freight_rates):
+    offers = []
+    for freight_rate in freight_rates:
+        for rate in freight_rate.rates.all():
+            if rate.start_date is None or rate.expiration_date is None:
+                continue
+            for surcharge in rate.surcharges.all():
+                start_date = max(rate.start_date, surcharge.start_date)
+                expiration_date = min(rate.expiration_date, surcharge.expiration_date)
+                if start_date > expiration_date:
+                    continue
+                charges = [charge for charge in surcharge.charges.all() if charge.charge is not None]
+                usage_fee_container_types = {usage_fee.container_type_id for usage_fee in surcharge.usage_fees.all()
+                                             if usage_fee.charge is not None and usage_fee.container_type_id}
+                offers.append(offer_model(
+                    freight_rate_id=freight_rate.id,
+                    rate_id=rate.id,
+                    surcharge_id=surcharge.id,
+                    company_id=freight_rate.company_id,
+                    carrier_id=freight_rate.carrier_id,
+                    shipping_mode_id=freight_rate.shipping_mode_id,
+                    origin_id=freight_rate.origin_id,
+                    destination_id=freight_rate.destination_id,
+                    container_type_id=rate.container_type_id,
+                    start_date=start_date,
+                    expiration_date=expiration_date,
+                    has_rate=rate.rate is not None,
+                    has_dangerous=any(charge.additional_surcharge.is_dangerous for charge in charges),
+                    has_cold=any(charge.additional_surcharge.is_cold for charge in charges),
+                    usage_fee_container_types=sorted(usage_fee_container_types),
+                ))
+    return offers
+
+
+def build_searchable_offers(apps, schema_editor):
+    FreightRate = apps.get_model('booking', 'FreightRate')
+    SearchableOffer = apps.get_model('booking', 'SearchableOffer')
+
+    freight_rate_ids = list(FreightRate.objects.filter(
+        is_active=True,
+        temporary=False,
+        is_archived=False,
+    ).order_by('id').values_list('id', flat=True))
+    for index in range(0, len(freight_rate_ids), 500):
+        freight_rates = FreightRate.objects.filter(id__in=freight_rate_ids[index:index + 500]).prefetch_related(
+            'rates__surcharges__charges__additional_surcharge',
+            'rates__surcharges__usage_fees',
+        )
+        SearchableOffer.objects.bulk_create(get_offers(SearchableOffer, freight_rates), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_merge_20210726_1913'),
+        ('handling', '0051_merge_0050_auto_20210426_1640_0050_auto_20210515_0840'),
+        ('booking', '0085_merge_20210726_1913'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchableOffer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(verbose_name='Offer start date')),
+                ('expiration_date', models.DateField(verbose_name='Offer expiration date')),
+                ('has_rate', models.BooleanField(default=False, verbose_name='Rate amount is set')),
+                ('has_dangerous', models.BooleanField(default=False, verbose_name='Surcharge has dangerous charge')),
+                ('has_cold', models.BooleanField(default=False, verbose_name='Surcharge has cold charge')),
+                ('usage_fee_container_types', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None, verbose_name='Container types covered by usage fees')),
+                ('carrier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='handling.carrier')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='core.company')),
+                ('container_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='handling.containertype')),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='destination_searchable_offers', to='handling.port')),
+                ('freight_rate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='booking.freightrate')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='origin_searchable_offers', to='handling.port')),
+                ('rate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='booking.rate')),
+                ('shipping_mode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='handling.shippingmode')),
+                ('surcharge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='searchable_offers', to='booking.surcharge')),
+            ],
+            options={
+                'verbose_name': 'Searchable offer',
+                'verbose_name_plural': 'Searchable offers',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchableoffer',
+            index=models.Index(fields=['origin', 'destination', 'shipping_mode', 'start_date', 'expiration_date'], name='booking_offer_route_idx'),
+        ),
+        migrations.RunPython(build_searchable_offers, migrations.RunPython.noop),
+    ]
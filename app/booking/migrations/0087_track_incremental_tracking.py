@@ -0,0 +1,43 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0086_searchableoffer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='track',
+            name='data_etag',
+            field=models.CharField(max_length=256, null=True, verbose_name='ETag of json data from tracking api'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='data_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='Hash of json data from tracking api'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='next_poll_date',
+            field=models.DateTimeField(null=True, verbose_name='Date of the next tracking api poll'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='processed_events',
+            field=models.JSONField(default=dict, verbose_name='Number of processed events per container'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='route_etag',
+            field=models.CharField(max_length=256, null=True, verbose_name='ETag of json route data from tracking api'),
+        ),
+        migrations.AddField(
+            model_name='track',
+            name='route_hash',
+            field=models.CharField(max_length=64, null=True, verbose_name='Hash of json route data from tracking api'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+import django.contrib.postgres.fields.ranges
+import django.contrib.postgres.indexes
+from django.db import migrations
+from django.db.models import F, Func, Value
+
+
+def fill_validity_ranges(apps, schema_editor):
+    for model_name in ('Surcharge', 'Rate'):
+        model = apps.get_model('booking', model_name)
+        model.objects.filter(start_date__isnull=False, expiration_date__isnull=False).update(
+            validity=Func(F('start_date'), F('expiration_date'), Value('[]'), function='daterange',
+                          output_field=django.contrib.postgres.fields.ranges.DateRangeField()),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0087_track_incremental_tracking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='surcharge',
+            name='validity',
+            field=django.contrib.postgres.fields.ranges.DateRangeField(editable=False, null=True, verbose_name='Surcharge validity period'),
+        ),
+        migrations.AddField(
+            model_name='rate',
+            name='validity',
+            field=django.contrib.postgres.fields.ranges.DateRangeField(editable=False, null=True, verbose_name='Rate validity period'),
+        ),
+        migrations.RunPython(fill_validity_ranges, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='surcharge',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['validity'], name='booking_surcharge_validity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rate',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['validity'], name='booking_rate_validity_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0088_validity_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='date_created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Date the transaction created'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='txid',
+            field=models.CharField(db_index=True, max_length=35, verbose_name='Transaction identifier'),
+        ),
+    ]
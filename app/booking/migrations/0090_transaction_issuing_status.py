@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0089_transaction_date_created'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=models.CharField(choices=[('issuing', 'Transaction issuing'), ('opened', 'Transaction opened'), ('finished', 'Transaction finished'), ('canceled', 'Transaction canceled'), ('expired', 'Transaction expired'), ('failed', 'Transaction failed')], default='opened', max_length=20, verbose_name='Transaction status'),
+        ),
+    ]
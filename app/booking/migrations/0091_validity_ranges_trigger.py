@@ -0,0 +1,65 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations
+
+SET_VALIDITY_FUNCTION = '''
+CREATE OR REPLACE FUNCTION booking_set_validity() RETURNS trigger AS $$
+BEGIN
+    IF NEW.start_date IS NULL OR NEW.expiration_date IS NULL THEN
+        NEW.validity := NULL;
+    ELSE
+        NEW.validity := daterange(NEW.start_date, NEW.expiration_date, '[]');
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+'''
+
+CREATE_TRIGGER = '''
+DROP TRIGGER IF EXISTS {table}_validity_trigger ON {table};
+CREATE TRIGGER {table}_validity_trigger BEFORE INSERT OR UPDATE ON {table}
+FOR EACH ROW EXECUTE PROCEDURE booking_set_validity();
+'''
+
+DROP_TRIGGER = 'DROP TRIGGER IF EXISTS {table}_validity_trigger ON {table};'
+
+FILL_VALIDITY = '''
+UPDATE {table} SET validity = CASE
+    WHEN start_date IS NULL OR expiration_date IS NULL THEN NULL
+    ELSE daterange(start_date, expiration_date, '[]')
+END
+WHERE validity IS DISTINCT FROM CASE
+    WHEN start_date IS NULL OR expiration_date IS NULL THEN NULL
+    ELSE daterange(start_date, expiration_date, '[]')
+END;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0090_transaction_issuing_status'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            SET_VALIDITY_FUNCTION,
+            'DROP FUNCTION IF EXISTS booking_set_validity();',
+        ),
+        migrations.RunSQL(
+            CREATE_TRIGGER.format(table='booking_surcharge'),
+            DROP_TRIGGER.format(table='booking_surcharge'),
+        ),
+        migrations.RunSQL(
+            CREATE_TRIGGER.format(table='booking_rate'),
+            DROP_TRIGGER.format(table='booking_rate'),
+        ),
+        migrations.RunSQL(
+            FILL_VALIDITY.format(table='booking_surcharge'),
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            FILL_VALIDITY.format(table='booking_rate'),
+            migrations.RunSQL.noop,
+        ),
+    ]
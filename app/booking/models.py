@@ -1,13 +1,38 @@
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField, DateRangeField
+from django.contrib.postgres.indexes import GistIndex
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext as __
+from psycopg2.extras import DateRange
 
 
-class Surcharge(models.Model):
+def get_validity_range(start_date, expiration_date):
+    """
+    Returns inclusive date range of validity period, None if the period is not set.
+    """
+
+    if start_date is None or expiration_date is None:
+        return None
+    return DateRange(start_date, expiration_date, '[]')
+
+
+class ValidityRangeMixin:
+    """
+    Class, that provides validity range field value of the instance in sync with start and expiration
+    dates on save. The column itself is set by a database trigger, so queryset updates and bulk
+    creates keep it in sync too.
+    """
+
+    def save(self, *args, **kwargs):
+        self.validity = get_validity_range(self.start_date, self.expiration_date)
+        super().save(*args, **kwargs)
+
+
+class Surcharge(ValidityRangeMixin, models.Model):
     """
     Surcharges model.
     """
@@ -41,6 +66,11 @@ class Surcharge(models.Model):
     expiration_date = models.DateField(
         _('Surcharge expiration date'),
     )
+    validity = DateRangeField(
+        _('Surcharge validity period'),
+        null=True,
+        editable=False,
+    )
     temporary = models.BooleanField(
         _('Temporary surcharge or not'),
         default=False,
@@ -80,6 +110,9 @@ class Surcharge(models.Model):
                         expiration_date=self.expiration_date)
 
     class Meta:
+        indexes = [
+            GistIndex(fields=['validity'], name='booking_surcharge_validity_idx'),
+        ]
         verbose_name = _("Surcharge")
         verbose_name_plural = _("Surcharges")
 
@@ -295,7 +328,7 @@ class FreightRate(models.Model):
         verbose_name_plural = _("Freight rates")
 
 
-class Rate(models.Model):
+class Rate(ValidityRangeMixin, models.Model):
     """
     Model for concrete amount of freight rate.
     """
@@ -319,6 +352,11 @@ class Rate(models.Model):
         _('Rate expiration date'),
         null=True,
     )
+    validity = DateRangeField(
+        _('Rate validity period'),
+        null=True,
+        editable=False,
+    )
     updated_by = models.ForeignKey(
         get_user_model(),
         on_delete=models.SET_NULL,
@@ -344,6 +382,9 @@ class Rate(models.Model):
     )
 
     class Meta:
+        indexes = [
+            GistIndex(fields=['validity'], name='booking_rate_validity_idx'),
+        ]
         verbose_name = _("Rate")
         verbose_name_plural = _("Rates")
 
@@ -895,20 +936,25 @@ class Transaction(models.Model):
     Transaction model.
     """
 
+    ISSUING = 'issuing'
     OPENED = 'opened'
     FINISHED = 'finished'
     CANCELED = 'canceled'
     EXPIRED = 'expired'
+    FAILED = 'failed'
     STATUS_CHOICES = (
+        (ISSUING, 'Transaction issuing'),
         (OPENED, 'Transaction opened'),
         (FINISHED, 'Transaction finished'),
         (CANCELED, 'Transaction canceled'),
         (EXPIRED, 'Transaction expired'),
+        (FAILED, 'Transaction failed'),
     )
 
     txid = models.CharField(
         _('Transaction identifier'),
         max_length=35,
+        db_index=True,
     )
     status = models.CharField(
         _('Transaction status'),
@@ -937,6 +983,10 @@ class Transaction(models.Model):
         _('Response from getting payment'),
         null=True,
     )
+    date_created = models.DateTimeField(
+        _('Date the transaction created'),
+        auto_now_add=True,
+    )
 
     def __str__(self):
         return __('{id}').format(id=self.id)
@@ -997,6 +1047,34 @@ class Track(models.Model):
         related_name='tracking',
         null=True,
     )
+    data_hash = models.CharField(
+        _('Hash of json data from tracking api'),
+        max_length=64,
+        null=True,
+    )
+    route_hash = models.CharField(
+        _('Hash of json route data from tracking api'),
+        max_length=64,
+        null=True,
+    )
+    data_etag = models.CharField(
+        _('ETag of json data from tracking api'),
+        max_length=256,
+        null=True,
+    )
+    route_etag = models.CharField(
+        _('ETag of json route data from tracking api'),
+        max_length=256,
+        null=True,
+    )
+    processed_events = models.JSONField(
+        _('Number of processed events per container'),
+        default=dict,
+    )
+    next_poll_date = models.DateTimeField(
+        _('Date of the next tracking api poll'),
+        null=True,
+    )
 
     class Meta:
         ordering = ('-date_created',)
@@ -1064,3 +1142,92 @@ class Direction(models.Model):
     class Meta:
         verbose_name = _("Direction")
         verbose_name_plural = _("Directions")
+
+
+class SearchableOffer(models.Model):
+    """
+    Denormalized freight rate offer, one row per rate and valid surcharge, used by freight rate search.
+    """
+
+    freight_rate = models.ForeignKey(
+        'FreightRate',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    rate = models.ForeignKey(
+        'Rate',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    surcharge = models.ForeignKey(
+        'Surcharge',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    company = models.ForeignKey(
+        'core.Company',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    carrier = models.ForeignKey(
+        'handling.Carrier',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    shipping_mode = models.ForeignKey(
+        'handling.ShippingMode',
+        on_delete=models.CASCADE,
+        related_name='searchable_offers',
+    )
+    origin = models.ForeignKey(
+        'handling.Port',
+        on_delete=models.CASCADE,
+        related_name='origin_searchable_offers',
+    )
+    destination = models.ForeignKey(
+        'handling.Port',
+        on_delete=models.CASCADE,
+        related_name='destination_searchable_offers',
+    )
+    container_type = models.ForeignKey(
+        'handling.ContainerType',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='searchable_offers',
+    )
+    start_date = models.DateField(
+        _('Offer start date'),
+    )
+    expiration_date = models.DateField(
+        _('Offer expiration date'),
+    )
+    has_rate = models.BooleanField(
+        _('Rate amount is set'),
+        default=False,
+    )
+    has_dangerous = models.BooleanField(
+        _('Surcharge has dangerous charge'),
+        default=False,
+    )
+    has_cold = models.BooleanField(
+        _('Surcharge has cold charge'),
+        default=False,
+    )
+    usage_fee_container_types = ArrayField(
+        models.IntegerField(),
+        default=list,
+        verbose_name=_('Container types covered by usage fees'),
+    )
+
+    def __str__(self):
+        return f'{self.freight_rate_id}: {self.start_date} - {self.expiration_date}'
+
+    class Meta:
+        verbose_name = _("Searchable offer")
+        verbose_name_plural = _("Searchable offers")
+        indexes = [
+            models.Index(
+                fields=['origin', 'destination', 'shipping_mode', 'start_date', 'expiration_date'],
+                name='booking_offer_route_idx',
+            ),
+        ]
@@ -0,0 +1,115 @@
+from django.db import transaction
+
+from app.booking.models import FreightRate, Rate, SearchableOffer
+
+
+def build_searchable_offers(freight_rates):
+    offers = []
+    freight_rates = freight_rates.filter(
+        is_active=True,
+        temporary=False,
+        is_archived=False,
+    ).prefetch_related(
+        'rates__surcharges__charges__additional_surcharge',
+        'rates__surcharges__usage_fees',
+    )
+    for freight_rate in freight_rates:
+        for rate in freight_rate.rates.all():
+            if rate.start_date is None or rate.expiration_date is None:
+                continue
+            for surcharge in rate.surcharges.all():
+                start_date = max(rate.start_date, surcharge.start_date)
+                expiration_date = min(rate.expiration_date, surcharge.expiration_date)
+                if start_date > expiration_date:
+                    continue
+                charges = [charge for charge in surcharge.charges.all() if charge.charge is not None]
+                usage_fee_container_types = {usage_fee.container_type_id for usage_fee in surcharge.usage_fees.all()
+                                             if usage_fee.charge is not None and usage_fee.container_type_id}
+                offers.append(SearchableOffer(
+                    freight_rate_id=freight_rate.id,
+                    rate_id=rate.id,
+                    surcharge_id=surcharge.id,
+                    company_id=freight_rate.company_id,
+                    carrier_id=freight_rate.carrier_id,
+                    shipping_mode_id=freight_rate.shipping_mode_id,
+                    origin_id=freight_rate.origin_id,
+                    destination_id=freight_rate.destination_id,
+                    container_type_id=rate.container_type_id,
+                    start_date=start_date,
+                    expiration_date=expiration_date,
+                    has_rate=rate.rate is not None,
+                    has_dangerous=any(charge.additional_surcharge.is_dangerous for charge in charges),
+                    has_cold=any(charge.additional_surcharge.is_cold for charge in charges),
+                    usage_fee_container_types=sorted(usage_fee_container_types),
+                ))
+    return offers
+
+
+def refresh_searchable_offers(freight_rate_ids):
+    freight_rate_ids = set(freight_rate_ids)
+    if not freight_rate_ids:
+        return
+    with transaction.atomic():
+        SearchableOffer.objects.filter(freight_rate_id__in=freight_rate_ids).delete()
+        offers = build_searchable_offers(FreightRate.objects.filter(id__in=freight_rate_ids))
+        SearchableOffer.objects.bulk_create(offers, batch_size=1000)
+
+
+def get_surcharges_freight_rate_ids(surcharge_ids):
+    return Rate.objects.filter(surcharges__id__in=surcharge_ids).values_list('freight_rate_id', flat=True)
+
+
+class SearchableOffersRefresh:
+    """
+    Class, that provides one refresh of searchable offers per transaction. Freight rates and surcharges
+    changed in the transaction are collected and their offers are rebuilt once on commit, freight rates
+    of surcharges are looked up at that time in one query.
+    """
+
+    def __init__(self):
+        self.freight_rate_ids = set()
+        self.surcharge_ids = set()
+
+    def add(self, freight_rate_ids=(), surcharge_ids=()):
+        self.freight_rate_ids.update(freight_rate_id for freight_rate_id in freight_rate_ids if freight_rate_id)
+        self.surcharge_ids.update(surcharge_id for surcharge_id in surcharge_ids if surcharge_id)
+
+    def is_empty(self):
+        return not self.freight_rate_ids and not self.surcharge_ids
+
+    def is_pending(self, connection):
+        return any(callback[1] is self for callback in connection.run_on_commit)
+
+    def __call__(self):
+        freight_rate_ids = set(self.freight_rate_ids)
+        if self.surcharge_ids:
+            freight_rate_ids.update(get_surcharges_freight_rate_ids(self.surcharge_ids))
+        refresh_searchable_offers(freight_rate_ids)
+
+
+def schedule_searchable_offers_refresh(freight_rate_ids=(), surcharge_ids=()):
+    """
+    Adds freight rates and surcharges to the refresh of the current transaction, the refresh is registered
+    on commit once, a new one is started if the previous was run or discarded by a rollback.
+    """
+
+    connection = transaction.get_connection()
+    refresh = getattr(connection, 'searchable_offers_refresh', None)
+    if connection.in_atomic_block and refresh is not None and refresh.is_pending(connection):
+        refresh.add(freight_rate_ids, surcharge_ids)
+        return
+
+    refresh = SearchableOffersRefresh()
+    refresh.add(freight_rate_ids, surcharge_ids)
+    if refresh.is_empty():
+        return
+    connection.searchable_offers_refresh = refresh if connection.in_atomic_block else None
+    transaction.on_commit(refresh)
+
+
+def rebuild_searchable_offers(chunk_size=500):
+    SearchableOffer.objects.all().delete()
+    freight_rate_ids = list(FreightRate.objects.order_by('id').values_list('id', flat=True))
+    for index in range(0, len(freight_rate_ids), chunk_size):
+        refresh_searchable_offers(freight_rate_ids[index:index + chunk_size])
+    return SearchableOffer.objects.count()
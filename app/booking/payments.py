@@ -0,0 +1,312 @@
+import datetime
+import logging
+from decimal import Decimal, InvalidOperation
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from app.booking.models import Booking, Transaction
+from app.core.models import BankAccount
+from app.core.utils import get_random_string
+from app.core.util.payment import PixApiClient, PixApiError, PixApiUnavailable
+from app.websockets.models import Notification
+from app.websockets.tasks import create_and_assign_notification, send_email, group_send_many
+from config import settings
+
+logger = logging.getLogger("acemaven.task.logging")
+
+PIX_COMPLETED_STATUS = 'CONCLUIDA'
+PIX_CHARGE_EXPIRATION = datetime.timedelta(seconds=259200)
+RECONCILIATION_CHUNK_SIZE = 100
+STUCK_ISSUING_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+def get_pix_settings():
+    bank_account = BankAccount.objects.filter(is_default=True, is_platforms=True).select_related('pix_api').first()
+    return getattr(bank_account, 'pix_api', None) if bank_account else None
+
+
+def get_webhook_txids(data):
+    """
+    Returns txids of payments of a Pix webhook payload.
+    """
+
+    if not isinstance(data, dict) or not isinstance(data.get('pix'), list):
+        return []
+    return list({pix['txid'] for pix in data['pix'] if isinstance(pix, dict) and pix.get('txid')})
+
+
+def is_charge_paid(charge, response):
+    if not isinstance(response, dict) or response.get('status') != PIX_COMPLETED_STATUS:
+        return False
+    try:
+        return any(Decimal(pix['valor']) == charge for pix in response.get('pix') or [])
+    except (KeyError, TypeError, InvalidOperation):
+        return False
+
+
+def get_payment_status(booking_id):
+    """
+    Returns payment state of booking with its last transaction, used by the status endpoint
+    and pushed to the client over the notification websocket.
+    """
+
+    booking = Booking.objects.filter(id=booking_id).values('id', 'aceid', 'is_paid', 'status').first()
+    if not booking:
+        return None
+    return {
+        'booking_id': booking['id'],
+        'aceid': booking['aceid'],
+        'is_paid': booking['is_paid'],
+        'status': booking['status'],
+        'transaction': Transaction.objects.filter(booking_id=booking_id).order_by('-id').values(
+            'txid', 'status', 'charge', 'qr_code',
+        ).first(),
+    }
+
+
+def push_payment_status(booking_id, user_id):
+    payment_status = get_payment_status(booking_id)
+    if payment_status and (pix_transaction := payment_status['transaction']):
+        pix_transaction['charge'] = str(pix_transaction['charge'])
+        group_send_many([(f'{user_id}', {
+            'type': 'notify',
+            'data': {'command': 'booking_payment', **payment_status},
+        })])
+
+
+def create_charge_transaction(booking, charge):
+    """
+    Saves transaction of booking fee payment and schedules issuing of its charge in the bank api
+    after commit, so the booking request does not wait for the bank.
+    """
+
+    from app.booking.tasks import issue_pix_charge
+
+    pix_transaction = Transaction.objects.create(
+        txid=get_random_string(34),
+        booking=booking,
+        charge=charge,
+        status=Transaction.ISSUING,
+    )
+    transaction.on_commit(lambda: issue_pix_charge.delay(pix_transaction.id))
+    return pix_transaction
+
+
+def issue_charge(transaction_id):
+    """
+    Creates charge of the issuing transaction in the bank api and opens the transaction with its qr code.
+    Charge of a previous attempt, whose response was lost, is taken from the bank api.
+    """
+
+    pix_transaction = Transaction.objects.filter(id=transaction_id, status=Transaction.ISSUING) \
+        .select_related('booking').first()
+    if not pix_transaction:
+        return False
+    pix_settings = get_pix_settings()
+    if not pix_settings:
+        raise PixApiError('Platform bank account has no pix api settings.')
+
+    client = PixApiClient(pix_settings)
+    try:
+        qr_code = client.create_charge(pix_transaction.txid, pix_transaction.charge)
+    except PixApiUnavailable:
+        raise
+    except PixApiError:
+        response, status_code = client.review_charge(pix_transaction.txid)
+        if status_code != 200 or not isinstance(response, dict) or not response.get('textoImagemQRcode'):
+            raise
+        qr_code = response['textoImagemQRcode']
+
+    Transaction.objects.filter(id=transaction_id, status=Transaction.ISSUING).update(
+        qr_code=qr_code,
+        status=Transaction.OPENED,
+    )
+    logger.info(f'Pix charge of transaction [{pix_transaction.txid}] issued.')
+    push_payment_status(pix_transaction.booking_id, pix_transaction.booking.client_contact_person_id)
+    return True
+
+
+def fail_charge_issue(transaction_id):
+    pix_transaction = Transaction.objects.filter(id=transaction_id, status=Transaction.ISSUING) \
+        .select_related('booking').first()
+    if not pix_transaction:
+        return
+    Transaction.objects.filter(id=transaction_id, status=Transaction.ISSUING).update(status=Transaction.FAILED)
+    logger.warning(f'Pix charge of transaction [{pix_transaction.txid}] has not been issued.')
+    booking = pix_transaction.booking
+    push_payment_status(booking.id, booking.client_contact_person_id)
+    create_and_assign_notification.delay(
+        Notification.REQUESTS,
+        'Some issues occurred during payment process on booking number {aceid}, please contact support or retry.',
+        {'aceid': booking.aceid},
+        [booking.client_contact_person_id, ],
+        Notification.OPERATION,
+        object_id=booking.id,
+    )
+
+
+def get_stuck_transactions_ids():
+    return list(Transaction.objects.filter(
+        status=Transaction.ISSUING,
+        date_created__lt=timezone.now() - STUCK_ISSUING_TIMEOUT,
+    ).values_list('id', flat=True))
+
+
+def notify_about_payment(booking):
+    client_contact_person_id = booking.client_contact_person_id
+
+    text_body = 'Payment on booking number {aceid} is success'
+    text_params = {'aceid': booking.aceid}
+    create_and_assign_notification.delay(
+        Notification.REQUESTS,
+        text_body,
+        text_params,
+        [client_contact_person_id, ],
+        Notification.OPERATION,
+        booking.id,
+    )
+    send_email.delay(text_body, text_params, [client_contact_person_id, ],
+                     object_id=f'{settings.DOMAIN_ADDRESS}operations/{booking.id}')
+
+    agent_text_body = 'A new booking request {aceid} has been received.'
+    agent_text_params = {'aceid': booking.aceid}
+    ff_company = booking.freight_rate.company
+    users_ids = list(
+        ff_company.users.filter(role__groups__name__in=('master', 'agent')).values_list('id', flat=True)
+    )
+    create_and_assign_notification.delay(
+        Notification.REQUESTS,
+        agent_text_body,
+        agent_text_params,
+        users_ids,
+        Notification.BOOKING,
+        object_id=booking.id,
+    )
+    send_email.delay(agent_text_body, agent_text_params, users_ids,
+                     object_id=f'{settings.DOMAIN_ADDRESS}requests/booking/{booking.id}')
+
+    client_text_body = 'The booking request {aceid} has been sent to "{name}".'
+    client_text_params = {'aceid': booking.aceid, 'name': ff_company.name}
+    create_and_assign_notification.delay(
+        Notification.REQUESTS,
+        client_text_body,
+        client_text_params,
+        [client_contact_person_id, ],
+        Notification.OPERATION,
+        object_id=booking.id,
+    )
+    send_email.delay(client_text_body, client_text_params, [client_contact_person_id, ],
+                     object_id=f'{settings.DOMAIN_ADDRESS}operations/{booking.id}')
+
+
+def confirm_payment(transaction_id):
+    """
+    Marks booking of the opened transaction paid, returns False if the transaction was already processed,
+    so a payment reported by both the webhook and the sweep is confirmed once.
+    """
+
+    with transaction.atomic():
+        pix_transaction = Transaction.objects.select_for_update().filter(
+            id=transaction_id,
+            status=Transaction.OPENED,
+        ).select_related('booking').first()
+        if not pix_transaction or not pix_transaction.booking:
+            return False
+        booking = pix_transaction.booking
+        booking.is_paid = True
+        booking.status = Booking.REQUEST_RECEIVED
+        booking.save()
+        booking.transactions.filter(status=Transaction.OPENED).update(status=Transaction.FINISHED)
+        transaction.on_commit(lambda: notify_about_payment(booking))
+    logger.info(f'Payment of transaction [{pix_transaction.txid}] on booking [{booking.id}] confirmed.')
+    return True
+
+
+def reconcile_transactions(transactions):
+    """
+    Checks opened transactions of queryset in the bank api and confirms paid ones, returns number
+    of confirmed payments, ids of transactions the bank api reported unpaid and ids of transactions
+    it failed to review. The sweep stops when the bank api is unavailable.
+    """
+
+    pix_settings = get_pix_settings()
+    if not pix_settings:
+        logger.warning('Pix reconciliation skipped, platform bank account has no pix api settings.')
+        return 0, [], []
+
+    client = PixApiClient(pix_settings)
+    confirmed = 0
+    unpaid_transactions_ids = []
+    failed_transactions_ids = []
+    last_id = 0
+    while True:
+        chunk = list(transactions.filter(status=Transaction.OPENED, id__gt=last_id).order_by('id')
+                     [:RECONCILIATION_CHUNK_SIZE])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        paid_transactions_ids = []
+        reviewed = []
+        for pix_transaction in chunk:
+            try:
+                response, status_code = client.review_charge(pix_transaction.txid)
+            except PixApiError as error:
+                logger.warning(f'Pix reconciliation stopped: {error}')
+                last_id = None
+                break
+            reviewed.append(pix_transaction)
+            pix_transaction.response = response
+            if status_code == 200 and is_charge_paid(pix_transaction.charge, response):
+                paid_transactions_ids.append(pix_transaction.id)
+            elif status_code == 200:
+                unpaid_transactions_ids.append(pix_transaction.id)
+            else:
+                failed_transactions_ids.append(pix_transaction.id)
+                logger.warning(f'Pix transaction [{pix_transaction.txid}] review failed with status {status_code}.')
+        Transaction.objects.bulk_update(reviewed, ['response'])
+        confirmed += sum(confirm_payment(transaction_id) for transaction_id in paid_transactions_ids)
+        if last_id is None:
+            break
+    return confirmed, unpaid_transactions_ids, failed_transactions_ids
+
+
+def notify_about_expired_charge(booking_id, aceid, client_contact_person_id, is_review_failed):
+    if is_review_failed:
+        text_body = 'Have some problems with payment on booking number {aceid}, please, contact support team.'
+    else:
+        text_body = 'Charge of booking number {aceid} has expired, please, issue a new one to pay the booking.'
+    text_params = {'aceid': aceid}
+    push_payment_status(booking_id, client_contact_person_id)
+    create_and_assign_notification.delay(
+        Notification.REQUESTS,
+        text_body,
+        text_params,
+        [client_contact_person_id, ],
+        Notification.BILLING,
+        booking_id,
+    )
+    send_email.delay(text_body, text_params, [client_contact_person_id, ],
+                     object_id=f'{settings.DOMAIN_ADDRESS}billing_pending/')
+
+
+def expire_transactions(unpaid_transactions_ids, failed_transactions_ids=()):
+    """
+    Expires old transactions among the ones reported unpaid by the bank api or failing to be reviewed
+    by it and notifies their clients. A transaction is kept opened until then, so a payment made just
+    before expiration is still confirmed, and a transaction failing review is not polled forever.
+    """
+
+    failed_transactions_ids = set(failed_transactions_ids)
+    with transaction.atomic():
+        expired_transactions = list(Transaction.objects.select_for_update(of=('self', )).filter(
+            id__in=[*unpaid_transactions_ids, *failed_transactions_ids],
+            status=Transaction.OPENED,
+            date_created__lt=timezone.now() - PIX_CHARGE_EXPIRATION,
+        ).values_list('id', 'booking_id', 'booking__aceid', 'booking__client_contact_person_id'))
+        Transaction.objects.filter(id__in=[row[0] for row in expired_transactions]).update(status=Transaction.EXPIRED)
+        for transaction_id, booking_id, aceid, client_contact_person_id in expired_transactions:
+            transaction.on_commit(partial(notify_about_expired_charge, booking_id, aceid, client_contact_person_id,
+                                          transaction_id in failed_transactions_ids))
+    return len(expired_transactions)
@@ -0,0 +1,180 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from app.booking.models import Rate, Charge, UsageFee
+from app.handling.models import ContainerType, PackagingType
+from app.handling.utils import get_platform_exchange_rates
+
+
+def wm_calculate(data, shipping_type=None):
+    if not shipping_type:
+        shipping_type = data.get('shipping_type')
+    weight_measurement = data.get('weight_measurement')
+    length_measurement = data.get('length_measurement')
+    weight = Decimal(data.get('weight'))
+    height = Decimal(data.get('height'))
+    length = Decimal(data.get('length'))
+    width = Decimal(data.get('width'))
+    volume = data.get('volume', 0)
+    if shipping_type == 'air':
+        gross_weight = weight if weight_measurement == 'kg' else weight * 1000
+        divider = 6000 if length_measurement == 'cm' else 0.006
+    else:
+        gross_weight = weight if weight_measurement == 't' else weight / 1000
+        divider = 1 if length_measurement == 'm' else 1000000
+    total_volume = height * length * width / Decimal(divider)
+    total_weight_per_pack = gross_weight if gross_weight > total_volume else total_volume
+    total_weight = total_weight_per_pack * volume
+    return round(total_weight_per_pack, 2), round(total_weight, 2)
+
+
+def batch_wm_calculate(cargo_groups, shipping_type):
+    """
+    Calculates weight-measure of all cargo groups once per search.
+    """
+
+    return [wm_calculate(cargo_group, shipping_type) for cargo_group in cargo_groups]
+
+
+def batch_charge_costs(charges, usage_fees, cargo_groups, cargo_groups_wm, shipping_mode):
+    """
+    Prices surcharge charges and usage fees for all cargo groups in one pass.
+    Returns list of (key, currency code, cost, subtotal) per cargo group in the order
+    calculate_additional_surcharges() adds them to totals.
+    Freight subtotals and per currency totals are still added per cargo group
+    by calculate_freight_rate() and apply_charge_costs().
+    """
+
+    volumes = [Decimal(group.get('volume')) for group in cargo_groups]
+    costs = [[] for _ in cargo_groups]
+    for charge in charges:
+        additional_surcharge = charge.additional_surcharge
+        if additional_surcharge.is_document or charge.charge is None:
+            continue
+        key = additional_surcharge.title.split()[0].lower()
+        code = charge.currency.code
+        for index, cargo_group in enumerate(cargo_groups):
+            if additional_surcharge.is_dangerous and not cargo_group.get('dangerous'):
+                continue
+            elif additional_surcharge.is_cold and not cargo_group.get('frozen'):
+                continue
+            cost_per_pack = charge.charge
+            if shipping_mode.is_need_volume:
+                if charge.conditions == Charge.WM:
+                    cost_per_pack = cargo_groups_wm[index][0] * charge.charge
+                elif charge.conditions == Charge.PER_WEIGHT:
+                    cost_per_pack = Decimal(cargo_group.get('weight')) * charge.charge
+            subtotal = cost_per_pack * volumes[index]
+            costs[index].append((key, code, float(cost_per_pack), float(subtotal)))
+
+    if shipping_mode.has_surcharge_containers:
+        key = 'usage_fee' if shipping_mode.is_need_volume else 'handling'
+        usage_fees_by_container_type = dict()
+        for usage_fee in usage_fees:
+            usage_fees_by_container_type.setdefault(usage_fee.container_type_id, usage_fee)
+        for index, cargo_group in enumerate(cargo_groups):
+            usage_fee = usage_fees_by_container_type.get(cargo_group.get('container_type'))
+            if usage_fee:
+                cost = float(usage_fee.charge)
+                subtotal = float(usage_fee.charge * volumes[index])
+                costs[index].append((key, usage_fee.currency.code, cost, subtotal))
+    return costs
+
+
+class PricingSnapshot:
+    """
+    Rates, surcharges, charges, usage fees, cargo types and platform exchange rates
+    of a set of freight rates, loaded with a fixed number of queries.
+    """
+
+    def __init__(self, freight_rates, cargo_groups, date_from, date_to):
+        freight_rate_ids = [freight_rate.id for freight_rate in freight_rates]
+
+        self.rates = defaultdict(list)
+        rates = Rate.objects.filter(freight_rate_id__in=freight_rate_ids).select_related('currency').order_by('id')
+        for rate in rates:
+            self.rates[rate.freight_rate_id].append(rate)
+
+        self.surcharges = dict()
+        rate_surcharges = Rate.surcharges.through.objects.filter(
+            rate_id__in=[rate.id for rate in rates],
+            surcharge__start_date__lte=date_from,
+            surcharge__expiration_date__gte=date_to,
+        ).select_related('surcharge').order_by('surcharge_id')
+        for rate_surcharge in rate_surcharges:
+            self.surcharges.setdefault(rate_surcharge.rate_id, rate_surcharge.surcharge)
+        surcharge_ids = {surcharge.id for surcharge in self.surcharges.values()}
+
+        self.charges = defaultdict(list)
+        charges = Charge.objects.filter(
+            surcharge_id__in=surcharge_ids,
+        ).select_related('currency', 'additional_surcharge').order_by('id')
+        for charge in charges:
+            self.charges[charge.surcharge_id].append(charge)
+
+        self.usage_fees = defaultdict(list)
+        usage_fees = UsageFee.objects.filter(surcharge_id__in=surcharge_ids).select_related('currency').order_by('id')
+        for usage_fee in usage_fees:
+            self.usage_fees[usage_fee.surcharge_id].append(usage_fee)
+
+        self.exchange_rates = get_platform_exchange_rates()
+
+        self.cargo_groups = cargo_groups
+        self.cargo_groups_wm = None
+        self.charge_costs = dict()
+
+        container_type_ids = {group.get('container_type') for group in cargo_groups if group.get('container_type')}
+        packaging_type_ids = {group.get('packaging_type') for group in cargo_groups if group.get('packaging_type')}
+        self.container_types = ContainerType.objects.in_bulk(container_type_ids) if container_type_ids else {}
+        self.packaging_types = PackagingType.objects.in_bulk(packaging_type_ids) if packaging_type_ids else {}
+
+    def get_rate(self, freight_rate, container_type=None, any_container_type=False):
+        for rate in self.rates[freight_rate.id]:
+            if any_container_type or rate.container_type_id == container_type:
+                return rate
+        return None
+
+    def get_surcharge(self, rate):
+        return self.surcharges.get(rate.id)
+
+    def get_charges(self, surcharge):
+        return self.charges[surcharge.id]
+
+    def get_document_charge(self, surcharge):
+        return next((charge for charge in self.charges[surcharge.id] if charge.additional_surcharge.is_document),
+                    None)
+
+    def get_exchange_rate(self, currency_code):
+        return self.exchange_rates.get(currency_code)
+
+    def get_cargo_type(self, container_type=None, packaging_type=None):
+        if container_type:
+            return self.container_types.get(container_type).code
+        return self.packaging_types.get(packaging_type).description
+
+    def get_expiration_date(self, freight_rate, container_type_ids_list=None):
+        dates = [rate.expiration_date for rate in self.rates[freight_rate.id]
+                 if rate.expiration_date and
+                 (container_type_ids_list is None or rate.container_type_id in container_type_ids_list)]
+        return min(dates) if dates else None
+
+    def get_cargo_groups_wm(self, shipping_type):
+        if self.cargo_groups_wm is None:
+            self.cargo_groups_wm = batch_wm_calculate(self.cargo_groups, shipping_type)
+        return self.cargo_groups_wm
+
+    def get_charge_costs(self, surcharge, shipping_mode):
+        """
+        Returns costs of surcharge for snapshot cargo groups, computed once per surcharge,
+        as surcharges are shared by many freight rates.
+        """
+
+        if surcharge.id not in self.charge_costs:
+            cargo_groups_wm = self.get_cargo_groups_wm(shipping_mode.shipping_type.title) \
+                if shipping_mode.is_need_volume else None
+            self.charge_costs[surcharge.id] = batch_charge_costs(self.get_charges(surcharge),
+                                                                 self.usage_fees[surcharge.id],
+                                                                 self.cargo_groups,
+                                                                 cargo_groups_wm,
+                                                                 shipping_mode)
+        return self.charge_costs[surcharge.id]
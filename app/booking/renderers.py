@@ -0,0 +1,31 @@
+import json
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Renders every object as a separate line of newline delimited json.
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class EventStreamRenderer(renderers.BaseRenderer):
+    """
+    Renders every object as a separate server-sent event.
+    """
+
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+    event = 'result'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f'event: {self.event}\ndata: {json.dumps(data, cls=JSONEncoder, ensure_ascii=False)}\n\n'
@@ -0,0 +1,228 @@
+import base64
+import binascii
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.booking.pricing import PricingSnapshot
+from app.booking.serializers import FreightRateSearchListSerializer
+from app.booking.utils import date_format, freight_rate_search, get_fees, calculate_freight_rate_charges
+from app.core.util.consts import AGE_1MINUTE
+from app.core.utils import get_average_companies_ratings
+from app.handling.models import ClientPlatformSetting, GeneralSetting
+from app.handling.utils import get_setting, get_main_country_code, get_main_currency_code, get_settings_version
+
+DEFAULT_PAGE_SIZE = 10
+
+SEARCH_CACHE_TIMEOUT = AGE_1MINUTE * 10
+SEARCH_CACHE_KEY = 'freight_rate_search:{version}:{digest}'
+SEARCH_CACHE_VERSION_KEY = 'freight_rate_search:version'
+SEARCH_CACHE_HITS_KEY = 'freight_rate_search:hits'
+SEARCH_CACHE_MISSES_KEY = 'freight_rate_search:misses'
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            'transit_time': None if position['transit_time'] is None else int(position['transit_time']),
+            'id': int(position['id']),
+            'served': int(position['served']),
+        }
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise serializers.ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def get_search_cache_version():
+    version = cache.get(SEARCH_CACHE_VERSION_KEY)
+    if version is None:
+        cache.add(SEARCH_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(SEARCH_CACHE_VERSION_KEY)
+    return version
+
+
+def invalidate_search_cache():
+    cache.set(SEARCH_CACHE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def increment_counter(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_search_cache_stats():
+    counters = cache.get_many((SEARCH_CACHE_HITS_KEY, SEARCH_CACHE_MISSES_KEY))
+    return {
+        'hits': counters.get(SEARCH_CACHE_HITS_KEY, 0),
+        'misses': counters.get(SEARCH_CACHE_MISSES_KEY, 0),
+    }
+
+
+def fee_to_criteria(fee):
+    return [fee.fee_type, fee.value_type, str(fee.value)] if fee else None
+
+
+class FreightRateSearch:
+    """
+    Class, that provides priced freight rate search results in transit time order,
+    either all at once, page by page or one by one for streaming.
+    """
+
+    def __init__(self, data, company):
+        self.criteria = json.loads(json.dumps(data, cls=JSONEncoder))
+        self.cargo_groups = data.get('cargo_groups')
+        self.container_type_ids_list = [group.get('container_type') for group in self.cargo_groups
+                                        if group.get('container_type')]
+        self.date_from = date_format(data.get('date_from'))
+        self.date_to = date_format(data.get('date_to'))
+        self.freight_rates, self.shipping_mode = freight_rate_search(data)
+
+        self.client_platform_settings = client_platform_settings = get_setting(ClientPlatformSetting)
+        self.number_of_results = client_platform_settings.number_of_results
+        self.calculate_fees = client_platform_settings.enable_booking_fee_payment
+        self.booking_fee, self.service_fee = get_fees(company, self.shipping_mode)
+        self.main_currency_code = get_main_currency_code()
+
+    def get_cache_key(self, *parts):
+        criteria = {
+            'search': self.criteria,
+            'booking_fee': fee_to_criteria(self.booking_fee),
+            'service_fee': fee_to_criteria(self.service_fee),
+            'calculate_fees': self.calculate_fees,
+            'number_of_results': self.number_of_results,
+            'main_currency_code': self.main_currency_code,
+            'settings_version': get_settings_version(),
+            'parts': parts,
+        }
+        digest = hashlib.sha256(json.dumps(criteria, sort_keys=True, cls=JSONEncoder).encode()).hexdigest()
+        return SEARCH_CACHE_KEY.format(version=get_search_cache_version(), digest=digest)
+
+    def get_cached(self, producer, *parts):
+        key = self.get_cache_key(*parts)
+        result = cache.get(key)
+        if result is not None:
+            increment_counter(SEARCH_CACHE_HITS_KEY)
+            return result
+        increment_counter(SEARCH_CACHE_MISSES_KEY)
+        result = producer()
+        cache.set(key, result, SEARCH_CACHE_TIMEOUT)
+        return result
+
+    def iterate_cached_results(self):
+        """
+        Yields cached results or prices them one by one, caching the whole list at the end.
+        """
+
+        key = self.get_cache_key('results')
+        results = cache.get(key)
+        if results is not None:
+            increment_counter(SEARCH_CACHE_HITS_KEY)
+            return iter(results)
+        increment_counter(SEARCH_CACHE_MISSES_KEY)
+        freight_rates = self.get_freight_rates()
+        return self._iterate_and_cache_results(key, freight_rates, self.load(freight_rates))
+
+    def _iterate_and_cache_results(self, key, freight_rates, context):
+        results = []
+        for result in self.iterate_results(freight_rates, context):
+            results.append(result)
+            yield result
+        cache.set(key, results, SEARCH_CACHE_TIMEOUT)
+
+    def get_freight_rates(self, position=None, limit=None):
+        freight_rates = self.freight_rates
+        if position:
+            transit_time, freight_rate_id = position['transit_time'], position['id']
+            if transit_time is None:
+                freight_rates = freight_rates.filter(transit_time__isnull=True, id__gt=freight_rate_id)
+            else:
+                freight_rates = freight_rates.filter(
+                    Q(transit_time__gt=transit_time) |
+                    Q(transit_time=transit_time, id__gt=freight_rate_id) |
+                    Q(transit_time__isnull=True)
+                )
+        freight_rates = freight_rates.order_by('transit_time', 'id').distinct().select_related(
+            'carrier',
+            'origin',
+            'destination',
+            'company',
+            'shipping_mode__shipping_type',
+        )
+        return list(freight_rates[:self.number_of_results if limit is None else limit])
+
+    def load(self, freight_rates):
+        """
+        Loads everything needed for pricing of freight rates, so results can be produced without queries,
+        which matters when they are streamed outside of the view under asgi.
+        """
+
+        return {
+            'pricing_snapshot': PricingSnapshot(freight_rates, self.cargo_groups, self.date_from, self.date_to),
+            'company_ratings': get_average_companies_ratings({freight_rate.company for freight_rate in freight_rates}),
+            'main_country_code': get_main_country_code(),
+            'client_platform_settings': self.client_platform_settings,
+            'general_settings': get_setting(GeneralSetting),
+        }
+
+    def price(self, freight_rate, context):
+        snapshot = context['pricing_snapshot']
+        freight_rate_dict = FreightRateSearchListSerializer(freight_rate, context=context).data
+        if self.container_type_ids_list:
+            expiration_date = snapshot.get_expiration_date(
+                freight_rate,
+                self.container_type_ids_list if self.shipping_mode.has_freight_containers else None,
+            ).strftime('%d/%m/%Y')
+            freight_rate_dict['expiration_date'] = expiration_date
+
+        return calculate_freight_rate_charges(freight_rate,
+                                              freight_rate_dict,
+                                              self.cargo_groups,
+                                              self.shipping_mode,
+                                              self.main_currency_code,
+                                              self.date_from,
+                                              self.date_to,
+                                              self.container_type_ids_list,
+                                              booking_fee=self.booking_fee,
+                                              service_fee=self.service_fee,
+                                              calculate_fees=self.calculate_fees,
+                                              snapshot=snapshot, )
+
+    def iterate_results(self, freight_rates, context):
+        for freight_rate in freight_rates:
+            yield self.price(freight_rate, context)
+
+    def get_results(self):
+        freight_rates = self.get_freight_rates()
+        return list(self.iterate_results(freight_rates, self.load(freight_rates)))
+
+    def get_page(self, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+        position = decode_cursor(cursor) if cursor else None
+        served = position['served'] if position else 0
+        limit = max(min(page_size, self.number_of_results - served), 0)
+        freight_rates = self.get_freight_rates(position, limit + 1) if limit else []
+        has_next = len(freight_rates) > limit
+        freight_rates = freight_rates[:limit]
+        next_cursor = None
+        if has_next and served + limit < self.number_of_results:
+            last_freight_rate = freight_rates[-1]
+            next_cursor = encode_cursor({
+                'transit_time': last_freight_rate.transit_time,
+                'id': last_freight_rate.id,
+                'served': served + limit,
+            })
+        return {
+            'next': next_cursor,
+            'results': list(self.iterate_results(freight_rates, self.load(freight_rates))),
+        }
@@ -5,33 +5,29 @@ from rest_framework import serializers
 
 from django.db import transaction
 from django.db.models import Min
-from django.db.utils import ProgrammingError
 from django.utils import timezone
 
 from app.booking.models import Surcharge, UsageFee, Charge, AdditionalSurcharge, FreightRate, Rate, CargoGroup, Quote, \
     Booking, Status, ShipmentDetails, CancellationReason, Track, TrackStatus, Transaction
-from app.booking.tasks import send_awb_number_to_air_tracking_api, check_payment
+from app.booking.payments import create_charge_transaction
+from app.booking.tasks import send_awb_number_to_air_tracking_api
 from app.booking.utils import rate_surcharges_filter, calculate_freight_rate_charges, get_fees, generate_aceid, \
-    create_message_for_track, get_shipping_type_titles, str_from_datetime
-from app.core.models import Shipper, BankAccount
+    create_message_for_track, get_shipping_type_titles, str_from_datetime, get_visible_tracking_date
+from app.core.models import Shipper
 from app.core.serializers import ShipperSerializer, BankAccountBaseSerializer
-from app.core.utils import get_average_company_rating, get_random_string
-from app.handling.models import ClientPlatformSetting, Currency, GeneralSetting, BillingExchangeRate, PixApiSetting
+from app.core.utils import get_average_company_rating
+from app.handling.models import ClientPlatformSetting, GeneralSetting, PixApiSetting
 from app.handling.serializers import ContainerTypesSerializer, CurrencySerializer, CarrierBaseSerializer, \
     PortSerializer, ShippingModeBaseSerializer, PackagingTypeBaseSerializer, ReleaseTypeSerializer
-from app.location.models import Country
+from app.handling.spatial import MAX_RADIUS_KM
+from app.handling.utils import get_billing_exchange_rates, get_setting, get_main_currency_code, \
+    get_main_country_code
 from app.websockets.models import Notification
 from app.websockets.tasks import create_chat_for_operation, send_email
 from app.websockets.tasks import create_and_assign_notification
 from config import settings
-from app.core.util.payment import get_qr_code
 from django.utils.translation import ugettext as _
 
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
-
 
 class UserUpdateMixin:
     """
@@ -62,7 +58,7 @@ class GetTrackingInitialMixin:
     def get_tracking_initial(self, obj):
         data = dict()
         data['shipping_type'] = obj.freight_rate.shipping_mode.shipping_type.title
-        data['direction'] = 'export' if obj.freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+        data['direction'] = 'export' if obj.freight_rate.origin.code.startswith(get_main_country_code()) else 'import'
         data['origin'] = obj.freight_rate.origin.get_lat_long_coordinates()
         data['destination'] = obj.freight_rate.destination.get_lat_long_coordinates()
         return data
@@ -312,18 +308,28 @@ class FreightRateSearchListSerializer(FreightRateListSerializer):
             'company',
         )
 
+    def get_expiration_date(self, obj):
+        snapshot = self.context.get('pricing_snapshot')
+        if snapshot is None:
+            return super().get_expiration_date(obj)
+        date = snapshot.get_expiration_date(obj)
+        return date.strftime('%d/%m/%Y') if date else None
+
     def get_carrier(self, obj):
-        hide_carrier_name = ClientPlatformSetting.load().hide_carrier_name
+        client_platform_settings = self.context.get('client_platform_settings') or get_setting(ClientPlatformSetting)
+        hide_carrier_name = client_platform_settings.hide_carrier_name
         return 'disclosed' if obj.carrier_disclosure or hide_carrier_name else obj.carrier.title
 
     def get_company(self, obj):
         company_data = dict()
-        general_settings = GeneralSetting.load()
+        general_settings = self.context.get('general_settings') or get_setting(GeneralSetting)
         show_freight_forwarder_name = general_settings.show_freight_forwarder_name
         name = obj.company.name if show_freight_forwarder_name == GeneralSetting.ALL else ''
         company_data['name'] = name
         company_data['id'] = obj.company.id
-        company_data['rating'] = get_average_company_rating(obj.company)
+        company_ratings = self.context.get('company_ratings')
+        company_data['rating'] = company_ratings.get(obj.company.id) if company_ratings is not None \
+            else get_average_company_rating(obj.company)
         return company_data
 
 
@@ -458,12 +464,18 @@ class FreightRateSearchSerializer(serializers.Serializer):
     shipping_mode = serializers.IntegerField()
     origin = serializers.IntegerField()
     destination = serializers.IntegerField()
+    origin_radius = serializers.FloatField(min_value=0, max_value=MAX_RADIUS_KM, required=False)
+    destination_radius = serializers.FloatField(min_value=0, max_value=MAX_RADIUS_KM, required=False)
     date_from = serializers.DateField()
     date_to = serializers.DateField()
     carrier = serializers.IntegerField(required=False)
     cargo_groups = CargoGroupSerializer(many=True)
 
 
+class FreightRateSearchPageSerializer(serializers.Serializer):
+    page_size = serializers.IntegerField(min_value=1)
+
+
 class OperationRecalculateSerializer(serializers.Serializer):
     number_of_documents = serializers.IntegerField(min_value=1, required=False)
     cargo_groups = CargoGroupWithIdSerializer(many=True)
@@ -630,7 +642,7 @@ class BookingSerializer(serializers.ModelSerializer):
         if not existing_shipper:
             shipper = validated_data.pop('shipper', {})
             shipper['company'] = company
-            shipper['is_partner'] = False if validated_data['freight_rate'].origin.code.startswith(MAIN_COUNTRY_CODE) \
+            shipper['is_partner'] = False if validated_data['freight_rate'].origin.code.startswith(get_main_country_code()) \
                 else True
             existing_shipper = Shipper.objects.create(**shipper)
 
@@ -638,7 +650,7 @@ class BookingSerializer(serializers.ModelSerializer):
         cargo_groups = validated_data.pop('cargo_groups', [])
 
         changed_cargo_groups = CargoGroupSerializer(cargo_groups, many=True).data
-        main_currency_code = Currency.objects.filter(is_main=True).first().code
+        main_currency_code = get_main_currency_code()
         container_type_ids_list = [
             group.get('container_type') for group in changed_cargo_groups if group.get('container_type')
         ]
@@ -646,7 +658,7 @@ class BookingSerializer(serializers.ModelSerializer):
         freight_rate_dict = FreightRateSearchListSerializer(freight_rate).data
         booking_fee, service_fee = get_fees(company, freight_rate.shipping_mode)
         number_of_documents = validated_data.get('number_of_documents')
-        calculate_fees = ClientPlatformSetting.load().enable_booking_fee_payment
+        calculate_fees = get_setting(ClientPlatformSetting).enable_booking_fee_payment
         try:
             with transaction.atomic():
                 if container_type_ids_list:
@@ -679,6 +691,8 @@ class BookingSerializer(serializers.ModelSerializer):
                 cargo_groups = [{**item, **{'booking': booking}} for item in cargo_groups]
                 new_cargo_groups = [CargoGroup(**fields) for fields in cargo_groups]
                 CargoGroup.objects.bulk_create(new_cargo_groups)
+                if not booking.is_paid:
+                    create_charge_transaction(booking, pay_to_book)
         except Exception as error:
             raise serializers.ValidationError({'error': error})
         if booking.is_paid:
@@ -715,19 +729,6 @@ class BookingSerializer(serializers.ModelSerializer):
             send_email.delay(text_body, text_params, [user.id, ],
                              object_id=f'{settings.DOMAIN_ADDRESS}operations/{booking.id}')
         else:
-            bank_account = BankAccount.objects.filter(is_default=True, is_platforms=True).first()
-            pix_settings = bank_account.pix_api
-            txid = get_random_string(34)
-            qr_code = get_qr_code(amount=pay_to_book, txid=txid, pix_key=pix_settings.bank_account.pix_key,
-                                  qr_cob_uri=pix_settings.qr_cob_uri, developer_key=pix_settings.developer_key,
-                                  token_uri=pix_settings.token_uri, client_id=pix_settings.client_id,
-                                  client_secret=pix_settings.client_secret, basic_token=pix_settings.basic_token)
-            Transaction.objects.create(txid=txid, booking=booking, charge=pay_to_book, qr_code=qr_code)
-            check_payment.delay(txid=txid, booking_id=booking.id, token_uri=pix_settings.token_uri,
-                                client_id=pix_settings.client_id, client_secret=pix_settings.client_secret,
-                                basic_token=pix_settings.basic_token, base_url=pix_settings.base_url,
-                                developer_key=pix_settings.developer_key, )
-
             users_ids = list(
                 company.users.filter(role__groups__name__in=('master', 'billing')).values_list('id', flat=True)
             )
@@ -852,7 +853,7 @@ class ShipmentDetailsBaseSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         user = self.context['request'].user
         booking = instance.booking
-        direction = 'export' if booking.freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+        direction = 'export' if booking.freight_rate.origin.code.startswith(get_main_country_code()) else 'import'
 
         departure_track_exists = Track.objects.filter(
             manual=True,
@@ -1070,7 +1071,7 @@ class TrackSerializer(serializers.ModelSerializer):
 
         status = validated_data['status']
         booking = validated_data['booking']
-        direction = 'export' if booking.freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+        direction = 'export' if booking.freight_rate.origin.code.startswith(get_main_country_code()) else 'import'
         shipment_details = booking.shipment_details.first()
 
         if status.must_update_actual_date_of_departure:
@@ -1219,7 +1220,7 @@ class OperationSerializer(serializers.ModelSerializer):
         cargo_groups = validated_data.pop('cargo_groups', [])
         changed_cargo_groups = CargoGroupSerializer(cargo_groups, many=True).data
         number_of_documents = validated_data.get('number_of_documents')
-        main_currency_code = Currency.objects.filter(is_main=True).first().code
+        main_currency_code = get_main_currency_code()
         container_type_ids_list = [
             group.get('container_type') for group in changed_cargo_groups if group.get('container_type')
         ]
@@ -1328,9 +1329,22 @@ class OperationListBaseSerializer(GetTrackingInitialMixin, OperationSerializer):
             'client_contact_person',
         )
 
+    def get_contact_person_company(self, user):
+        if hasattr(user, 'ordered_companies'):
+            return next(iter(user.ordered_companies), None)
+        return user.get_company()
+
+    def get_first_shipment_details(self, obj):
+        return next(iter(obj.shipment_details.all()), None)
+
+    def get_visible_tracking(self, obj):
+        if hasattr(obj, 'visible_tracking'):
+            return obj.visible_tracking
+        return obj.tracking.filter(date_created__lt=get_visible_tracking_date())
+
     def get_agent(self, obj):
         if obj.agent_contact_person:
-            return obj.agent_contact_person.get_company().name
+            return self.get_contact_person_company(obj.agent_contact_person).name
         else:
             return None
 
@@ -1339,7 +1353,7 @@ class OperationListBaseSerializer(GetTrackingInitialMixin, OperationSerializer):
             return next(filter(lambda x: x[0] == obj.status, Booking.STATUS_CHOICES), Booking.STATUS_CHOICES[0])[1]
         elif obj.payment_due_by:
             return 'Awaiting Payment'
-        elif (shipment_details := obj.shipment_details.first()) and shipment_details.actual_date_of_departure:
+        elif (shipment_details := self.get_first_shipment_details(obj)) and shipment_details.actual_date_of_departure:
             return 'Shipment in progress'
         elif (change_request_status := obj.change_request_status) and change_request_status != Booking.CHANGE_CONFIRMED and obj.status != Booking.CANCELED_BY_AGENT:
             return next(filter(lambda x: x[0] == change_request_status, Booking.CHANGE_REQUESTED_CHOICES),
@@ -1361,10 +1375,7 @@ class OperationListClientSerializer(OperationListBaseSerializer):
         fields = OperationListBaseSerializer.Meta.fields
 
     def get_tracking(self, obj):
-        serializer = TrackRetrieveSerializer(
-            obj.tracking.filter(date_created__lt=timezone.localtime() - datetime.timedelta(minutes=5)),
-            many=True
-        )
+        serializer = TrackRetrieveSerializer(self.get_visible_tracking(obj), many=True)
         return serializer.data
 
 
@@ -1372,7 +1383,7 @@ class OperationRetrieveSerializer(OperationListBaseSerializer):
     release_type = ReleaseTypeSerializer()
     week_range = serializers.SerializerMethodField()
     client_contact_person = serializers.CharField(source='client_contact_person.get_full_name')
-    client = serializers.CharField(source='client_contact_person.get_company.name')
+    client = serializers.SerializerMethodField()
     charges_today = serializers.SerializerMethodField()
     shipper = ShipperSerializer()
     change_requests = serializers.SerializerMethodField()
@@ -1394,6 +1405,9 @@ class OperationRetrieveSerializer(OperationListBaseSerializer):
         serializer = OperationRetrieveSerializer(obj.change_requests.all(), many=True)
         return serializer.data
 
+    def get_client(self, obj):
+        return self.get_contact_person_company(obj.client_contact_person).name
+
     def get_week_range(self, obj):
         return {
             'week_from': obj.date_from.isocalendar()[1],
@@ -1403,17 +1417,17 @@ class OperationRetrieveSerializer(OperationListBaseSerializer):
     def get_charges_today(self, obj):
         result = dict()
         if obj.agent_contact_person:
-            company = obj.agent_contact_person.get_company()
+            company = self.get_contact_person_company(obj.agent_contact_person)
             totals = obj.charges.get('totals')
-            billing_exchange_rate = BillingExchangeRate.objects.filter(company=company).last()
-            if billing_exchange_rate:
-                main_currency_code = Currency.objects.filter(is_main=True).first().code
+            billing_exchange_rates = get_billing_exchange_rates(company)
+            if billing_exchange_rates is not None:
+                main_currency_code = get_main_currency_code()
                 total_today = 0
                 result['today_exchange_rate'] = {}
                 for key, value in totals.items():
                     rate_today = 1
                     if key != main_currency_code:
-                        rate = billing_exchange_rate.rates.filter(currency__code=key).first()
+                        rate = billing_exchange_rates.get(key)
                         rate_today = round(float(rate.rate) * (1 + float(rate.spread) / 100), 2)
                         result[f'{key} exchange rate'] = rate_today
                         today_exchange_rate = {key: rate_today}
@@ -1430,7 +1444,10 @@ class OperationRetrieveSerializer(OperationListBaseSerializer):
             user = context['request'].user
             chat = obj.chat if hasattr(obj, 'chat') else None
             if chat:
-                user_chat_permissions = user.chat_permissions.filter(chat=chat).first()
+                if hasattr(chat, 'request_user_permissions'):
+                    user_chat_permissions = next(iter(chat.request_user_permissions), None)
+                else:
+                    user_chat_permissions = user.chat_permissions.filter(chat=chat).first()
                 data['chat'] = chat.id
                 data['has_perm_to_read'] = user_chat_permissions.has_perm_to_read if user_chat_permissions else False
                 data['has_perm_to_write'] = user_chat_permissions.has_perm_to_write if user_chat_permissions else False
@@ -1451,7 +1468,11 @@ class OperationRetrieveClientSerializer(OperationRetrieveSerializer):
 
     def get_agent_bank_account(self, obj):
         if obj.agent_contact_person:
-            bank_account = obj.agent_contact_person.get_company().bank_accounts.filter(is_default=True).first()
+            company = self.get_contact_person_company(obj.agent_contact_person)
+            if hasattr(company, 'default_bank_accounts'):
+                bank_account = next(iter(company.default_bank_accounts), None)
+            else:
+                bank_account = company.bank_accounts.filter(is_default=True).first()
             if bank_account:
                 return BankAccountBaseSerializer(bank_account).data
         return {}
@@ -1460,10 +1481,7 @@ class OperationRetrieveClientSerializer(OperationRetrieveSerializer):
         return True if hasattr(obj, 'review') else False
 
     def get_tracking(self, obj):
-        serializer = TrackRetrieveSerializer(
-            obj.tracking.filter(date_created__lt=timezone.localtime() - datetime.timedelta(minutes=5)),
-            many=True
-        )
+        serializer = TrackRetrieveSerializer(self.get_visible_tracking(obj), many=True)
         return serializer.data
 
 
@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from app.booking.models import FreightRate, Rate, Surcharge, Charge, UsageFee
+from app.booking.offers import schedule_searchable_offers_refresh, get_surcharges_freight_rate_ids
+from app.booking.search import invalidate_search_cache
+from app.handling.models import ExchangeRate, GlobalFee, LocalFee
+
+
+# Searchable offers signals
+@receiver(post_save, sender=FreightRate)
+@receiver(post_delete, sender=FreightRate)
+def refresh_freight_rate_offers(sender, instance, *args, **kwargs):
+    schedule_searchable_offers_refresh([instance.id])
+
+
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+def refresh_rate_offers(sender, instance, *args, **kwargs):
+    schedule_searchable_offers_refresh([instance.freight_rate_id])
+
+
+@receiver(post_save, sender=Surcharge)
+def refresh_surcharge_offers(sender, instance, *args, **kwargs):
+    schedule_searchable_offers_refresh(surcharge_ids=[instance.id])
+
+
+@receiver(pre_delete, sender=Surcharge)
+def refresh_deleted_surcharge_offers(sender, instance, *args, **kwargs):
+    schedule_searchable_offers_refresh(list(get_surcharges_freight_rate_ids([instance.id])))
+
+
+@receiver(post_save, sender=Charge)
+@receiver(post_delete, sender=Charge)
+@receiver(post_save, sender=UsageFee)
+@receiver(post_delete, sender=UsageFee)
+def refresh_surcharge_fees_offers(sender, instance, *args, **kwargs):
+    schedule_searchable_offers_refresh(surcharge_ids=[instance.surcharge_id])
+
+
+@receiver(m2m_changed, sender=Rate.surcharges.through)
+def refresh_rate_surcharges_offers(sender, instance, action, reverse, pk_set, *args, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        schedule_searchable_offers_refresh([instance.freight_rate_id])
+    elif action == 'pre_clear':
+        schedule_searchable_offers_refresh(list(get_surcharges_freight_rate_ids([instance.id])))
+    elif action == 'post_add':
+        schedule_searchable_offers_refresh(surcharge_ids=[instance.id])
+    else:
+        schedule_searchable_offers_refresh(
+            list(Rate.objects.filter(id__in=pk_set).values_list('freight_rate_id', flat=True))
+        )
+
+
+# Freight rate search cache signals
+@receiver(post_save, sender=FreightRate)
+@receiver(post_delete, sender=FreightRate)
+@receiver(post_save, sender=Rate)
+@receiver(post_delete, sender=Rate)
+@receiver(post_save, sender=Surcharge)
+@receiver(post_delete, sender=Surcharge)
+@receiver(post_save, sender=Charge)
+@receiver(post_delete, sender=Charge)
+@receiver(post_save, sender=UsageFee)
+@receiver(post_delete, sender=UsageFee)
+@receiver(m2m_changed, sender=Rate.surcharges.through)
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+@receiver(post_save, sender=GlobalFee)
+@receiver(post_delete, sender=GlobalFee)
+@receiver(post_save, sender=LocalFee)
+@receiver(post_delete, sender=LocalFee)
+def invalidate_freight_rate_search_cache(sender, *args, **kwargs):
+    transaction.on_commit(invalidate_search_cache)
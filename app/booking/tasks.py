@@ -1,128 +1,63 @@
 import datetime
 import logging
-from decimal import Decimal
 
 import requests
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils.timezone import now
 
 from app.core.models import Company
 from config import settings
 from config.celery import celery_app
-from django.db.models import Q, Case, When, Value, CharField
-from django.db.utils import ProgrammingError
+from django.db.models import Q, Case, When, Value, CharField, Prefetch
 from django.utils import timezone
 
-from app.booking.models import Quote, Booking, Track, CancellationReason, Surcharge, FreightRate, ShipmentDetails, \
+from app.booking.models import Quote, Booking, Track, CancellationReason, ShipmentDetails, \
     Transaction
+from app.booking.expiration import SurchargesExpirationDigest, FreightRatesExpirationDigest
+from app.booking.tracking import SeaTrackingClient, SeaTrackingReference, get_payload_hash, get_next_poll_date
 from app.booking.utils import sea_event_codes
 from app.handling.models import ClientPlatformSetting, AirTrackingSetting, SeaTrackingSetting, GeneralSetting
-from app.location.models import Country
+from app.handling.utils import get_main_country_code
 from app.websockets.tasks import create_and_assign_notification, send_email
 from app.websockets.models import Notification
-from app.core.util.payment import review_payment, change_amount
+from app.booking.payments import reconcile_transactions, expire_transactions, get_pix_settings, issue_charge, \
+    fail_charge_issue, get_stuck_transactions_ids
+from app.core.util.payment import PixApiClient, PixApiError
 from django.utils.translation import ugettext as _
 
 logger = logging.getLogger("acemaven.task.logging")
 
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
-
 
 @celery_app.task(name='check_payment')
-def check_payment(txid, base_url, developer_key, booking_id, token_uri, client_id, client_secret, basic_token, ):
-    response, status_code = review_payment(base_url, developer_key, txid, token_uri, client_id, client_secret,
-                                           basic_token)
-    Transaction.objects.filter(txid=txid).update(response=response)
+def check_payment(txid, *args, **kwargs):
+    reconcile_transactions(Transaction.objects.filter(txid=txid))
 
-    if isinstance(response, dict):
-        booking = Booking.objects.filter(id=booking_id).first()
-        if status_code == 200:
-            if 'pix' in response.keys() and response['status'] == 'CONCLUIDA':
-                check_charge = Decimal(response['pix'][0]['valor']) == Transaction.objects.filter(
-                    booking=booking_id).values_list('charge', flat=True).first()
-                if check_charge:
-                    booking.is_paid = True
-                    booking.status = Booking.REQUEST_RECEIVED
-                    booking.save()
-                    booking.transactions.filter(status=Transaction.OPENED).update(status=Transaction.FINISHED)
-
-                    client_contact_person_id = booking.client_contact_person_id
-                    client_contact_person_email = booking.client_contact_person.email
-
-                    text_body = 'Payment on booking number {aceid} is success'
-                    text_params = {'aceid':booking.aceid}
-                    create_and_assign_notification.delay(
-                        Notification.REQUESTS,
-                        text_body,
-                        text_params,
-                        [client_contact_person_id, ],
-                        Notification.OPERATION,
-                        booking_id,
-                    )
-                    send_email.delay(text_body, text_params, [client_contact_person_id, ],
-                                     object_id=f'{settings.DOMAIN_ADDRESS}operations/{booking.id}')
-
-                    agent_text_body = 'A new booking request {aceid} has been received.'
-                    agent_text_params = {'aceid':booking.aceid}
-                    ff_company = booking.freight_rate.company
-                    users_ids = list(
-                        ff_company.users.filter(role__groups__name__in=('master', 'agent')).values_list('id', flat=True)
-                    )
-                    create_and_assign_notification.delay(
-                        Notification.REQUESTS,
-                        agent_text_body,
-                        agent_text_params,
-                        users_ids,
-                        Notification.BOOKING,
-                        object_id=booking.id,
-                    )
-
-                    send_email.delay(agent_text_body, agent_text_params, users_ids,
-                                     object_id=f'{settings.DOMAIN_ADDRESS}requests/booking/{booking.id}')
-
-                    client_text_body = 'The booking request {aceid} has been sent to "{name}".'
-                    client_text_params = {'aceid':booking.aceid, 'name':ff_company.name}
-                    create_and_assign_notification.delay(
-                        Notification.REQUESTS,
-                        client_text_body,
-                        client_text_params,
-                        [client_contact_person_id, ],
-                        Notification.OPERATION,
-                        object_id=booking.id,
-                    )
-                    send_email.delay(client_text_body, client_text_params, [client_contact_person_id, ],
-                                     object_id=f'{settings.DOMAIN_ADDRESS}operations/{booking.id}')
-                    print("Payment success")
-
-                else:
-                    print("Charge not match")
-                    check_payment.apply_async((txid, base_url, developer_key, booking_id, token_uri,
-                                               client_id, client_secret, basic_token,),
-                                              eta=now() + datetime.timedelta(seconds=7200),
-                                              expires=259200)
-            else:
-                print("No pix/status in response")
-                check_payment.apply_async((txid, base_url, developer_key, booking_id, token_uri,
-                                           client_id, client_secret, basic_token,),
-                                          eta=now() + datetime.timedelta(days=1),
-                                          expires=259200)
-        else:
-            user_id = booking.client_contact_person_id
-            text_body = 'Have some problems with payment on booking number {aceid}, please, contact support team.'
-            text_params = {'aceid':booking.aceid}
 
-            create_and_assign_notification.delay(
-                Notification.REQUESTS,
-                text_body,
-                text_params,
-                [user_id, ],
-                Notification.BILLING,
-                booking_id,
-            )
-            send_email.delay(text_body, text_params, [user_id, ], object_id=f'{settings.DOMAIN_ADDRESS}billing_pending/')
+@celery_app.task(name='reconcile_pix_transactions')
+def reconcile_pix_transactions(txids):
+    confirmed = reconcile_transactions(Transaction.objects.filter(txid__in=txids))[0]
+    logger.info(f'Pix webhook reconciliation: {confirmed} of {len(txids)} payments confirmed.')
+
+
+@celery_app.task(name='issue_pix_charge', bind=True, max_retries=settings.PIX_CHARGE_ISSUE_RETRIES)
+def issue_pix_charge(self, transaction_id):
+    try:
+        issue_charge(transaction_id)
+    except PixApiError as error:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=error, countdown=settings.PIX_CHARGE_ISSUE_RETRY_DELAY * 2 ** self.request.retries)
+        fail_charge_issue(transaction_id)
+
+
+@celery_app.task(name='reconcile_pix_payments')
+def reconcile_pix_payments():
+    for transaction_id in get_stuck_transactions_ids():
+        issue_pix_charge.delay(transaction_id)
+    transactions = Transaction.objects.filter(booking__is_paid=False, booking__status=Booking.PENDING)
+    confirmed, unpaid_transactions_ids, failed_transactions_ids = reconcile_transactions(transactions)
+    expired = expire_transactions(unpaid_transactions_ids, failed_transactions_ids)
+    logger.info(f'Pix reconciliation sweep: {confirmed} payments confirmed, {expired} transactions expired.')
 
 
 @celery_app.task(name='test')
@@ -133,10 +68,11 @@ def test():
 
 
 @celery_app.task(name='change_charge')
-def change_charge(base_url, new_amount, developer_key, txid, is_prod, booking_id, token_uri, client_id, client_secret,
-                  basic_token):
-    response, status_code = change_amount(base_url, new_amount, developer_key, txid, is_prod, token_uri, client_id,
-                                          client_secret, basic_token)
+def change_charge(new_amount, txid, booking_id, *args, **kwargs):
+    try:
+        response, status_code = PixApiClient(get_pix_settings()).change_charge_amount(txid, new_amount)
+    except PixApiError as error:
+        response, status_code = str(error), None
     Transaction.objects.filter(txid=txid).update(response=response)
 
     booking = Booking.objects.filter(id=booking_id).first()
@@ -208,7 +144,7 @@ def daily_cancel_unconfirmed_agent_bookings():
     queryset = Booking.objects.filter(
         status=Booking.ACCEPTED,
     ).annotate(
-        direction=Case(When(freight_rate__origin__code__startswith=MAIN_COUNTRY_CODE, then=Value('export')),
+        direction=Case(When(freight_rate__origin__code__startswith=get_main_country_code(), then=Value('export')),
                        default=Value('import'),
                        output_field=CharField(),
                        )
@@ -272,224 +208,200 @@ def send_awb_number_to_air_tracking_api(booking_number, booking_id, agent_contac
     logger.info(_(f'Response text for airway bill number [{booking_number}] - {response.text}'))
 
 
+def notify_operation_users_on_commit(operation, section, text_body, text_params):
+    """
+    Notifies agent and client of operation once the transaction is committed, so notifications
+    about changes rolled back are not sent and are sent once when the changes are applied again.
+    """
+
+    users_ids = [operation.agent_contact_person_id, operation.client_contact_person_id, ]
+
+    def notify():
+        create_and_assign_notification.delay(
+            section,
+            text_body,
+            text_params,
+            users_ids,
+            Notification.OPERATION,
+            object_id=operation.id,
+        )
+        send_email.delay(text_body, text_params, users_ids,
+                         object_id=f'{settings.DOMAIN_ADDRESS}operations/{operation.id}')
+
+    transaction.on_commit(notify)
+
+
+def process_sea_tracking(operation, data_json, main_country_code, processed_events):
+    """
+    Applies sea tracking data to the operation: replaces event codes, locations and vessels,
+    updates actual dates of departure and arrival and notifies users about them on commit.
+    Only events after already processed ones are checked for departure and arrival,
+    returns new numbers of processed events per container.
+    """
+
+    direction = 'export' if operation.freight_rate.origin.code.startswith(main_country_code) else 'import'
+    shipment_details = next(iter(operation.shipment_details.all()), None)
+    new_processed_events = dict()
+
+    if 'containers' in data_json['data']:
+        for container_index, container in enumerate(data_json['data']['containers']):
+            container_key = str(container.get('number') or container_index)
+            first_new_event = processed_events.get(container_key, 0)
+            new_processed_events[container_key] = len(container['events'])
+            for event_index, event in enumerate(container['events']):
+                status = event.get('status', 'UNK')
+                event['status'] = sea_event_codes.get(status)
+                is_new_event = event_index >= first_new_event
+                if is_new_event and status == 'VAD' and not operation.vessel_arrived:
+                    operation.vessel_arrived = True
+                    operation.save()
+                if is_new_event and status == 'VDL' and not shipment_details.actual_date_of_departure:
+                    shipment_details.actual_date_of_departure = timezone.localtime()
+                    shipment_details.save()
+                    if direction == 'import':
+                        text_body = 'The shipment {aceid} has departed from {origin}.'
+                        text_params = {'aceid':operation.aceid, 'origin':operation.freight_rate.origin.code}
+
+                        notify_operation_users_on_commit(operation, Notification.OPERATIONS_IMPORT, text_body,
+                                                         text_params)
+
+                event['location'] = next(
+                    filter(lambda x: x.get('id') == event['location'], data_json['data'].get('locations')), {}
+                ).get('name', '')
+                event['vessel'] = next(
+                    filter(lambda x: x.get('id') == event['vessel'], data_json['data'].get('vessels')), {}
+                ).get('name', '')
+
+    if 'route' in data_json['data']:
+        date = data_json['data']['route'].get('postpod', {}).get('date')
+        if date and not shipment_details.actual_date_of_arrival:
+            shipment_details.actual_date_of_arrival = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
+            shipment_details.save()
+            if direction == 'export':
+                text_body = 'The shipment {aceid} has arrived at {destination}.'
+                text_params = {'aceid':operation.aceid, 'destination':operation.freight_rate.destination.code}
+
+                notify_operation_users_on_commit(operation, Notification.OPERATIONS_EXPORT, text_body, text_params)
+    return new_processed_events
+
+
+def notify_about_sea_tracking_error(operation, data_json):
+    if data_json.get('message') == 'WRONG_NUMBER':
+        text_body = 'The shipment {aceid} cannot be tracked because of wrong booking number.'
+        text_params = {'aceid':operation.aceid}
+
+        create_and_assign_notification.delay(
+            Notification.OPERATIONS,
+            text_body,
+            text_params,
+            [operation.agent_contact_person_id, ],
+            Notification.OPERATION,
+            object_id=operation.id,
+        )
+        send_email.delay(text_body, text_params, [operation.agent_contact_person_id, ],
+                         object_id=f'{settings.DOMAIN_ADDRESS}operations/{operation.id}')
+    else:
+        logger.warning(f'Sea tracking of operation [{operation.id}] failed: {data_json.get("message")}')
+
+
 @celery_app.task(name='track_sea_operations')
 def track_confirmed_sea_operations():
     logger.info(_(f'Starting to get track statuses for confirmed operations'))
-    settings = SeaTrackingSetting.load()
-    url = settings.url
-    api_key = settings.api_key
-    operations = Booking.objects.filter(
+    sea_tracking_settings = SeaTrackingSetting.load()
+    main_country_code = get_main_country_code()
+    now_date = timezone.localtime()
+    operations = {operation.id: operation for operation in Booking.objects.filter(
         status=Booking.CONFIRMED,
         freight_rate__shipping_mode__shipping_type__title='sea',
         automatic_tracking=True,
         vessel_arrived=False,
         original_booking__isnull=True,
-    )
-    for operation in operations:
-        direction = 'export' if operation.freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
-        booking_number = operation.shipment_details.first().booking_number
-        scac = operation.freight_rate.carrier.scac
-        base_url = f'?type=BK&number={booking_number}&sealine={scac}&api_key={api_key}'
-        data_url = f'{url}reference{base_url}'
-        route_url = f'{url}route{base_url}'
-
-        data_response = requests.get(data_url)
-        data_json = data_response.json() if (data_status_code := data_response.status_code) == 200 \
-            else {
-            'status': 'error',
-            'message': f'Status code - {data_status_code}',
-        }
-
-        if data_json.get('status') == 'error':
-            if (message := data_json.get('message')) == 'WRONG_NUMBER':
-                text_body = 'The shipment {aceid} cannot be tracked because of wrong booking number.'
-                text_params = {'aceid':operation.aceid}
-
-                create_and_assign_notification.delay(
-                    Notification.OPERATIONS,
-                    text_body,
-                    text_params,
-                    [operation.agent_contact_person_id, ],
-                    Notification.OPERATION,
-                    object_id=operation.id,
-                )
-                send_email.delay(text_body, text_params, [operation.agent_contact_person_id, ],
-                                 object_id=f'{settings.DOMAIN_ADDRESS}operations/{operation.id}')
-
+    ).select_related(
+        'freight_rate__origin',
+        'freight_rate__destination',
+        'freight_rate__carrier',
+    ).prefetch_related(
+        Prefetch('shipment_details', queryset=ShipmentDetails.objects.order_by('id')),
+    )}
+    tracks = dict()
+    for track in Track.objects.filter(manual=False, booking__in=operations.keys()).order_by('id'):
+        tracks.setdefault(track.booking_id, track)
+
+    references = dict()
+    for operation in operations.values():
+        shipment_details = next(iter(operation.shipment_details.all()), None)
+        track = tracks.get(operation.id)
+        if not shipment_details or (track and track.next_poll_date and track.next_poll_date > now_date):
+            continue
+        references[operation.id] = SeaTrackingReference(
+            shipment_details.booking_number,
+            operation.freight_rate.carrier.scac,
+            track.data_etag if track else None,
+            track.route_etag if track else None,
+        )
 
+    new_tracks, changed_tracks, unchanged_tracks = [], [], []
+    client = SeaTrackingClient(sea_tracking_settings.url, sea_tracking_settings.api_key)
+    try:
+        for operation_id, result in client.poll(references):
+            operation = operations[operation_id]
+            if result.data is not None and result.data.get('status') == 'error':
+                notify_about_sea_tracking_error(operation, result.data)
+                continue
+
+            track = tracks.get(operation_id) or Track(manual=False, booking=operation)
+            data_hash = get_payload_hash(result.data) if result.data is not None else track.data_hash
+            route_hash = get_payload_hash(result.route) if result.route is not None else track.route_hash
+            is_changed = track.data_hash != data_hash or track.route_hash != route_hash
+            if track.data_hash != data_hash:
+                try:
+                    with transaction.atomic():
+                        track.processed_events = process_sea_tracking(operation, result.data, main_country_code,
+                                                                      track.processed_events or {})
+                except Exception:
+                    logger.exception(f'Sea tracking data of operation [{operation_id}] could not be processed.')
+                    continue
+                track.data = result.data
+            if track.route_hash != route_hash:
+                track.route = result.route
+            track.data_hash, track.route_hash = data_hash, route_hash
+            track.data_etag, track.route_etag = result.data_etag, result.route_etag
+            shipment_details = next(iter(operation.shipment_details.all()))
+            track.next_poll_date = get_next_poll_date(shipment_details.date_of_arrival)
+
+            if track.id is None:
+                new_tracks.append(track)
+            elif is_changed:
+                changed_tracks.append(track)
             else:
-                pass
-                # Add notification to acemaven platform
-            break
-
-        shipment_details = operation.shipment_details.first()
-
-        if 'containers' in data_json['data']:
-            for container in data_json['data']['containers']:
-                for event in container['events']:
-                    status = event.get('status', 'UNK')
-                    event['status'] = sea_event_codes.get(status)
-                    if status == 'VAD':
-                        operation.vessel_arrived = True
-                        operation.save()
-                    if status == 'VDL' and not shipment_details.actual_date_of_departure:
-                        shipment_details.actual_date_of_departure = timezone.localtime()
-                        shipment_details.save()
-                        if direction == 'import':
-                            text_body = 'The shipment {aceid} has departed from {origin}.'
-                            text_params = {'aceid':operation.aceid, 'origin':operation.freight_rate.origin.code}
-
-                            create_and_assign_notification.delay(
-                                Notification.OPERATIONS_IMPORT,
-                                text_body,
-                                text_params,
-                                [operation.agent_contact_person_id, operation.client_contact_person_id, ],
-                                Notification.OPERATION,
-                                object_id=operation.id,
-                            )
-                            send_email.delay(text_body, text_params, [operation.agent_contact_person_id,
-                                                                      operation.client_contact_person_id, ],
-                                             object_id=f'{settings.DOMAIN_ADDRESS}operations/{operation.id}')
-
-                    event['location'] = next(
-                        filter(lambda x: x.get('id') == event['location'], data_json['data'].get('locations')), {}
-                    ).get('name', '')
-                    event['vessel'] = next(
-                        filter(lambda x: x.get('id') == event['vessel'], data_json['data'].get('vessels')), {}
-                    ).get('name', '')
-
-        if 'route' in data_json['data']:
-            date = data_json['data']['route'].get('postpod', {}).get('date')
-            if date and not shipment_details.actual_date_of_arrival:
-                shipment_details.actual_date_of_arrival = datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S')
-                shipment_details.save()
-                if direction == 'export':
-                    text_body = 'The shipment {aceid} has arrived at {destination}.'
-                    text_params = {'aceid':operation.aceid, 'destination':operation.freight_rate.destination.code}
-
-                    create_and_assign_notification.delay(
-                        Notification.OPERATIONS_EXPORT,
-                        text_body,
-                        text_params,
-                        [operation.agent_contact_person_id, operation.client_contact_person_id, ],
-                        Notification.OPERATION,
-                        object_id=operation.id,
-                    )
-                    send_email.delay(text_body,text_params,
-                                     [operation.agent_contact_person_id, operation.client_contact_person_id, ],
-                                     object_id=f'{settings.DOMAIN_ADDRESS}operations/{operation.id}')
-
-        route_response = requests.get(route_url)
-        route_json = route_response.json() if (route_status_code := route_response.status_code) == 200 \
-            else {
-            'status': 'error',
-            'message': f'Status code - {route_status_code}',
-        }
-
-        track, _ = Track.objects.get_or_create(
-            manual=False,
-            booking=operation,
-            defaults={'booking': operation}
-        )
-        track.data = data_json
-        track.route = route_json
-        track.save()
+                unchanged_tracks.append(track)
+    finally:
+        client.close()
+
+    Track.objects.bulk_create(new_tracks, batch_size=500)
+    Track.objects.bulk_update(changed_tracks, ['data', 'route', 'data_hash', 'route_hash', 'data_etag',
+                                               'route_etag', 'processed_events', 'next_poll_date'], batch_size=500)
+    Track.objects.bulk_update(unchanged_tracks, ['data_etag', 'route_etag', 'next_poll_date'], batch_size=500)
+    logger.info(f'Sea tracking finished: {len(references)} of {len(operations)} operations polled, '
+                f'{len(new_tracks)} tracks created, {len(changed_tracks)} tracks updated, '
+                f'{len(unchanged_tracks)} tracks unchanged.')
 
 
 @celery_app.task(name='notify_users_of_expiring_surcharges')
 def daily_notify_users_of_expiring_surcharges():
-    now_date = timezone.localtime().date()
-    surcharges = Surcharge.objects.filter(
-        temporary=False,
-        is_archived=False,
-        expiration_date=now_date + datetime.timedelta(days=5),
-    )
-    for surcharge in surcharges:
-        users_ids = list(surcharge.company.role_set.filter(
-            groups__name__in=('master', 'agent')
-        ).values_list('user__id', flat=True))
-        message_body = _(
-            'Surcharges are about to expire. Please, extend its expiration rate or create a new one with the updated costs.')
-        create_and_assign_notification.delay(
-            Notification.SURCHARGES,
-            message_body,
-            {},
-            users_ids,
-            Notification.SURCHARGE,
-            object_id=surcharge.id,
-        )
-        send_email.delay(message_body, {}, users_ids,
-                         object_id=f'{settings.DOMAIN_ADDRESS}services/surcharge/{surcharge.id}')
-
-    for user in get_user_model().objects.filter(role__groups__name__in=('master', 'agent'),
-                                                emailnotificationsetting__surcharge_expiration=True,
-                                                companies__type=Company.FREIGHT_FORWARDER,
-                                                ).distinct():
-        expiration_days = user.emailnotificationsetting.surcharge_expiration_days
-        for surcharge in user.get_company().surcharges.filter(temporary=False,
-                                                              is_archived=False,
-                                                              expiration_date=now_date + datetime.timedelta(
-                                                                  days=expiration_days
-                                                              ), ):
-            message_body = _(
-                'Surcharges are about to expire. Please, extend its expiration rate or create a new one with the updated costs.')
-
-            send_email(
-                message_body, {},
-                [user.id,],
-                object_id=f'{settings.DOMAIN_ADDRESS}services/surcharge/{surcharge.id}')
+    SurchargesExpirationDigest().run()
 
 
 @celery_app.task(name='notify_users_of_expiring_freight_rates')
 def daily_notify_users_of_expiring_freight_rates():
-    now_date = timezone.localtime().date()
-    freight_rates = FreightRate.objects.filter(
-        is_active=True,
-        temporary=False,
-        is_archived=False,
-        rates__expiration_date=now_date + datetime.timedelta(days=5),
-    ).distinct()
-    for freight_rate in freight_rates:
-        users_ids = list(freight_rate.company.role_set.filter(
-            groups__name__in=('master', 'agent')
-        ).values_list('user__id', flat=True))
-        message_body = _(
-            'Rates are about to expire.Please, extend its expiration rate or create a new one with the updated costs.')
-        create_and_assign_notification.delay(
-            Notification.FREIGHT_RATES,
-            message_body,
-            {},
-            users_ids,
-            Notification.FREIGHT_RATE,
-            object_id=freight_rate.id,
-        )
-
-        send_email.delay(message_body, {}, users_ids,
-                         object_id=f'{settings.DOMAIN_ADDRESS}services/rate/{freight_rate.id}')
-
-    for user in get_user_model().objects.filter(role__groups__name__in=('master', 'agent'),
-                                                emailnotificationsetting__freight_rate_expiration=True,
-                                                companies__type=Company.FREIGHT_FORWARDER,
-                                                ).distinct():
-        expiration_days = user.emailnotificationsetting.freight_rate_expiration_days
-        for freight_rate in user.get_company().freight_rates.filter(is_active=True,
-                                                                    temporary=False,
-                                                                    is_archived=False,
-                                                                    rates__expiration_date=now_date + datetime.timedelta(
-                                                                        days=expiration_days), ).distinct():
-            message_body = _(
-                'Rates are about to expire.Please, extend its expiration rate or create a new one with the updated costs.')
-
-            send_email(message_body, {}
-                       [user.id, ],
-                       object_id=f'{settings.DOMAIN_ADDRESS}services/rate/{freight_rate.id}')
+    FreightRatesExpirationDigest().run()
 
 
 @celery_app.task(name='notify_users_of_import_sea_shipment_arrival')
 def daily_notify_users_of_import_sea_shipment_arrival():
     now_date = timezone.localtime().date()
     import_shipment_details = ShipmentDetails.objects.annotate(
-        direction=Case(When(booking__freight_rate__origin__code__startswith=MAIN_COUNTRY_CODE, then=Value('export')),
+        direction=Case(When(booking__freight_rate__origin__code__startswith=get_main_country_code(), then=Value('export')),
                        default=Value('import'),
                        output_field=CharField(),
                        )
@@ -0,0 +1,271 @@
+import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, TestCase
+
+from app.booking.models import Surcharge, FreightRate, Rate, Charge, UsageFee, AdditionalSurcharge
+from app.booking.pricing import PricingSnapshot, wm_calculate, batch_wm_calculate, batch_charge_costs
+from app.booking.utils import apply_charge_costs, calculate_additional_surcharges, make_copy_of_surcharge
+from app.core.models import Company
+from app.handling.models import ShippingType, ShippingMode, Carrier, Port, Currency, ContainerType
+
+
+def get_shipping_mode(shipping_type, is_need_volume, has_surcharge_containers):
+    return SimpleNamespace(
+        shipping_type=SimpleNamespace(title=shipping_type),
+        is_need_volume=is_need_volume,
+        has_surcharge_containers=has_surcharge_containers,
+    )
+
+
+def get_charge(title, charge, conditions=Charge.FIXED, code='USD', is_document=False, is_dangerous=False,
+               is_cold=False):
+    return SimpleNamespace(
+        additional_surcharge=SimpleNamespace(
+            title=title,
+            is_document=is_document,
+            is_dangerous=is_dangerous,
+            is_cold=is_cold,
+        ),
+        currency=SimpleNamespace(code=code),
+        charge=charge,
+        conditions=conditions,
+    )
+
+
+def get_usage_fee(container_type_id, charge, code='USD'):
+    return SimpleNamespace(container_type_id=container_type_id, currency=SimpleNamespace(code=code), charge=charge)
+
+
+CHARGES = [
+    get_charge('Documentation fee', Decimal('75.00'), is_document=True),
+    get_charge('THC charge', Decimal('120.50')),
+    get_charge('Handling charge', Decimal('12.35'), conditions=Charge.WM, code='BRL'),
+    get_charge('Weight charge', Decimal('0.45'), conditions=Charge.PER_WEIGHT),
+    get_charge('Dangerous charge', Decimal('200.00'), is_dangerous=True),
+    get_charge('Cold charge', Decimal('150.00'), conditions=Charge.WM, code='EUR', is_cold=True),
+    get_charge('Empty charge', None),
+]
+
+AIR_CARGO_GROUPS = [
+    {'weight': '120', 'weight_measurement': 'kg', 'height': '80', 'length': '120', 'width': '100',
+     'length_measurement': 'cm', 'volume': 3, 'dangerous': True},
+    {'weight': '0.4', 'weight_measurement': 't', 'height': '0.5', 'length': '0.6', 'width': '0.7',
+     'length_measurement': 'm', 'volume': 2, 'frozen': True},
+]
+
+LCL_CARGO_GROUPS = [
+    {'weight': '1500', 'weight_measurement': 'kg', 'height': '120', 'length': '100', 'width': '80',
+     'length_measurement': 'cm', 'volume': 4},
+    {'weight': '2.5', 'weight_measurement': 't', 'height': '1.2', 'length': '1.1', 'width': '0.9',
+     'length_measurement': 'm', 'volume': 1, 'dangerous': True, 'frozen': True},
+    {'weight': '80', 'weight_measurement': 'kg', 'height': '40', 'length': '30', 'width': '20',
+     'length_measurement': 'cm', 'volume': 7},
+]
+
+FCL_CARGO_GROUPS = [
+    {'container_type': 1, 'volume': 2},
+    {'container_type': 2, 'volume': 1, 'dangerous': True},
+    {'container_type': 3, 'volume': 5, 'frozen': True},
+]
+
+USAGE_FEES = [get_usage_fee(1, Decimal('35.00')), get_usage_fee(2, Decimal('52.75'), code='BRL')]
+
+
+def create_agent_data():
+    shipping_type = ShippingType.objects.create(title='sea')
+    return SimpleNamespace(
+        shipping_mode=ShippingMode.objects.create(title='LCL', is_need_volume=True, shipping_type=shipping_type),
+        carrier=Carrier.objects.create(title='Test carrier', shipping_type=shipping_type),
+        origin=Port.objects.create(code='BRSSZ', name='Santos'),
+        destination=Port.objects.create(code='NLRTM', name='Rotterdam'),
+        currency=Currency.objects.create(code='USD'),
+        company=Company.objects.create(
+            type=Company.FREIGHT_FORWARDER,
+            name='Test agent',
+            state='Test',
+            city='Test',
+            zip_code='00000-000',
+            phone='+5511999999999',
+            tax_id='00.000.000/0000-00',
+        ),
+    )
+
+
+class ChargeCostsTestCase(SimpleTestCase):
+    """
+    Batch pricing of surcharges of a search must match pricing of every cargo group on its own.
+    """
+
+    def get_reference(self, cargo_groups, shipping_mode):
+        totals = {'total_surcharge': {}}
+        new_cargo_groups = []
+        for cargo_group in cargo_groups:
+            new_cargo_group = dict()
+            total_weight_per_pack = wm_calculate(cargo_group, shipping_mode.shipping_type.title)[0] \
+                if shipping_mode.is_need_volume else 0
+            usage_fee = next((usage_fee for usage_fee in USAGE_FEES
+                              if usage_fee.container_type_id == cargo_group.get('container_type')), None)
+            calculate_additional_surcharges(totals, CHARGES, usage_fee, cargo_group, shipping_mode, new_cargo_group,
+                                            total_weight_per_pack)
+            new_cargo_groups.append(new_cargo_group)
+        return totals, new_cargo_groups
+
+    def get_batch(self, cargo_groups, shipping_mode):
+        totals = {'total_surcharge': {}}
+        new_cargo_groups = []
+        cargo_groups_wm = batch_wm_calculate(cargo_groups, shipping_mode.shipping_type.title) \
+            if shipping_mode.is_need_volume else None
+        costs = batch_charge_costs(CHARGES, USAGE_FEES, cargo_groups, cargo_groups_wm, shipping_mode)
+        for index, cargo_group in enumerate(cargo_groups):
+            new_cargo_group = dict()
+            apply_charge_costs(totals, new_cargo_group, costs[index])
+            new_cargo_groups.append(new_cargo_group)
+        return totals, new_cargo_groups
+
+    def assert_same_costs(self, cargo_groups, shipping_mode):
+        self.assertEqual(self.get_batch(cargo_groups, shipping_mode), self.get_reference(cargo_groups, shipping_mode))
+
+    def test_air_loose_cargo(self):
+        self.assert_same_costs(AIR_CARGO_GROUPS, get_shipping_mode('air', True, False))
+
+    def test_air_uld(self):
+        cargo_groups = [dict(cargo_group, container_type=index + 1)
+                        for index, cargo_group in enumerate(AIR_CARGO_GROUPS)]
+        self.assert_same_costs(cargo_groups, get_shipping_mode('air', True, True))
+
+    def test_lcl(self):
+        self.assert_same_costs(LCL_CARGO_GROUPS, get_shipping_mode('sea', True, False))
+
+    def test_fcl(self):
+        self.assert_same_costs(FCL_CARGO_GROUPS, get_shipping_mode('sea', False, True))
+
+    def test_dangerous_and_cold_charges(self):
+        shipping_mode = get_shipping_mode('sea', True, False)
+        totals, new_cargo_groups = self.get_batch(LCL_CARGO_GROUPS, shipping_mode)
+        self.assertEqual([('dangerous' in group, 'cold' in group) for group in new_cargo_groups],
+                         [(False, False), (True, True), (False, False)])
+        self.assertTrue(all('documentation' not in group and 'empty' not in group for group in new_cargo_groups))
+
+    def test_single_cargo_group(self):
+        for cargo_group in LCL_CARGO_GROUPS:
+            self.assert_same_costs([cargo_group], get_shipping_mode('sea', True, False))
+
+    def test_weight_measure(self):
+        for shipping_type, cargo_groups in (('air', AIR_CARGO_GROUPS), ('sea', LCL_CARGO_GROUPS)):
+            self.assertEqual(batch_wm_calculate(cargo_groups, shipping_type),
+                             [wm_calculate(cargo_group, shipping_type) for cargo_group in cargo_groups])
+
+
+class PricingSnapshotTestCase(TestCase):
+    """
+    Snapshot takes surcharge of a rate valid for the whole shipment dates, as
+    rate.surcharges.filter(start_date__lte=date_from, expiration_date__gte=date_to).first() does.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date(2026, 10, 17)
+        data = create_agent_data()
+        cls.freight_rate = FreightRate.objects.create(
+            carrier=data.carrier,
+            origin=data.origin,
+            destination=data.destination,
+            shipping_mode=data.shipping_mode,
+            company=data.company,
+        )
+        cls.rate = Rate.objects.create(
+            currency=data.currency,
+            rate=Decimal('1000.00'),
+            start_date=cls.today,
+            expiration_date=cls.today + datetime.timedelta(days=90),
+            freight_rate=cls.freight_rate,
+        )
+        cls.surcharges = []
+        for start, expiration in ((-30, 10), (5, 60), (-10, 40), (50, 90)):
+            surcharge = Surcharge.objects.create(
+                carrier=data.carrier,
+                direction=Surcharge.EXPORT,
+                location=data.origin,
+                start_date=cls.today + datetime.timedelta(days=start),
+                expiration_date=cls.today + datetime.timedelta(days=expiration),
+                shipping_mode=data.shipping_mode,
+                company=data.company,
+            )
+            cls.surcharges.append(surcharge)
+        cls.rate.surcharges.set(cls.surcharges)
+
+    def get_surcharge(self, date_from, date_to):
+        date_from, date_to = (self.today + datetime.timedelta(days=days) for days in (date_from, date_to))
+        snapshot = PricingSnapshot([self.freight_rate], [], date_from, date_to)
+        return snapshot.get_surcharge(self.rate)
+
+    def get_reference(self, date_from, date_to):
+        date_from, date_to = (self.today + datetime.timedelta(days=days) for days in (date_from, date_to))
+        return self.rate.surcharges.filter(start_date__lte=date_from, expiration_date__gte=date_to) \
+            .order_by('id').first()
+
+    def test_surcharge_date_windows(self):
+        for date_from, date_to in ((0, 5), (6, 30), (20, 45), (55, 80), (-5, 95), (8, 12), (60, 60)):
+            with self.subTest(date_from=date_from, date_to=date_to):
+                self.assertEqual(self.get_surcharge(date_from, date_to), self.get_reference(date_from, date_to))
+
+    def test_first_valid_surcharge(self):
+        self.assertEqual(self.get_surcharge(6, 10), self.surcharges[0])
+        self.assertEqual(self.get_surcharge(20, 40), self.surcharges[1])
+        self.assertIsNone(self.get_surcharge(30, 70))
+
+
+class SurchargeCopyTestCase(TestCase):
+    """
+    Copy of surcharge gets its own usage fees and charges, once, and the original is archived.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        data = create_agent_data()
+        cls.surcharge = Surcharge.objects.create(
+            carrier=data.carrier,
+            direction=Surcharge.EXPORT,
+            location=data.origin,
+            start_date=datetime.date(2026, 10, 1),
+            expiration_date=datetime.date(2026, 12, 31),
+            shipping_mode=data.shipping_mode,
+            company=data.company,
+        )
+        for index in range(2):
+            container_type = ContainerType.objects.create(
+                code=f'{index + 20}DV',
+                description=f'{index + 20} dry van',
+                description_pt=f'{index + 20} dry van',
+                shipping_mode=data.shipping_mode,
+                fcl_type='dry',
+                teu=1,
+                height=1,
+                length=1,
+                width=1,
+                gross_weight=1,
+                tare_weight=1,
+            )
+            UsageFee.objects.create(container_type=container_type, surcharge=cls.surcharge, currency=data.currency,
+                                    charge=Decimal('25.00'))
+        for title in ('THC charge', 'Dangerous charge', 'Cold charge'):
+            additional_surcharge = AdditionalSurcharge.objects.create(title=title)
+            Charge.objects.create(additional_surcharge=additional_surcharge, surcharge=cls.surcharge,
+                                  currency=data.currency, charge=Decimal('10.00'))
+
+    def test_copy_of_surcharge(self):
+        surcharge_copy, fees_map = make_copy_of_surcharge(self.surcharge, get_usage_fees_map=True,
+                                                          get_charges_map=True)
+
+        self.assertEqual(UsageFee.objects.filter(surcharge=surcharge_copy).count(), 2)
+        self.assertEqual(Charge.objects.filter(surcharge=surcharge_copy).count(), 3)
+        self.assertEqual(UsageFee.objects.filter(surcharge=self.surcharge).count(), 2)
+        self.assertEqual(Charge.objects.filter(surcharge=self.surcharge).count(), 3)
+        self.assertEqual(surcharge_copy.container_types.count(), 2)
+        self.assertEqual(surcharge_copy.additional_surcharges.count(), 3)
+        self.assertEqual(len(fees_map['usage_fees']), 2)
+        self.assertEqual(len(fees_map['charges']), 3)
+        self.surcharge.refresh_from_db()
+        self.assertTrue(self.surcharge.is_archived)
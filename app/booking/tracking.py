@@ -0,0 +1,132 @@
+import datetime
+import hashlib
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import settings
+
+logger = logging.getLogger("acemaven.task.logging")
+
+
+SeaTrackingReference = namedtuple('SeaTrackingReference', ('booking_number', 'scac', 'data_etag', 'route_etag'))
+SeaTrackingResult = namedtuple('SeaTrackingResult', ('data', 'route', 'data_etag', 'route_etag'))
+
+SEA_TRACKING_POLL_INTERVALS = (
+    (datetime.timedelta(days=3), None),
+    (datetime.timedelta(days=14), datetime.timedelta(hours=12)),
+)
+SEA_TRACKING_DEFAULT_POLL_INTERVAL = datetime.timedelta(days=1)
+
+
+def get_payload_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def get_next_poll_date(estimated_date_of_arrival):
+    """
+    Returns date of the next poll of a shipment, shipments close to or past their arrival are polled
+    on every sweep (None), distant ones less frequently.
+    """
+
+    now = timezone.localtime()
+    if estimated_date_of_arrival is None:
+        return None
+    for time_to_arrival, interval in SEA_TRACKING_POLL_INTERVALS:
+        if estimated_date_of_arrival - now <= time_to_arrival:
+            return now + interval if interval else None
+    return now + SEA_TRACKING_DEFAULT_POLL_INTERVAL
+
+
+def get_error_json(message):
+    return {
+        'status': 'error',
+        'message': message,
+    }
+
+
+class SeaTrackingClient:
+    """
+    Client of the sea tracking api with a shared keep-alive session, retries with backoff
+    and a bounded number of concurrent requests.
+    """
+
+    def __init__(self, url, api_key, concurrency=None, timeout=None, retries=None):
+        self.url = url
+        self.api_key = api_key
+        self.concurrency = concurrency or settings.SEA_TRACKING_CONCURRENCY
+        self.timeout = timeout or settings.SEA_TRACKING_TIMEOUT
+        retry = Retry(
+            total=settings.SEA_TRACKING_RETRIES if retries is None else retries,
+            backoff_factor=1,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self, path, booking_number, scac, etag=None):
+        """
+        Returns (json, etag) of the api response, json is None if the api answers
+        with 304 to the request conditional on etag of the previous response.
+        """
+
+        params = {
+            'type': 'BK',
+            'number': booking_number,
+            'sealine': scac,
+            'api_key': self.api_key,
+        }
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            response = self.session.get(f'{self.url}{path}', params=params, headers=headers, timeout=self.timeout)
+        except requests.RequestException as error:
+            return get_error_json(f'Request error - {error.__class__.__name__}'), etag
+        if response.status_code == 304:
+            return None, etag
+        if response.status_code != 200:
+            return get_error_json(f'Status code - {response.status_code}'), etag
+        try:
+            return response.json(), response.headers.get('ETag')
+        except ValueError:
+            return get_error_json('Invalid json'), etag
+
+    def fetch(self, reference):
+        data_json, data_etag = self.get_json('reference', reference.booking_number, reference.scac,
+                                             reference.data_etag)
+        if data_json is not None and data_json.get('status') == 'error':
+            return SeaTrackingResult(data_json, None, data_etag, reference.route_etag)
+        route_json, route_etag = self.get_json('route', reference.booking_number, reference.scac,
+                                               reference.route_etag)
+        return SeaTrackingResult(data_json, route_json, data_etag, route_etag)
+
+    def poll(self, references):
+        """
+        Fetches reference and route data for dict of key to SeaTrackingReference concurrently,
+        yields (key, SeaTrackingResult) as responses arrive. A failure of one request does
+        not affect the others.
+        """
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(self.fetch, reference): key for key, reference in references.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    result = future.result()
+                except Exception as error:
+                    logger.exception(f'Sea tracking request for [{key}] failed.')
+                    reference = references[key]
+                    result = SeaTrackingResult(get_error_json(f'Request error - {error.__class__.__name__}'), None,
+                                               reference.data_etag, reference.route_etag)
+                yield key, result
+
+    def close(self):
+        self.session.close()
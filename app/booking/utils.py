@@ -1,22 +1,26 @@
 import datetime
 import random
 import string
+import zlib
 from decimal import Decimal
 
+from django.db import connection
 from django.db.utils import ProgrammingError
-from django.db.models import Q
-
-from app.booking.models import Surcharge, Charge, FreightRate
-from app.handling.models import GlobalFee, ShippingMode, ShippingType, ExchangeRate, ContainerType, PackagingType, Port
-from app.location.models import Country
+from django.db.models import Q, Count, Prefetch
+from django.utils import timezone
+
+from app.booking.models import Surcharge, FreightRate, SearchableOffer, Booking, CargoGroup, Charge, Rate, \
+    ShipmentDetails, Track, UsageFee, get_validity_range
+from app.booking.offers import schedule_searchable_offers_refresh
+from app.booking.pricing import PricingSnapshot
+from app.core.models import BankAccount, Company
+from app.handling.models import GlobalFee, ShippingMode, ShippingType, Port
+from app.handling.spatial import get_alternative_ports_ids
+from app.handling.utils import get_main_country_code
+from app.websockets.models import ChatPermission
 
 from django.utils.translation import ugettext as _
 
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
-
 
 def get_shipping_type_titles():
     titles = ('sea', 'air')
@@ -47,7 +51,7 @@ def create_message_for_track(changed_fields):
 
 def rate_surcharges_filter(rate, company, temporary=False):
     freight_rate = rate.freight_rate
-    direction = 'export' if freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+    direction = 'export' if freight_rate.origin.code.startswith(get_main_country_code()) else 'import'
     location = freight_rate.origin if direction == 'export' else freight_rate.destination
     filter_fields = {
         'carrier': freight_rate.carrier,
@@ -55,21 +59,9 @@ def rate_surcharges_filter(rate, company, temporary=False):
         'location': location,
         'shipping_mode': freight_rate.shipping_mode,
     }
-    start_date_fields = {
-        'start_date__lt': rate.start_date,
-        'expiration_date__gte': rate.start_date,
-    }
-    mid_date_fields = {
-        'start_date__gte': rate.start_date,
-        'expiration_date__lte': rate.expiration_date,
-    }
-    end_date_fields = {
-        'start_date__lte': rate.expiration_date,
-        'expiration_date__gt': rate.expiration_date,
-    }
     surcharges = Surcharge.objects.filter(
         Q(**filter_fields),
-        Q(Q(**start_date_fields), Q(**end_date_fields), Q(**mid_date_fields), _connector='OR'),
+        validity__overlap=get_validity_range(rate.start_date, rate.expiration_date),
         company=company,
         is_archived=False,
     )
@@ -78,32 +70,33 @@ def rate_surcharges_filter(rate, company, temporary=False):
     return surcharges
 
 
-def wm_calculate(data, shipping_type=None):
-    if not shipping_type:
-        shipping_type = data.get('shipping_type')
-    weight_measurement = data.get('weight_measurement')
-    length_measurement = data.get('length_measurement')
-    weight = Decimal(data.get('weight'))
-    height = Decimal(data.get('height'))
-    length = Decimal(data.get('length'))
-    width = Decimal(data.get('width'))
-    volume = data.get('volume', 0)
-    if shipping_type == 'air':
-        gross_weight = weight if weight_measurement == 'kg' else weight * 1000
-        divider = 6000 if length_measurement == 'cm' else 0.006
-    else:
-        gross_weight = weight if weight_measurement == 't' else weight / 1000
-        divider = 1 if length_measurement == 'm' else 1000000
-    total_volume = height * length * width / Decimal(divider)
-    total_weight_per_pack = gross_weight if gross_weight > total_volume else total_volume
-    total_weight = total_weight_per_pack * volume
-    return round(total_weight_per_pack, 2), round(total_weight, 2)
+def lock_freight_rate_route(freight_rate):
+    """
+    Takes transaction level advisory lock of freight rates of the same company, carrier and route,
+    so concurrent saves can't both pass the check of overlapping rates.
+    """
+
+    key = zlib.crc32(f'freight_rate:{freight_rate.company_id}:{freight_rate.carrier_id}:'
+                     f'{freight_rate.shipping_mode_id}:{freight_rate.origin_id}:{freight_rate.destination_id}'.encode())
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
 
 
 def add_currency_value(totals, code, subtotal):
     totals[code] = round((totals[code] + subtotal), 2) if code in totals else round(subtotal, 2)
 
 
+def apply_charge_costs(totals, new_cargo_group, costs):
+    for key, code, cost, subtotal in costs:
+        new_cargo_group[key] = {
+            'currency': code,
+            'cost': cost,
+            'subtotal': subtotal,
+        }
+        add_currency_value(totals, code, subtotal)
+        add_currency_value(totals['total_surcharge'], code, subtotal)
+
+
 def calculate_additional_surcharges(totals,
                                     charges,
                                     usage_fee,
@@ -111,6 +104,10 @@ def calculate_additional_surcharges(totals,
                                     shipping_mode,
                                     new_cargo_group,
                                     total_weight_per_pack=0):
+    """
+    Prices surcharge charges and usage fee of one cargo group, reference of batch_charge_costs().
+    """
+
     for charge in charges:
         data = dict()
         if not charge.additional_surcharge.is_document:
@@ -118,7 +115,6 @@ def calculate_additional_surcharges(totals,
                 continue
             elif charge.additional_surcharge.is_cold and not cargo_group.get('frozen'):
                 continue
-            fixed_cost = False
             cost_per_pack = charge.charge
             if cost_per_pack is not None:
                 if shipping_mode.is_need_volume:
@@ -126,11 +122,7 @@ def calculate_additional_surcharges(totals,
                         cost_per_pack = total_weight_per_pack * charge.charge
                     elif condition == Charge.PER_WEIGHT:
                         cost_per_pack = Decimal(cargo_group.get('weight')) * charge.charge
-                    elif condition == Charge.FIXED:
-                        fixed_cost = True
-                subtotal = cost_per_pack * Decimal(
-                    cargo_group.get('volume')) if not fixed_cost else cost_per_pack * Decimal(cargo_group.get('volume'))
-                subtotal = float(subtotal)
+                subtotal = float(cost_per_pack * Decimal(cargo_group.get('volume')))
                 cost_per_pack = float(cost_per_pack)
                 code = charge.currency.code
                 data['currency'] = code
@@ -147,8 +139,7 @@ def calculate_additional_surcharges(totals,
             code = usage_fee.currency.code
             usage_fee_data['currency'] = code
             usage_fee_data['cost'] = float(usage_fee.charge)
-            subtotal = usage_fee.charge * Decimal(cargo_group.get('volume'))
-            subtotal = float(subtotal)
+            subtotal = float(usage_fee.charge * Decimal(cargo_group.get('volume')))
             usage_fee_data['subtotal'] = subtotal
             data_key = 'usage_fee' if shipping_mode.is_need_volume else 'handling'
             new_cargo_group[data_key] = usage_fee_data
@@ -218,7 +209,10 @@ def calculate_freight_rate_charges(freight_rate,
                                    number_of_documents=None,
                                    booking_fee=None,
                                    service_fee=None,
-                                   calculate_fees=False):
+                                   calculate_fees=False,
+                                   snapshot=None):
+    if snapshot is None:
+        snapshot = PricingSnapshot((freight_rate, ), cargo_groups, date_from, date_to)
     totals = dict()
     totals['total_freight_rate'] = dict()
     totals['total_surcharge'] = dict()
@@ -228,14 +222,12 @@ def calculate_freight_rate_charges(freight_rate,
     if calculate_fees:
         totals['booking_fee'] = dict()
     if shipping_mode.is_need_volume:
-        rate = freight_rate.rates.first()
-        exchange_rate = ExchangeRate.objects.filter(
-            currency__code=rate.currency.code,
-            is_platforms=True,
-        ).first()
-        for cargo_group in cargo_groups:
+        rate = snapshot.get_rate(freight_rate, any_container_type=True)
+        exchange_rate = snapshot.get_exchange_rate(rate.currency.code)
+        cargo_groups_wm = snapshot.get_cargo_groups_wm(shipping_mode.shipping_type.title)
+        for index, cargo_group in enumerate(cargo_groups):
             new_cargo_group = dict()
-            total_weight_per_pack, total_weight = wm_calculate(cargo_group, shipping_mode.shipping_type.title)
+            total_weight_per_pack, total_weight = cargo_groups_wm[index]
 
             new_cargo_group['freight'] = calculate_freight_rate(totals,
                                                                 rate,
@@ -247,35 +239,20 @@ def calculate_freight_rate_charges(freight_rate,
                                                                 total_weight=total_weight,
                                                                 calculate_fees=calculate_fees, )
 
-            surcharge = rate.surcharges.filter(start_date__lte=date_from,
-                                               expiration_date__gte=date_to).first()
-            charges = surcharge.charges.all()
-            usage_fee = surcharge.usage_fees.filter(container_type=cargo_group.get('container_type')).first()
-            calculate_additional_surcharges(totals,
-                                            charges,
-                                            usage_fee,
-                                            cargo_group,
-                                            shipping_mode,
-                                            new_cargo_group,
-                                            total_weight_per_pack)
+            surcharge = snapshot.get_surcharge(rate)
+            apply_charge_costs(totals, new_cargo_group, snapshot.get_charge_costs(surcharge, shipping_mode)[index])
             new_cargo_group['volume'] = cargo_group.get('volume')
-            container_type = cargo_group.get('container_type')
-            packaging_type = cargo_group.get('packaging_type')
-            new_cargo_group['cargo_type'] = ContainerType.objects.filter(id=container_type).first().code \
-                if container_type else PackagingType.objects.filter(id=packaging_type).first().description
+            new_cargo_group['cargo_type'] = snapshot.get_cargo_type(cargo_group.get('container_type'),
+                                                                    cargo_group.get('packaging_type'))
             new_cargo_group['cargo_group'] = cargo_group
             new_cargo_group['cargo_group']['total_wm'] = str(total_weight)
 
             result['cargo_groups'].append(new_cargo_group)
     else:
-        rates = freight_rate.rates.all()
-        for cargo_group in cargo_groups:
+        for index, cargo_group in enumerate(cargo_groups):
             new_cargo_group = dict()
-            rate = rates.filter(container_type=cargo_group.get('container_type')).first()
-            exchange_rate = ExchangeRate.objects.filter(
-                currency__code=rate.currency.code,
-                is_platforms=True,
-            ).first()
+            rate = snapshot.get_rate(freight_rate, cargo_group.get('container_type'))
+            exchange_rate = snapshot.get_exchange_rate(rate.currency.code)
 
             new_cargo_group['freight'] = calculate_freight_rate(totals,
                                                                 rate,
@@ -285,31 +262,20 @@ def calculate_freight_rate_charges(freight_rate,
                                                                 volume=cargo_group.get('volume'),
                                                                 calculate_fees=calculate_fees, )
 
-            surcharge = rate.surcharges.filter(start_date__lte=date_from,
-                                               expiration_date__gte=date_to).first()
-            charges = surcharge.charges.all()
-            usage_fee = surcharge.usage_fees.filter(container_type=cargo_group.get('container_type')).first()
-            calculate_additional_surcharges(totals,
-                                            charges,
-                                            usage_fee,
-                                            cargo_group,
-                                            shipping_mode,
-                                            new_cargo_group)
+            surcharge = snapshot.get_surcharge(rate)
+            apply_charge_costs(totals, new_cargo_group, snapshot.get_charge_costs(surcharge, shipping_mode)[index])
             new_cargo_group['volume'] = cargo_group.get('volume')
-            container_type = cargo_group.get('container_type')
-            new_cargo_group['cargo_type'] = ContainerType.objects.filter(id=container_type).first().code
+            new_cargo_group['cargo_type'] = snapshot.get_cargo_type(cargo_group.get('container_type'))
 
             result['cargo_groups'].append(new_cargo_group)
 
     doc_fee = dict()
-    filter_data = {}
     if shipping_mode.has_freight_containers:
-        filter_data['container_type__id'] = container_type_ids_list[0]
-    surcharge = freight_rate.rates.filter(**filter_data).first().surcharges.filter(
-        start_date__lte=date_from,
-        expiration_date__gte=date_to,
-    ).first()
-    charge = surcharge.charges.filter(additional_surcharge__is_document=True).first()
+        rate = snapshot.get_rate(freight_rate, container_type_ids_list[0])
+    else:
+        rate = snapshot.get_rate(freight_rate, any_container_type=True)
+    surcharge = snapshot.get_surcharge(rate)
+    charge = snapshot.get_document_charge(surcharge)
     doc_fee_charge = float(charge.charge) if charge.charge else 0
     doc_fee['currency'] = charge.currency.code
     doc_fee['cost'] = doc_fee_charge
@@ -333,10 +299,7 @@ def calculate_freight_rate_charges(freight_rate,
         total_booking_fee = 0
         for key, value in result['booking_fee'].items():
             if key != main_currency_code:
-                exchange_rate = ExchangeRate.objects.filter(
-                    currency__code=key,
-                    is_platforms=True,
-                ).first()
+                exchange_rate = snapshot.get_exchange_rate(key)
                 a = round((float(exchange_rate.rate) * (1 + float(exchange_rate.spread) / 100)), 2)
                 exchange_rates[key] = a
                 total_booking_fee += a * value
@@ -356,10 +319,7 @@ def calculate_freight_rate_charges(freight_rate,
                 for currency, value in totals.items():
                     current_value = value * float_service_fee_value / 100
                     if currency != main_currency_code:
-                        exchange_rate = ExchangeRate.objects.filter(
-                            currency__code=currency,
-                            is_platforms=True,
-                        ).first()
+                        exchange_rate = snapshot.get_exchange_rate(currency)
                         current_value = current_value * (float(exchange_rate.rate) *
                                                          (1 + float(exchange_rate.spread) / 100))
                     service_fee_value += current_value
@@ -421,7 +381,7 @@ def surcharge_search(data, company):
     shipping_mode = ShippingMode.objects.filter(id=data.get('shipping_mode')).first()
     cargo_groups, container_type_ids_list, dangerous_list, cold_list, date_from, date_to = get_data_info(data)
     port = Port.objects.get(id=data['origin'])
-    direction = 'export' if port.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+    direction = 'export' if port.code.startswith(get_main_country_code()) else 'import'
     location = data['origin'] if direction == 'export' else data['destination']
     filter_fields = {
         'carrier': data['carrier'],
@@ -457,54 +417,58 @@ def surcharge_search(data, company):
     return queryset
 
 
-def freight_rate_search(data, company=None):
-    shipping_mode = ShippingMode.objects.filter(id=data.get('shipping_mode')).first()
-    cargo_groups, container_type_ids_list, dangerous_list, cold_list, date_from, date_to = get_data_info(data)
+def get_route_port_filter(field_name, port_id, radius=None):
+    """
+    Returns filter of offers by port, or by ports within radius in km around it, as alternative
+    origins or destinations are searched in the same query.
+    """
 
-    data['rates__start_date__lte'] = date_from
-    data['rates__expiration_date__gte'] = date_to
-    data['rates__surcharges__start_date__lte'] = date_from
-    data['rates__surcharges__expiration_date__gte'] = date_to
+    if not radius:
+        return {f'{field_name}_id': port_id}
+    return {f'{field_name}_id__in': get_alternative_ports_ids(port_id, radius)}
 
-    freight_rates = FreightRate.objects \
-        .filter(**data,
-                is_active=True,
-                temporary=False,
-                is_archived=False,
-                company__disabled=False
-                )
 
-    queryset = []
+def freight_rate_search(data, company=None):
+    shipping_mode = ShippingMode.objects.filter(id=data.get('shipping_mode')).select_related('shipping_type').first()
+    cargo_groups, container_type_ids_list, dangerous_list, cold_list, date_from, date_to = get_data_info(data)
 
-    if shipping_mode.has_freight_containers:
-        for container_type_id in container_type_ids_list:
-            queryset.append(freight_rates.filter(rates__rate__isnull=False,
-                                                 rates__container_type__id=container_type_id))
+    offers = SearchableOffer.objects.filter(
+        shipping_mode=shipping_mode,
+        **get_route_port_filter('origin', data.get('origin'), data.get('origin_radius')),
+        **get_route_port_filter('destination', data.get('destination'), data.get('destination_radius')),
+        start_date__lte=date_from,
+        expiration_date__gte=date_to,
+        company__disabled=False,
+    )
+    if data.get('carrier'):
+        offers = offers.filter(carrier_id=data.get('carrier'))
 
-    if shipping_mode.has_surcharge_containers:
-        for container_type_id in container_type_ids_list:
-            queryset.append(freight_rates.filter(rates__surcharges__usage_fees__charge__isnull=False,
-                                                 rates__surcharges__usage_fees__container_type__id=container_type_id))
+    if shipping_mode.has_surcharge_containers and container_type_ids_list:
+        offers = offers.filter(usage_fee_container_types__contains=container_type_ids_list)
 
     if dangerous_list:
-        queryset.append(freight_rates.filter(rates__surcharges__additional_surcharges__is_dangerous=True,
-                                             rates__surcharges__charges__charge__isnull=False))
+        offers = offers.filter(has_dangerous=True)
 
     if cold_list:
-        queryset.append(freight_rates.filter(rates__surcharges__additional_surcharges__is_cold=True,
-                                             rates__surcharges__charges__charge__isnull=False))
+        offers = offers.filter(has_cold=True)
 
     if company:
-        queryset.append(freight_rates.filter(company=company, ))
+        offers = offers.filter(company=company)
 
-    freight_rates = freight_rates.intersection(*queryset)
+    if shipping_mode.has_freight_containers and container_type_ids_list:
+        offers = offers.filter(has_rate=True, container_type_id__in=container_type_ids_list) \
+            .values('freight_rate_id') \
+            .annotate(number_of_container_types=Count('container_type_id', distinct=True)) \
+            .filter(number_of_container_types=len(set(container_type_ids_list)))
+
+    freight_rates = FreightRate.objects.filter(id__in=offers.values('freight_rate_id'))
     return freight_rates, shipping_mode
 
 
 def generate_aceid(freight_rate, company):
     vowels = 'AEIOU'
     consonants = 'BCDFGHIJKLMNPQRSTVWXZ'
-    odd_or_even = 1 if freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 2
+    odd_or_even = 1 if freight_rate.origin.code.startswith(get_main_country_code()) else 2
     vowels_or_consonants = vowels if freight_rate.shipping_mode.shipping_type.title == 'air' else consonants
     aceid = f'{company.name[:2].upper()}' \
             f'{random.choices(range(odd_or_even, 10, 2))[0]}' \
@@ -513,62 +477,89 @@ def generate_aceid(freight_rate, company):
     return aceid
 
 
+def get_instance_copy(instance, **fields):
+    """
+    Returns unsaved copy of instance with concrete fields values, except primary key, overridden by fields.
+    """
+
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields if not field.primary_key
+    }
+    values.update(fields)
+    return model(**values)
+
+
+def copy_m2m_links(model, field_name, ids_map):
+    """
+    Copies links of many to many field of model from old to new objects of ids_map in two queries.
+    """
+
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source_field_name = f'{field.m2m_field_name()}_id'
+    target_field_name = f'{field.m2m_reverse_field_name()}_id'
+    links = through.objects.filter(**{f'{source_field_name}__in': list(ids_map)}) \
+        .values_list(source_field_name, target_field_name)
+    through.objects.bulk_create([
+        through(**{source_field_name: ids_map[source_id], target_field_name: target_id})
+        for source_id, target_id in links
+    ])
+
+
+def copy_children(queryset, **fields):
+    """
+    Copies objects of queryset with fields overridden in one bulk_create, returns dict of old id to copy.
+    """
+
+    objects = list(queryset.order_by('id'))
+    copies = queryset.model.objects.bulk_create([get_instance_copy(obj, **fields) for obj in objects])
+    return {obj.id: copy for obj, copy in zip(objects, copies)}
+
+
 def make_copy_of_surcharge(surcharge, get_usage_fees_map=False, get_charges_map=False):
-    original_surcharge_id = surcharge.id
-    original_surcharge = Surcharge.objects.get(id=original_surcharge_id)
+    """
+    Makes copy of surcharge with its usage fees and charges, which are also the through rows of its
+    many to many fields, in a constant number of queries and archives the original. Returns the copy
+    and maps of old ids to copies of usage fees and charges.
+    """
 
     fees_map = dict()
     fees_map['usage_fees'] = dict()
     fees_map['charges'] = dict()
 
-    surcharge.pk = None
-    surcharge.save()
-
-    for usage_fee in original_surcharge.usage_fees.all():
-        old_usage_fee_id = usage_fee.id
-        usage_fee.pk = None
-        usage_fee.surcharge = surcharge
-        usage_fee.save()
-        if get_usage_fees_map:
-            fees_map['usage_fees'][old_usage_fee_id] = usage_fee
+    surcharge_copy, = Surcharge.objects.bulk_create([get_instance_copy(surcharge)])
+    usage_fees_map = copy_children(UsageFee.objects.filter(surcharge_id=surcharge.id), surcharge_id=surcharge_copy.id)
+    charges_map = copy_children(Charge.objects.filter(surcharge_id=surcharge.id), surcharge_id=surcharge_copy.id)
+    if get_usage_fees_map:
+        fees_map['usage_fees'] = usage_fees_map
+    if get_charges_map:
+        fees_map['charges'] = charges_map
 
-    for charge in original_surcharge.charges.all():
-        old_charge_id = charge.id
-        charge.pk = None
-        charge.surcharge = surcharge
-        charge.save()
-        if get_charges_map:
-            fees_map['charges'][old_charge_id] = charge
+    surcharge.is_archived = True
+    surcharge.save(update_fields=['is_archived'])
 
-    original_surcharge.is_archived = True
-    original_surcharge.save()
-
-    return surcharge, fees_map
+    return surcharge_copy, fees_map
 
 
 def make_copy_of_freight_rate(freight_rate, get_rates_map=False):
-    original_freight_rate_id = freight_rate.id
-    original_freight_rate = FreightRate.objects.get(id=original_freight_rate_id)
-
-    fees_map = dict()
+    """
+    Makes copy of freight rate with its rates and their surcharges links in a constant number of queries
+    and archives the original. Returns the copy and map of old rate ids to copies of rates.
+    """
 
-    freight_rate.pk = None
-    freight_rate.save()
+    freight_rate_copy, = FreightRate.objects.bulk_create([get_instance_copy(freight_rate)])
 
-    for rate in original_freight_rate.rates.all():
-        old_rate_id = rate.id
-        surcharges = rate.surcharges.all()
-        rate.pk = None
-        rate.freight_rate = freight_rate
-        rate.save()
-        rate.surcharges.set(surcharges)
-        if get_rates_map:
-            fees_map[old_rate_id] = rate
+    rates_map = copy_children(Rate.objects.filter(freight_rate_id=freight_rate.id),
+                              freight_rate_id=freight_rate_copy.id)
+    copy_m2m_links(Rate, 'surcharges', {old_rate_id: rate.id for old_rate_id, rate in rates_map.items()})
+    schedule_searchable_offers_refresh([freight_rate_copy.id])
 
-    original_freight_rate.is_archived = True
-    original_freight_rate.save()
+    freight_rate.is_archived = True
+    freight_rate.save(update_fields=['is_archived'])
 
-    return freight_rate, fees_map
+    return freight_rate_copy, rates_map if get_rates_map else dict()
 
 
 sea_event_codes = {
@@ -697,28 +688,74 @@ test_track_data_1 = {
 }
 
 
-def apply_operation_select_prefetch_related(queryset):
+def get_visible_tracking_date():
+    return timezone.localtime() - datetime.timedelta(minutes=5)
+
+
+def apply_operation_select_prefetch_related(queryset, user=None, detailed=False):
+    """
+    Selects and prefetches everything operation serializers read, so the number of queries
+    does not depend on the number of operations. Detailed prefetch adds change requests
+    with their own relations and chat permissions of the user for retrieve.
+    """
+
+    tracking_queryset = Track.objects.select_related('status', 'created_by')
+    companies_queryset = Company.objects.order_by('id')
+    agent_companies_queryset = companies_queryset.prefetch_related(Prefetch(
+        'bank_accounts',
+        queryset=BankAccount.objects.filter(is_default=True).order_by('id'),
+        to_attr='default_bank_accounts',
+    ))
     queryset = queryset.select_related(
         'freight_rate',
         'client_contact_person',
         'agent_contact_person',
         'shipper',
+        'release_type',
         'freight_rate__origin',
         'freight_rate__destination',
         'freight_rate__carrier',
-        'freight_rate__shipping_mode',
+        'freight_rate__shipping_mode__shipping_type',
     ).prefetch_related(
-        'cargo_groups',
-        'cargo_groups__container_type',
-        'freight_rate__rates',
-        'freight_rate__rates__currency',
-        'freight_rate__rates__surcharges',
-        'freight_rate__rates__surcharges__additional_surcharges',
-        'freight_rate__rates__surcharges__usage_fees',
-        'freight_rate__rates__surcharges__usage_fees__currency',
-        'freight_rate__rates__surcharges__charges',
-        'freight_rate__rates__surcharges__charges__currency',
-        'freight_rate__rates__surcharges__carrier',
-        'freight_rate__rates__surcharges__shipping_mode',
+        Prefetch('cargo_groups', queryset=CargoGroup.objects.select_related('container_type', 'packaging_type')),
+        Prefetch('shipment_details', queryset=ShipmentDetails.objects.order_by('id')),
+        Prefetch('tracking', queryset=tracking_queryset),
+        Prefetch('tracking',
+                 queryset=tracking_queryset.filter(date_created__lt=get_visible_tracking_date()),
+                 to_attr='visible_tracking'),
+        Prefetch('agent_contact_person__companies', queryset=agent_companies_queryset, to_attr='ordered_companies'),
+        Prefetch('client_contact_person__companies', queryset=companies_queryset, to_attr='ordered_companies'),
+        Prefetch('freight_rate__rates', queryset=Rate.objects.select_related(
+            'container_type',
+            'currency',
+            'updated_by',
+        )),
+        Prefetch('freight_rate__rates__surcharges', queryset=Surcharge.objects.select_related(
+            'carrier',
+            'location',
+            'shipping_mode__shipping_type',
+        )),
+        Prefetch('freight_rate__rates__surcharges__usage_fees', queryset=UsageFee.objects.select_related(
+            'container_type',
+            'currency',
+            'updated_by',
+        )),
+        Prefetch('freight_rate__rates__surcharges__charges', queryset=Charge.objects.select_related(
+            'additional_surcharge',
+            'currency',
+            'updated_by',
+        )),
+    )
+    if not detailed:
+        return queryset.prefetch_related('change_requests')
+
+    queryset = queryset.select_related('chat', 'review').prefetch_related(
+        Prefetch('change_requests', queryset=apply_operation_select_prefetch_related(Booking.objects.all())),
     )
+    if user:
+        queryset = queryset.prefetch_related(Prefetch(
+            'chat__user_permissions',
+            queryset=ChatPermission.objects.filter(user=user),
+            to_attr='request_user_permissions',
+        ))
     return queryset
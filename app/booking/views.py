@@ -1,18 +1,21 @@
+import operator
 from datetime import datetime
+from functools import reduce
 
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 from django_filters import rest_framework
 from rest_framework import mixins, viewsets, filters, status, generics, views
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.db.models import CharField, Case, When, Value, Q, Count, Min
-from django.db.utils import ProgrammingError
 from django.utils import timezone
 
 from app.booking.filters import SurchargeFilterSet, FreightRateFilterSet, QuoteFilterSet, QuoteOrderingFilterBackend, \
@@ -20,7 +23,7 @@ from app.booking.filters import SurchargeFilterSet, FreightRateFilterSet, QuoteF
     TrackStatusFilterSet, OperationBillingFilterSet
 from app.booking.mixins import FeeGetQuerysetMixin
 from app.booking.models import Surcharge, UsageFee, Charge, FreightRate, Rate, Quote, Booking, Status, \
-    ShipmentDetails, CancellationReason, CargoGroup, Track, TrackStatus, PaymentData, Transaction
+    ShipmentDetails, CancellationReason, CargoGroup, Track, TrackStatus, PaymentData, Transaction, get_validity_range
 from app.booking.serializers import SurchargeSerializer, SurchargeEditSerializer, SurchargeListSerializer, \
     SurchargeRetrieveSerializer, UsageFeeSerializer, ChargeSerializer, FreightRateListSerializer, \
     SurchargeCheckDatesSerializer, FreightRateEditSerializer, FreightRateSerializer, FreightRateRetrieveSerializer, \
@@ -31,29 +34,28 @@ from app.booking.serializers import SurchargeSerializer, SurchargeEditSerializer
     ShipmentDetailsBaseSerializer, OperationSerializer, OperationListBaseSerializer, OperationRetrieveSerializer, \
     OperationRetrieveClientSerializer, OperationRecalculateSerializer, TrackSerializer, TrackStatusSerializer, \
     TrackRetrieveSerializer, OperationBillingAgentListSerializer, OperationBillingClientListSerializer, \
-    TrackWidgetListSerializer, OperationListClientSerializer
-from app.booking.utils import date_format, wm_calculate, freight_rate_search, calculate_freight_rate_charges, \
+    TrackWidgetListSerializer, OperationListClientSerializer, FreightRateSearchPageSerializer
+from app.booking.utils import date_format, calculate_freight_rate_charges, \
     get_fees, surcharge_search, make_copy_of_surcharge, make_copy_of_freight_rate, \
-    apply_operation_select_prefetch_related
+    apply_operation_select_prefetch_related, lock_freight_rate_route
+from app.booking.pricing import wm_calculate
+from app.booking.renderers import NDJSONRenderer, EventStreamRenderer
+from app.booking.search import FreightRateSearch, DEFAULT_PAGE_SIZE
 from app.core.mixins import PermissionClassByActionMixin
-from app.core.models import Company, BankAccount, Review
+from app.core.models import Company, Review
 from app.core.permissions import IsMasterOrAgent, IsClientCompany, IsAgentCompany
 from app.core.serializers import ReviewBaseSerializer
-from app.handling.models import Port, Currency, ClientPlatformSetting
-from app.location.models import Country
+from app.handling.models import Port, ClientPlatformSetting
+from app.handling.utils import get_setting, get_main_currency_code, get_main_country_code
 from app.websockets.models import Notification, Chat
 from app.websockets.tasks import create_and_assign_notification, reassign_confirmed_operation_notifications, \
     delete_accepted_booking_notifications, send_email, create_chat_for_operation
-from app.booking.tasks import change_charge
+from app.booking.payments import get_webhook_txids, get_payment_status, create_charge_transaction
+from app.booking.tasks import change_charge, reconcile_pix_transactions
 from config import settings
 from app.core.util.get_jwt_token import get_jwt_token
 from django.utils.translation import ugettext as _
 
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
-
 
 class SurchargeViesSet(viewsets.ModelViewSet):
     queryset = Surcharge.objects.all()
@@ -172,6 +174,7 @@ class FreightRateViesSet(PermissionClassByActionMixin,
     permission_classes = (IsAuthenticated, IsMasterOrAgent,)
     permission_classes_by_action = {
         'freight_rate_search_and_calculate': (IsAuthenticated, IsClientCompany,),
+        'freight_rate_search_stream': (IsAuthenticated, IsClientCompany,),
         'save_freight_rate': (IsAuthenticated, IsAgentCompany,),
     }
     filter_class = FreightRateFilterSet
@@ -197,7 +200,7 @@ class FreightRateViesSet(PermissionClassByActionMixin,
         )
         if self.action == 'list':
             return queryset.annotate(direction=Case(
-                When(origin__code__startswith=MAIN_COUNTRY_CODE, then=Value('export')),
+                When(origin__code__startswith=get_main_country_code(), then=Value('export')),
                 default=Value('import'),
                 output_field=CharField()
             ))
@@ -261,47 +264,36 @@ class FreightRateViesSet(PermissionClassByActionMixin,
         return Response(data=results, status=status.HTTP_201_CREATED)
 
     @action(methods=['post'], detail=True, url_path='save')
+    @transaction.atomic
     def save_freight_rate(self, request, *args, **kwargs):
         user = request.user
         freight_rate = self.get_object()
-        old_freight_rates = self.queryset.filter(company=user.get_company(),
-                                                 shipping_mode=freight_rate.shipping_mode,
-                                                 origin=freight_rate.origin,
-                                                 destination=freight_rate.destination,
-                                                 carrier=freight_rate.carrier,
-                                                 temporary=False,
-                                                 is_archived=False, )
+        lock_freight_rate_route(freight_rate)
+        old_rates = Rate.objects.filter(freight_rate__in=self.queryset.filter(
+            company=user.get_company(),
+            shipping_mode=freight_rate.shipping_mode,
+            origin=freight_rate.origin,
+            destination=freight_rate.destination,
+            carrier=freight_rate.carrier,
+            temporary=False,
+            is_archived=False,
+        ))
         shipping_mode = freight_rate.shipping_mode
 
         rates = freight_rate.rates.all()
         if shipping_mode.has_freight_containers:
             new_not_empty_rates = rates.filter(start_date__isnull=False)
-            for old_freight_rate in old_freight_rates:
-                for new_rate in new_not_empty_rates:
-                    if old_freight_rate.rates.filter(
-                            Q(
-                                Q(start_date__gt=new_rate.start_date, start_date__lte=new_rate.expiration_date),
-                                Q(expiration_date__gte=new_rate.start_date,
-                                  expiration_date__lt=new_rate.expiration_date),
-                                Q(start_date__lte=new_rate.start_date, expiration_date__gte=new_rate.expiration_date),
-                                Q(start_date__isnull=True),
-                                _connector='OR',
-                            ),
-                            container_type=new_rate.container_type,
-                    ).exists():
-                        return Response(status=status.HTTP_400_BAD_REQUEST)
+            conditions = [
+                Q(Q(validity__overlap=new_rate.validity) | Q(start_date__isnull=True),
+                  container_type=new_rate.container_type)
+                for new_rate in new_not_empty_rates
+            ]
+            if conditions and old_rates.filter(reduce(operator.or_, conditions)).exists():
+                return Response(status=status.HTTP_400_BAD_REQUEST)
         else:
             new_rate = rates.first()
-            for old_freight_rate in old_freight_rates:
-                if old_freight_rate.rates.filter(
-                        Q(
-                            Q(start_date__gt=new_rate.start_date, start_date__lte=new_rate.expiration_date),
-                            Q(expiration_date__gte=new_rate.start_date, expiration_date__lt=new_rate.expiration_date),
-                            Q(start_date__lte=new_rate.start_date, expiration_date__gte=new_rate.expiration_date),
-                            _connector='OR',
-                        )
-                ).exists():
-                    return Response(status=status.HTTP_400_BAD_REQUEST)
+            if old_rates.filter(validity__overlap=new_rate.validity).exists():
+                return Response(status=status.HTTP_400_BAD_REQUEST)
 
         freight_rate.temporary = False
         freight_rate.save()
@@ -317,7 +309,7 @@ class FreightRateViesSet(PermissionClassByActionMixin,
         data = serializer.data
         user = self.request.user
         port = Port.objects.get(id=data['origin'])
-        direction = 'export' if port.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+        direction = 'export' if port.code.startswith(get_main_country_code()) else 'import'
         location = data['origin'] if direction == 'export' else data['destination']
         start_date = date_format(data['start_date'])
         expiration_date = date_format(data['expiration_date'])
@@ -327,21 +319,9 @@ class FreightRateViesSet(PermissionClassByActionMixin,
             'location': location,
             'shipping_mode': data['shipping_mode'],
         }
-        start_date_fields = {
-            'start_date__lt': start_date,
-            'expiration_date__gte': start_date,
-        }
-        mid_date_field = {
-            'start_date__gte': start_date,
-            'expiration_date__lte': expiration_date,
-        }
-        end_date_fields = {
-            'start_date__lte': expiration_date,
-            'expiration_date__gt': expiration_date,
-        }
         surcharge = Surcharge.objects.filter(
             Q(**filter_fields),
-            Q(Q(**start_date_fields), Q(**end_date_fields), Q(**mid_date_field), _connector='OR'),
+            validity__overlap=get_validity_range(start_date, expiration_date),
             company=user.get_company(),
             temporary=False,
             is_archived=False,
@@ -358,47 +338,38 @@ class FreightRateViesSet(PermissionClassByActionMixin,
             return Response(data=[], status=status.HTTP_200_OK)
         serializer = FreightRateSearchSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        data = serializer.data
-
-        cargo_groups = data.get('cargo_groups')
-        container_type_ids_list = [group.get('container_type') for group in cargo_groups if group.get('container_type')]
-        date_from = date_format(data.get('date_from'))
-        date_to = date_format(data.get('date_to'))
-        freight_rates, shipping_mode = freight_rate_search(data)
-
-        client_platform_settings = ClientPlatformSetting.load()
-        number_of_results = client_platform_settings.number_of_results
-        calculate_fees = client_platform_settings.enable_booking_fee_payment
-        freight_rates = freight_rates.order_by('transit_time').distinct()[:number_of_results]
-
-        booking_fee, service_fee = get_fees(company, shipping_mode)
-        main_currency_code = Currency.objects.filter(is_main=True).first().code
-        results = []
-
-        for freight_rate in freight_rates:
-            freight_rate_dict = FreightRateSearchListSerializer(freight_rate).data
-            if container_type_ids_list:
-                condition = {} if not shipping_mode.has_freight_containers else {
-                    'container_type__id__in': container_type_ids_list}
-                expiration_date = freight_rate.rates.filter(**condition).aggregate(
-                    date=Min('expiration_date')).get('date').strftime('%d/%m/%Y')
-                freight_rate_dict['expiration_date'] = expiration_date
-
-            result = calculate_freight_rate_charges(freight_rate,
-                                                    freight_rate_dict,
-                                                    cargo_groups,
-                                                    shipping_mode,
-                                                    main_currency_code,
-                                                    date_from,
-                                                    date_to,
-                                                    container_type_ids_list,
-                                                    booking_fee=booking_fee,
-                                                    service_fee=service_fee,
-                                                    calculate_fees=calculate_fees, )
-
-            results.append(result)
-
-        return Response(data=results, status=status.HTTP_200_OK)
+        search = FreightRateSearch(serializer.data, company)
+
+        cursor = request.query_params.get('cursor')
+        page_size = request.query_params.get('page_size')
+        if cursor is None and page_size is None:
+            return Response(data=search.get_cached(search.get_results, 'results'), status=status.HTTP_200_OK)
+        page_size_serializer = FreightRateSearchPageSerializer(data={'page_size': page_size or DEFAULT_PAGE_SIZE})
+        page_size_serializer.is_valid(raise_exception=True)
+        page_size = page_size_serializer.validated_data['page_size']
+        page = search.get_cached(lambda: search.get_page(cursor, page_size), 'page', cursor, page_size)
+        return Response(data=page, status=status.HTTP_200_OK)
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='search/stream',
+            renderer_classes=(NDJSONRenderer, EventStreamRenderer, ))
+    def freight_rate_search_stream(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        company = request.user.get_company()
+        results = iter(())
+        if not company.disabled:
+            serializer = FreightRateSearchSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            search = FreightRateSearch(serializer.data, company)
+            results = search.iterate_cached_results()
+        response = StreamingHttpResponse(
+            (renderer.render(result) for result in results),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 class RateViesSet(mixins.CreateModelMixin,
@@ -443,6 +414,11 @@ class QuoteViesSet(PermissionClassByActionMixin,
         'withdraw_quote': (IsAuthenticated, IsAgentCompany,),
         'archive_quote': (IsAuthenticated, IsClientCompany),
     }
+    query_budget_by_action = {
+        'list': 30,
+        'retrieve': 30,
+        'get_agent_quotes_list': 40,
+    }
     filter_class = QuoteFilterSet
     filter_backends = (QuoteOrderingFilterBackend, rest_framework.DjangoFilterBackend,)
 
@@ -481,7 +457,7 @@ class QuoteViesSet(PermissionClassByActionMixin,
                                         statuses__status=Status.SUBMITTED,
                                         freight_rates__company=company)
 
-        number_of_bids = ClientPlatformSetting.load().number_of_bids
+        number_of_bids = get_setting(ClientPlatformSetting).number_of_bids
         queryset = queryset.annotate(bids_count=Count('statuses')).filter(bids_count__lt=number_of_bids)
 
         not_submitted_air = queryset.filter(shipping_mode__shipping_type__title='air').exclude(
@@ -514,7 +490,7 @@ class QuoteViesSet(PermissionClassByActionMixin,
     @action(methods=['post'], detail=True, url_path='submit')
     def submit_quote(self, request, *args, **kwargs):
         quote = self.get_object()
-        number_of_bids = ClientPlatformSetting.load().number_of_bids
+        number_of_bids = get_setting(ClientPlatformSetting).number_of_bids
         if quote.statuses.filter(status=Status.SUBMITTED).count() < number_of_bids:
             try:
                 with transaction.atomic():
@@ -525,12 +501,12 @@ class QuoteViesSet(PermissionClassByActionMixin,
                     freight_rate = FreightRate.objects.filter(id=data.get('freight_rate')).first()
                     freight_rate_dict = FreightRateSearchListSerializer(freight_rate).data
                     booking_fee, service_fee = get_fees(freight_rate.company, freight_rate.shipping_mode)
-                    calculate_fees = ClientPlatformSetting.load().enable_booking_fee_payment
+                    calculate_fees = get_setting(ClientPlatformSetting).enable_booking_fee_payment
                     cargo_groups = CargoGroupSerializer(quote.quote_cargo_groups, many=True).data
                     container_type_ids_list = [
                         group.get('container_type') for group in cargo_groups if group.get('container_type')
                     ]
-                    main_currency_code = Currency.objects.filter(is_main=True).first().code
+                    main_currency_code = get_main_currency_code()
 
                     if container_type_ids_list:
                         condition = {} if not freight_rate.shipping_mode.has_freight_containers else {
@@ -672,12 +648,12 @@ class BookingViesSet(PermissionClassByActionMixin,
                 self.perform_create(cargo_group_serializer)
 
         freight_rate_dict = FreightRateSearchListSerializer(instance.freight_rate).data
-        main_currency_code = Currency.objects.filter(is_main=True).first().code
+        main_currency_code = get_main_currency_code()
         container_type_ids_list = [
             group.get('container_type') for group in cargo_groups if group.get('container_type')
         ]
         booking_fee, service_fee = get_fees(company, instance.freight_rate.shipping_mode)
-        calculate_fees = ClientPlatformSetting.load().enable_booking_fee_payment
+        calculate_fees = get_setting(ClientPlatformSetting).enable_booking_fee_payment
         try:
             if container_type_ids_list:
                 condition = {} if not instance.freight_rate.shipping_mode.has_freight_containers else {
@@ -706,16 +682,14 @@ class BookingViesSet(PermissionClassByActionMixin,
                     instance.save()
 
                     if not instance.is_paid:
-                        bank_account = BankAccount.objects.filter(is_default=True, is_platforms=True).first()
-                        pix_settings = bank_account.pix_api
-                        txid = instance.transactions.values_list('txid', flat=True).first()
                         new_charge = new_charges.get('pay_to_book').get('pay_to_book')
-                        instance.transactions.filter(booking=instance.id, status=Transaction.OPENED).update(charge=new_charge)
-                        change_charge.delay(base_url=pix_settings.base_url, new_amount=new_charge,
-                                            developer_key=pix_settings.developer_key, txid=txid,
-                                            is_prod=pix_settings.is_prod, booking_id=instance.id,
-                                            token_uri=pix_settings.token_uri, client_id=pix_settings.client_id,
-                                            client_secret=pix_settings.client_secret, basic_token=pix_settings.basic_token,)
+                        instance.transactions.filter(
+                            status__in=(Transaction.ISSUING, Transaction.OPENED),
+                        ).update(charge=new_charge)
+                        txid = instance.transactions.filter(status=Transaction.OPENED) \
+                            .values_list('txid', flat=True).first()
+                        if txid:
+                            change_charge.delay(new_amount=new_charge, txid=txid, booking_id=instance.id)
             except ValueError:
                 return Response(
                     data={'error': 'could not change charge because of error.'},
@@ -798,6 +772,11 @@ class OperationViewSet(PermissionClassByActionMixin,
     permission_classes_by_action = {
         'complete_operation': (IsAuthenticated, IsAgentCompany,),
         'leave_review': (IsAuthenticated, IsClientCompany,),
+        'payment': (IsAuthenticated, IsClientCompany,),
+    }
+    query_budget_by_action = {
+        'list': 40,
+        'retrieve': 60,
     }
     filter_class = OperationFilterSet
     filter_backends = (OperationOrderingFilterBackend, rest_framework.DjangoFilterBackend,)
@@ -815,7 +794,9 @@ class OperationViewSet(PermissionClassByActionMixin,
                 is_assigned=True,
                 is_paid=True,
             )
-        return apply_operation_select_prefetch_related(queryset)
+        return apply_operation_select_prefetch_related(queryset,
+                                                       user=self.request.user,
+                                                       detailed=self.action == 'retrieve')
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -915,7 +896,7 @@ class OperationViewSet(PermissionClassByActionMixin,
         freight_rate_dict = FreightRateSearchListSerializer(operation.freight_rate).data
         cargo_groups = data.get('cargo_groups')
         container_type_ids_list = [group.get('container_type') for group in cargo_groups if group.get('container_type')]
-        main_currency_code = Currency.objects.filter(is_main=True).first().code
+        main_currency_code = get_main_currency_code()
         number_of_documents = data.get('number_of_documents')
         if container_type_ids_list:
             condition = {} if not operation.freight_rate.shipping_mode.has_freight_containers else {
@@ -945,6 +926,38 @@ class OperationViewSet(PermissionClassByActionMixin,
         request.data['reviewer'] = request.user.id
         return Response(request.data, status=status.HTTP_201_CREATED)
 
+    @action(methods=['get', 'post'], detail=True, url_path='payment')
+    def payment(self, request, *args, **kwargs):
+        """
+        Returns payment status of booking with qr code of its charge, post issues a new charge
+        if the last one failed or expired.
+        """
+
+        bookings = Booking.objects.filter(
+            original_booking__isnull=True,
+            client_contact_person__companies=request.user.get_company(),
+        )
+        if request.method == 'POST':
+            with transaction.atomic():
+                booking = get_object_or_404(bookings.select_for_update(of=('self', )), id=kwargs['pk'])
+                last_status, last_charge = booking.transactions.order_by('-id') \
+                    .values_list('status', 'charge').first() or (None, None)
+                if booking.is_paid or booking.status != Booking.PENDING or \
+                        last_status not in (Transaction.FAILED, Transaction.EXPIRED):
+                    return Response(
+                        data={'error': _('Charge of this booking can not be issued again.')},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                if not last_charge or last_charge <= 0:
+                    return Response(
+                        data={'error': _('Charge of this booking has no amount to pay.')},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                create_charge_transaction(booking, last_charge)
+        else:
+            booking = get_object_or_404(bookings.only('id'), id=kwargs['pk'])
+        return Response(data=get_payment_status(booking.id), status=status.HTTP_200_OK)
+
 
 class OperationBillingViewSet(mixins.ListModelMixin,
                               mixins.RetrieveModelMixin,
@@ -1007,7 +1020,7 @@ class TrackView(views.APIView):
         booking_number = data.get('airWaybillNumber')
         booking = Booking.objects.filter(shipment_details__booking_number=booking_number).first()
         if booking:
-            direction = 'export' if booking.freight_rate.origin.code.startswith(MAIN_COUNTRY_CODE) else 'import'
+            direction = 'export' if booking.freight_rate.origin.code.startswith(get_main_country_code()) else 'import'
             shipment_details = booking.shipment_details.first()
             origin_and_destination = data.get('originAndDestination')
             event = data.get('events')[0]
@@ -1094,6 +1107,8 @@ class PixApiView(views.APIView):
             PaymentData.objects.create(data=data)
         except Exception:
             PaymentData.objects.create(data=str(data))
+        if txids := get_webhook_txids(data):
+            reconcile_pix_transactions.delay(txids)
         return Response(status=status.HTTP_201_CREATED)
 
 
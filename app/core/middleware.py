@@ -0,0 +1,134 @@
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('acemaven.query_budget')
+
+APP_DIR = str(Path(__file__).resolve().parent.parent)
+MIDDLEWARE_FILE = str(Path(__file__).resolve())
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUES_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def get_query_shape(sql):
+    """
+    Returns sql with literals and parameter lists collapsed, so the same query with different
+    parameters, like the ones produced by N+1 access, has the same shape.
+    """
+
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_LITERAL_RE.sub('?', sql)
+    return VALUES_LIST_RE.sub('(...)', sql)
+
+
+def get_call_site():
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename != MIDDLEWARE_FILE:
+            return f'{filename[len(APP_DIR) + 1:]}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class QueryCollector:
+    """
+    Database execute wrapper, that records number, time, shapes and call sites of executed queries.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.shapes = Counter()
+        self.call_sites = dict()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            shape = get_query_shape(sql)
+            self.shapes[shape] += 1
+            if shape not in self.call_sites:
+                self.call_sites[shape] = get_call_site()
+
+    def get_duplicates(self):
+        return [
+            {'count': count, 'sql': shape, 'call_site': self.call_sites[shape]}
+            for shape, count in self.shapes.most_common() if count > 1
+        ]
+
+
+class QueryBudgetMiddleware:
+    """
+    Class, that provides sql instrumentation of requests: number of queries, total sql time and
+    duplicated query shapes are added to response headers and logged. Views may define a
+    'query_budget' or 'query_budget_by_action' variable, exceeding it is logged as a warning
+    or raises QueryBudgetExceeded, if QUERY_BUDGET_RAISE setting is enabled (e.g. in tests).
+    Used only if QUERY_BUDGET_ENABLED setting is enabled, DEBUG by default.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+
+        duplicates = collector.get_duplicates()
+        response['X-Query-Count'] = collector.count
+        response['X-Query-Time'] = f'{collector.duration * 1000:.2f}'
+        response['X-Query-Duplicates'] = sum(duplicate['count'] - 1 for duplicate in duplicates)
+
+        budget = getattr(request, 'query_budget', None)
+        log_data = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': getattr(request, 'query_budget_view', None),
+            'query_count': collector.count,
+            'query_time_ms': round(collector.duration * 1000, 2),
+            'query_budget': budget,
+            'duplicates': duplicates,
+        }
+        if budget is not None and collector.count > budget:
+            message = f'{request.method} {request.path} executed {collector.count} queries, budget is {budget}.'
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'query_budget': log_data})
+        else:
+            logger.debug(f'{request.method} {request.path} executed {collector.count} queries.',
+                         extra={'query_budget': log_data})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        if view_class is None:
+            return None
+        request.query_budget_view = view_class.__name__
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        budget_by_action = getattr(view_class, 'query_budget_by_action', {})
+        request.query_budget = budget_by_action.get(action, getattr(view_class, 'query_budget', None))
+        return None
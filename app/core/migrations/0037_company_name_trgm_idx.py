@@ -0,0 +1,18 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_merge_20210726_1913'),
+        ('handling', '0052_trigram_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS core_company_name_trgm_idx ON core_company USING gin (UPPER(name) gin_trgm_ops);',
+            'DROP INDEX IF EXISTS core_company_name_trgm_idx;',
+        ),
+    ]
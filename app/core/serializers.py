@@ -11,6 +11,7 @@ from app.core.utils import process_sign_up_token, get_average_company_rating
 from app.core.validators import PasswordValidator
 from app.handling.models import GeneralSetting
 from app.handling.serializers import ReleaseTypeSerializer, PackagingTypeBaseSerializer, ContainerTypesBaseSerializer
+from app.handling.utils import get_setting
 
 
 class ReviewBaseSerializer(serializers.ModelSerializer):
@@ -95,7 +96,7 @@ class CompanyReviewSerializer(serializers.ModelSerializer):
         )
 
     def get_name(self, obj):
-        general_settings = GeneralSetting.load()
+        general_settings = get_setting(GeneralSetting)
         show_freight_forwarder_name = general_settings.show_freight_forwarder_name
         return obj.name if show_freight_forwarder_name == GeneralSetting.ALL else ''
 
@@ -0,0 +1,60 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, RequestFactory, override_settings
+
+from app.booking.views import OperationViewSet, QuoteViesSet
+from app.core.middleware import QueryBudgetMiddleware, QueryBudgetExceeded
+from app.core.views import CompanyEditViewSet
+
+
+def execute_queries(number):
+    def get_response(request):
+        with connection.cursor() as cursor:
+            for _ in range(number):
+                cursor.execute('SELECT 1')
+        return HttpResponse()
+    return get_response
+
+
+@override_settings(QUERY_BUDGET_ENABLED=True, QUERY_BUDGET_RAISE=True)
+class QueryBudgetMiddlewareTestCase(TestCase):
+    """
+    Query count of requests is reported in headers and views exceeding their query budget fail.
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get_response(self, view, queries_number, action='list'):
+        middleware = QueryBudgetMiddleware(execute_queries(queries_number))
+        request = self.factory.get('/')
+        middleware.process_view(request, view.as_view({'get': action}), (), {})
+        return middleware(request)
+
+    def test_query_count_headers(self):
+        response = self.get_response(OperationViewSet, 3)
+        self.assertEqual(response['X-Query-Count'], '3')
+        self.assertEqual(response['X-Query-Duplicates'], '2')
+        self.assertIn('X-Query-Time', response)
+
+    def test_budget_exceeded(self):
+        for view, action, budget in (
+            (OperationViewSet, 'list', OperationViewSet.query_budget_by_action['list']),
+            (QuoteViesSet, 'list', QuoteViesSet.query_budget_by_action['list']),
+            (CompanyEditViewSet, 'get_reviews', CompanyEditViewSet.query_budget_by_action['get_reviews']),
+        ):
+            with self.subTest(view=view.__name__, action=action):
+                self.assertEqual(self.get_response(view, budget, action=action)['X-Query-Count'], str(budget))
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.get_response(view, budget + 1, action=action)
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_budget_exceeded_logged(self):
+        with self.assertLogs('acemaven.query_budget', level='WARNING'):
+            self.get_response(QuoteViesSet, QuoteViesSet.query_budget_by_action['list'] + 1)
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryBudgetMiddleware(execute_queries(1))
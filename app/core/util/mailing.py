@@ -0,0 +1,115 @@
+import logging
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import lru_cache
+
+from django.conf import settings
+from django.template.loader import get_template
+
+logger = logging.getLogger("acemaven.task.logging")
+
+EMAIL_TEMPLATE = 'core/emails_templates/index.html'
+
+SENT = 'sent'
+FAILED = 'failed'
+
+
+@lru_cache(maxsize=None)
+def get_email_template(template_name=EMAIL_TEMPLATE):
+    return get_template(template_name)
+
+
+def build_email(recipient, subject, text, context, template_name=EMAIL_TEMPLATE):
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = settings.EMAIL_HOST_USER
+    msg['To'] = recipient
+    msg.attach(MIMEText(text, 'plain'))
+    msg.attach(MIMEText(get_email_template(template_name).render(context), 'html'))
+    return msg
+
+
+class SMTPConnection:
+    """
+    Class, that provides an SMTP session reused for all messages sent by a worker process.
+    The session is opened lazily, checked with NOOP after being idle and reopened when
+    the server closed it or it reached the limit of messages per session.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.messages_sent = 0
+        self.last_used = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        connection = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        if settings.SMTP_USE_TLS:
+            connection.starttls()
+        if settings.EMAIL_HOST_USER:
+            connection.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+        self.connection = connection
+        self.messages_sent = 0
+        logger.debug(f'SMTP connection to {settings.SMTP_HOST}:{settings.SMTP_PORT} opened.')
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except smtplib.SMTPException:
+                self.connection.close()
+            except OSError:
+                pass
+        self.connection = None
+
+    def is_usable(self):
+        if self.connection is None or self.messages_sent >= settings.SMTP_MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if time.monotonic() - self.last_used < settings.SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, msg):
+        with self.lock:
+            for attempt in range(2):
+                if not self.is_usable():
+                    self.close()
+                    self.open()
+                try:
+                    self.connection.sendmail(settings.EMAIL_HOST_USER, [msg['To']], msg.as_string())
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    self.connection = None
+                    if attempt:
+                        raise
+            self.messages_sent += 1
+            self.last_used = time.monotonic()
+
+
+smtp_connection = SMTPConnection()
+
+
+def send_emails(messages):
+    """
+    Sends messages through the shared SMTP session, returns dict of recipient to delivery status.
+    A failure of one message does not stop sending of the others.
+    """
+
+    statuses = dict()
+    for msg in messages:
+        recipient = msg['To']
+        try:
+            smtp_connection.send(msg)
+        except (smtplib.SMTPException, OSError) as error:
+            statuses[recipient] = FAILED
+            logger.warning(f'Email to {recipient} has not been sent: {error.__class__.__name__} {error}')
+        else:
+            statuses[recipient] = SENT
+            logger.info(f'Email has been sent to {recipient}')
+    return statuses
@@ -1,7 +1,15 @@
 import json
+import logging
+import threading
+import zlib
 
 import requests
-from rest_framework import serializers
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from config import settings
+
+logger = logging.getLogger("acemaven.task.logging")
 
 result = [
     {'status': 'ATIVA', 'calendario': {'criacao': '2021-02-05T05:32:59.91-03:00', 'expiracao': '86400'},
@@ -68,35 +76,177 @@ result = [
 ]
 
 
-def get_credentials(token_uri, client_id, client_secret, basic_token):
-    response = requests.post(
-        f'{token_uri}',
-        headers={
-            'content-type': 'application/x-www-form-urlencoded',
-            'authorization': f'Basic {basic_token}',
-        },
-        data={
-            'grant_type': 'client_credentials',
-            'client_id': f'{client_id}',
-            'client_secret': f'{client_secret}',
-            'scope': 'cob.write cob.read pix.read pix.write',
-        }
-    )
-
-    if response.status_code == 200:
-        response_json = response.json()
-        return response_json.get('access_token')
-
-
-def get_qr_code(amount, txid, pix_key, qr_cob_uri, developer_key, token_uri, client_id, client_secret,
-                basic_token, is_prod=False):
-    token = get_credentials(token_uri, client_id, client_secret, basic_token)
-    response = requests.put(
-        f'{qr_cob_uri}{txid}?gw{"-dev" if not is_prod else ""}-app-key={developer_key}',
-        data=json.dumps({
+PIX_API_SCOPE = 'cob.write cob.read pix.read pix.write'
+PIX_CHARGE_EXPIRATION_SECONDS = 259200
+
+
+class PixApiError(Exception):
+    pass
+
+
+class PixApiUnavailable(PixApiError):
+    pass
+
+
+session_lock = threading.Lock()
+pix_session = None
+
+
+def get_pix_session():
+    """
+    Returns keep-alive session shared by all pix api clients of the process.
+    """
+
+    global pix_session
+    with session_lock:
+        if pix_session is None:
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=settings.PIX_API_POOL_SIZE)
+            pix_session = requests.Session()
+            pix_session.mount('http://', adapter)
+            pix_session.mount('https://', adapter)
+    return pix_session
+
+
+class CircuitBreaker:
+    """
+    Class, that provides a circuit breaker with state in the cache shared by all workers.
+    After failures_threshold consecutive failures the circuit is opened for reset_timeout seconds
+    and calls fail fast. After that the circuit is half open: a single call probes the api,
+    others fail fast while it runs, and the circuit is opened again at once if the probe fails.
+    """
+
+    def __init__(self, name, failures_threshold=None, reset_timeout=None):
+        self.failures_key = f'{name}:failures'
+        self.open_key = f'{name}:open'
+        self.half_open_key = f'{name}:half_open'
+        self.probe_key = f'{name}:probe'
+        self.failures_threshold = failures_threshold or settings.PIX_API_CIRCUIT_FAILURES
+        self.reset_timeout = reset_timeout or settings.PIX_API_CIRCUIT_RESET_TIMEOUT
+
+    def is_open(self):
+        state = cache.get_many((self.open_key, self.half_open_key))
+        if state.get(self.open_key):
+            return True
+        if state.get(self.half_open_key):
+            return not cache.add(self.probe_key, True, self.reset_timeout)
+        return False
+
+    def open(self):
+        cache.set(self.open_key, True, self.reset_timeout)
+        cache.set(self.half_open_key, True, None)
+        cache.delete_many((self.failures_key, self.probe_key))
+
+    def record_success(self):
+        keys = list(cache.get_many((self.failures_key, self.half_open_key, self.probe_key)))
+        if keys:
+            cache.delete_many(keys)
+
+    def record_failure(self):
+        if cache.get(self.half_open_key):
+            self.open()
+            logger.warning(f'Pix api circuit {self.open_key} opened again after a failed probe.')
+            return
+        cache.add(self.failures_key, 0, self.reset_timeout)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+        if failures >= self.failures_threshold:
+            self.open()
+            logger.warning(f'Pix api circuit {self.open_key} opened after {failures} failures.')
+
+
+class PixApiClient:
+    """
+    Client of the Pix bank api. Access token is cached per api settings until it expires,
+    connections are kept alive in a pooled session and requests are bounded by timeouts
+    and a circuit breaker, urls are taken from the api settings, so the client can be pointed
+    to a mock bank server.
+    """
+
+    def __init__(self, pix_settings, timeout=None):
+        self.pix_settings = pix_settings
+        self.timeout = timeout or (settings.PIX_API_CONNECT_TIMEOUT, settings.PIX_API_READ_TIMEOUT)
+        self.session = get_pix_session()
+        key = zlib.crc32(f'{pix_settings.id}:{pix_settings.token_uri}:{pix_settings.client_id}'.encode())
+        self.token_key = f'pix_api_token:{key}'
+        self.circuit_breaker = CircuitBreaker(f'pix_api_circuit:{key}')
+
+    def send(self, method, url, **kwargs):
+        if self.circuit_breaker.is_open():
+            raise PixApiUnavailable('Pix api circuit is open.')
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as error:
+            self.circuit_breaker.record_failure()
+            raise PixApiUnavailable(f'Request error - {error.__class__.__name__}') from error
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+
+    def get_token(self, refresh=False):
+        if not refresh and (token := cache.get(self.token_key)):
+            return token
+        response = self.send(
+            'post',
+            self.pix_settings.token_uri,
+            headers={
+                'content-type': 'application/x-www-form-urlencoded',
+                'authorization': f'Basic {self.pix_settings.basic_token}',
+            },
+            data={
+                'grant_type': 'client_credentials',
+                'client_id': f'{self.pix_settings.client_id}',
+                'client_secret': f'{self.pix_settings.client_secret}',
+                'scope': PIX_API_SCOPE,
+            },
+        )
+        try:
+            data = response.json()
+            token = data['access_token']
+            expires_in = int(data.get('expires_in') or settings.PIX_API_TOKEN_DEFAULT_EXPIRATION)
+        except (ValueError, KeyError, TypeError):
+            raise PixApiError(f'Pix api token request failed with status {response.status_code}.')
+        timeout = expires_in - settings.PIX_API_TOKEN_EXPIRATION_MARGIN
+        if timeout > 0:
+            cache.set(self.token_key, token, timeout)
+        return token
+
+    def request(self, method, url, data=None):
+        """
+        Returns (json, status code) of an authorized api request, the request is repeated once
+        with a new token if the cached one was revoked.
+        """
+
+        params = {f'gw{"-dev" if not self.pix_settings.is_prod else ""}-app-key': self.pix_settings.developer_key}
+        for attempt in range(2):
+            response = self.send(
+                method,
+                url,
+                params=params,
+                data=json.dumps(data) if data is not None else None,
+                headers={
+                    'content-type': 'application/json',
+                    'authorization': f'Bearer {self.get_token(refresh=bool(attempt))}',
+                },
+            )
+            if response.status_code != 401:
+                break
+        try:
+            return response.json(), response.status_code
+        except ValueError:
+            return "Invalid json", response.status_code
+
+    def create_charge(self, txid, amount):
+        """
+        Creates an immediate charge and returns its qr code.
+        """
+
+        data, status_code = self.request('put', f'{self.pix_settings.qr_cob_uri}{txid}', {
             "calendario": {
-                "criacao": "2021-2-1T13:09:39.9200140000",
-                "expiracao": "259200"
+                "expiracao": f"{PIX_CHARGE_EXPIRATION_SECONDS}"
             },
             "txid": f"{txid}",
             "devedor": {
@@ -106,48 +256,19 @@ def get_qr_code(amount, txid, pix_key, qr_cob_uri, developer_key, token_uri, cli
             "valor": {
                 "original": f"{amount}"
             },
-            "chave": f"{pix_key}",
+            "chave": f"{self.pix_settings.bank_account.pix_key}",
             "solicitacaoPagador": "Cobrança dos serviços prestados."
-        }),
-        headers={
-            'content-type': 'application/json',
-            'authorization': f'Bearer {token}'}
-    )
-    if qr_code := response.json().get('textoImagemQRcode'):
-        return qr_code
-    else:
-        raise serializers.ValidationError({'error': 'Some issues occurred during payment process, please contact support or retry.'})
-
-
-def change_amount(base_url, new_amount, developer_key, txid, is_prod, token_uri, client_id, client_secret, basic_token):
-    token = get_credentials(token_uri, client_id, client_secret, basic_token)
-    response = requests.patch(
-        f'{base_url}{txid}?gw{"-dev" if not is_prod else ""}-app-key={developer_key}',
-        data=json.dumps({
+        })
+        if isinstance(data, dict) and (qr_code := data.get('textoImagemQRcode')):
+            return qr_code
+        raise PixApiError(f'Pix charge [{txid}] creation failed with status {status_code}.')
+
+    def review_charge(self, txid):
+        return self.request('get', f'{self.pix_settings.base_url}{txid}')
+
+    def change_charge_amount(self, txid, amount):
+        return self.request('patch', f'{self.pix_settings.base_url}{txid}', {
             "valor": {
-                "original": f"{new_amount}"
-            }}),
-        headers={
-            'content-type': 'application/json',
-            'authorization': f'Bearer {token}'}
-    )
-    try:
-        data = response.json()
-    except ValueError:
-        data = "Invalid json"
-    return data, response.status_code
-
-
-def review_payment(base_url, developer_key, txid, token_uri, client_id, client_secret, basic_token, is_prod=False):
-    token = get_credentials(token_uri, client_id, client_secret, basic_token)
-    response = requests.get(
-        f'{base_url}{txid}?gw{"-dev" if not is_prod else ""}-app-key={developer_key}',
-        headers={
-            'content-type': 'application/json',
-            'authorization': f'Bearer {token}'}
-    )
-    try:
-        data = response.json()
-    except ValueError:
-        data = "Invalid json"
-    return data, response.status_code
+                "original": f"{amount}"
+            }
+        })
@@ -4,7 +4,7 @@ import string
 from django.contrib.auth import get_user_model
 from django.db.models import Avg
 
-from app.core.models import Role, SignUpToken, EmailNotificationSetting
+from app.core.models import Role, SignUpToken, EmailNotificationSetting, Review
 from app.core.tasks import send_registration_email
 
 
@@ -39,3 +39,11 @@ def choice_to_value_name(choices):
 def get_average_company_rating(company):
     average_rating = company.get_reviews().aggregate(average_rating=Avg('rating')).get('average_rating')
     return average_rating
+
+
+def get_average_companies_ratings(companies):
+    ratings = Review.objects.filter(
+        operation__agent_contact_person__companies__in=companies,
+        approved=True,
+    ).values('operation__agent_contact_person__companies').annotate(average_rating=Avg('rating'))
+    return {rating['operation__agent_contact_person__companies']: rating['average_rating'] for rating in ratings}
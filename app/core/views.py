@@ -47,6 +47,9 @@ class CompanyEditViewSet(PermissionClassByActionMixin,
         'get_reviews': (IsAuthenticated, IsClientCompany, ),
         'get_partners': (IsAuthenticated, IsClientCompany, ),
     }
+    query_budget_by_action = {
+        'get_reviews': 20,
+    }
 
     def get_queryset(self):
         queryset = self.queryset
@@ -5,3 +5,6 @@ from django.utils.translation import ugettext_lazy as _
 class HandlingConfig(AppConfig):
     name = 'app.handling'
     verbose_name = _("Handling")
+
+    def ready(self):
+        import app.handling.signals
@@ -1,8 +1,40 @@
 import django_filters
+from django_filters.constants import EMPTY_VALUES
+from rest_framework import filters
 
 from app.handling.models import Carrier, Port
 
 
+class SearchMatchFilter(django_filters.CharFilter):
+    """
+    Class, that provides filtering by ids of records matching the value in search_class,
+    so the related table is searched by its trigram indexes instead of a scan of the join.
+    """
+
+    def __init__(self, search_class, *args, **kwargs):
+        self.search_class = search_class
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        return qs.filter(**{f'{self.field_name}__in': self.search_class(value).get_ids()})
+
+
+class TrigramSearchFilterBackend(filters.BaseFilterBackend):
+    """
+    Class, that provides ranked search of list by 'search' query parameter with search_class of the view.
+    """
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.search_param, '').strip()
+        if not value:
+            return queryset
+        return view.search_class(value, queryset).search()
+
+
 class CarrierFilterSet(django_filters.FilterSet):
     shipping_type = django_filters.CharFilter(field_name='shipping_type__title')
 
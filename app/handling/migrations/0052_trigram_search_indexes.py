@@ -0,0 +1,32 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Indexes are built on upper case values, which icontains, istartswith and the trigram
+# similarity of PortSearch and CarrierSearch are compiled to.
+TRIGRAM_INDEXES = (
+    ('handling_port_code_trgm_idx', 'handling_port', 'code'),
+    ('handling_port_iata_trgm_idx', 'handling_port', 'iata'),
+    ('handling_port_name_trgm_idx', 'handling_port', 'name'),
+    ('handling_carrier_title_trgm_idx', 'handling_carrier', 'title'),
+    ('handling_carrier_scac_trgm_idx', 'handling_carrier', 'scac'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handling', '0051_merge_0050_auto_20210426_1640_0050_auto_20210515_0840'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        *[
+            migrations.RunSQL(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}) gin_trgm_ops);',
+                f'DROP INDEX IF EXISTS {name};',
+            )
+            for name, table, column in TRIGRAM_INDEXES
+        ],
+    ]
@@ -0,0 +1,89 @@
+import operator
+from functools import reduce
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Case, When, Value, FloatField, Q
+from django.db.models.functions import Upper
+
+from app.core.models import Company
+from app.handling.models import Port, Carrier
+
+SEARCH_MIN_FUZZY_LENGTH = 3
+
+
+class TrigramSearch:
+    """
+    Class, that provides ranked search over text fields backed by trigram GIN indexes on their
+    upper case values. Exact matches go first, then prefix and substring matches, misspelled
+    values are matched by similarity of fuzzy fields.
+    """
+
+    model = None
+    fields = ()
+    fuzzy_fields = ()
+    ordering = ()
+
+    def __init__(self, value, queryset=None):
+        self.value = ' '.join(str(value).split()).upper()
+        self.queryset = self.model.objects.all() if queryset is None else queryset
+
+    def is_fuzzy(self):
+        return bool(self.fuzzy_fields) and len(self.value) >= SEARCH_MIN_FUZZY_LENGTH
+
+    def get_queryset(self, fuzzy=False):
+        condition = Q()
+        for field in self.fields:
+            condition |= Q(**{f'{field}__icontains': self.value})
+        queryset = self.queryset
+        if fuzzy:
+            queryset = queryset.annotate(**{f'{field}_search': Upper(field) for field in self.fuzzy_fields})
+            for field in self.fuzzy_fields:
+                condition |= Q(**{f'{field}_search__trigram_similar': self.value})
+        return queryset.filter(condition)
+
+    def get_rank(self, fuzzy=False):
+        rank = Case(
+            *[When(**{f'{field}__iexact': self.value}, then=Value(3.0)) for field in self.fields],
+            *[When(**{f'{field}__istartswith': self.value}, then=Value(2.0)) for field in self.fields],
+            *[When(**{f'{field}__icontains': self.value}, then=Value(1.0)) for field in self.fields],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        if fuzzy:
+            rank = reduce(operator.add, [
+                TrigramSimilarity(f'{field}_search', self.value) for field in self.fuzzy_fields
+            ], rank)
+        return rank
+
+    def search(self):
+        fuzzy = self.is_fuzzy()
+        return self.get_queryset(fuzzy).annotate(search_rank=self.get_rank(fuzzy)) \
+            .order_by('-search_rank', *self.ordering)
+
+    def get_ids(self):
+        """
+        Returns subquery of ids of records containing the value, used by list filters.
+        """
+
+        return self.get_queryset().values('id')
+
+
+class PortSearch(TrigramSearch):
+    model = Port
+    fields = ('code', 'iata', 'name')
+    fuzzy_fields = ('name',)
+    ordering = ('code',)
+
+
+class CarrierSearch(TrigramSearch):
+    model = Carrier
+    fields = ('title', 'scac')
+    fuzzy_fields = ('title',)
+    ordering = ('title',)
+
+
+class CompanySearch(TrigramSearch):
+    model = Company
+    fields = ('name',)
+    fuzzy_fields = ('name',)
+    ordering = ('name',)
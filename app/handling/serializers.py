@@ -1,18 +1,13 @@
-from django.db.utils import ProgrammingError
 from django.utils import timezone
 
 from rest_framework import serializers
 
 from app.handling.models import Carrier, Port, ShippingMode, ShippingType, ContainerType, Currency, PackagingType, \
     ReleaseType, ExchangeRate, BillingExchangeRate
+from app.handling.spatial import get_point, NEAREST_PORTS_LIMIT, MAX_NEAREST_PORTS_LIMIT, MAX_WITHIN_PORTS_LIMIT, \
+    MAX_RADIUS_KM
+from app.handling.utils import invalidate_billing_exchange_rates, get_main_country_code
 from app.booking.models import AdditionalSurcharge
-from app.location.models import Country
-
-
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
 
 
 class PackagingTypeBaseSerializer(serializers.ModelSerializer):
@@ -85,7 +80,41 @@ class PortSerializer(serializers.ModelSerializer):
         )
 
     def get_is_local(self, obj):
-        return True if obj.code.startswith(MAIN_COUNTRY_CODE) else False
+        main_country_code = self.context.get('main_country_code') or get_main_country_code()
+        return True if obj.code.startswith(main_country_code) else False
+
+
+class PortDistanceSerializer(PortSerializer):
+    distance = serializers.SerializerMethodField()
+
+    class Meta(PortSerializer.Meta):
+        fields = PortSerializer.Meta.fields + (
+            'distance',
+        )
+
+    def get_distance(self, obj):
+        return round(obj.distance.km, 3)
+
+
+class PortNearestSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+    port = serializers.PrimaryKeyRelatedField(queryset=Port.objects.filter(coordinates__isnull=False), required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_NEAREST_PORTS_LIMIT, default=NEAREST_PORTS_LIMIT)
+
+    def validate(self, attrs):
+        if port := attrs.get('port'):
+            attrs['point'] = port.coordinates
+        elif attrs.get('latitude') is not None and attrs.get('longitude') is not None:
+            attrs['point'] = get_point(attrs['latitude'], attrs['longitude'])
+        else:
+            raise serializers.ValidationError({'error': 'Port or latitude and longitude are required.'})
+        return attrs
+
+
+class PortWithinSerializer(PortNearestSerializer):
+    radius = serializers.FloatField(min_value=0, max_value=MAX_RADIUS_KM)
+    limit = serializers.IntegerField(min_value=1, max_value=MAX_WITHIN_PORTS_LIMIT, default=MAX_WITHIN_PORTS_LIMIT)
 
 
 class ShippingModeBaseSerializer(serializers.ModelSerializer):
@@ -194,6 +223,7 @@ class BillingExchangeRateBaseSerializer(serializers.ModelSerializer):
         rates = [{**item, **{'billing_exchange_rate': billing_exchange_rate}} for item in rates]
         new_rates = [ExchangeRate(**fields) for fields in rates]
         ExchangeRate.objects.bulk_create(new_rates)
+        invalidate_billing_exchange_rates(company.id)
         return billing_exchange_rate
 
 
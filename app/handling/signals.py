@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from app.handling.models import ExchangeRate, BillingExchangeRate, ClientPlatformSetting, GeneralSetting, \
+    AirTrackingSetting, SeaTrackingSetting, Currency
+from app.handling.utils import invalidate_platform_exchange_rates, invalidate_billing_exchange_rates, \
+    invalidate_settings
+from app.location.models import Country
+
+
+def invalidate_billing_exchange_rates_of(billing_exchange_rate_id):
+    company_id = BillingExchangeRate.objects.filter(
+        id=billing_exchange_rate_id,
+    ).values_list('company_id', flat=True).first()
+    if company_id:
+        invalidate_billing_exchange_rates(company_id)
+
+
+# Exchange rates signals
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_exchange_rates(sender, instance, *args, **kwargs):
+    if instance.is_platforms:
+        transaction.on_commit(invalidate_platform_exchange_rates)
+    if instance.billing_exchange_rate_id:
+        if ExchangeRate.billing_exchange_rate.is_cached(instance):
+            company_id = instance.billing_exchange_rate.company_id
+            transaction.on_commit(lambda: invalidate_billing_exchange_rates(company_id))
+        else:
+            billing_exchange_rate_id = instance.billing_exchange_rate_id
+            transaction.on_commit(lambda: invalidate_billing_exchange_rates_of(billing_exchange_rate_id))
+
+
+@receiver(post_save, sender=BillingExchangeRate)
+@receiver(post_delete, sender=BillingExchangeRate)
+def invalidate_company_billing_exchange_rates(sender, instance, *args, **kwargs):
+    company_id = instance.company_id
+    transaction.on_commit(lambda: invalidate_billing_exchange_rates(company_id))
+
+
+# Settings registry signals
+@receiver(post_save, sender=ClientPlatformSetting)
+@receiver(post_save, sender=GeneralSetting)
+@receiver(post_save, sender=AirTrackingSetting)
+@receiver(post_save, sender=SeaTrackingSetting)
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+def invalidate_settings_registry(sender, *args, **kwargs):
+    transaction.on_commit(invalidate_settings)
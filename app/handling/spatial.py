@@ -0,0 +1,84 @@
+import math
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.db.models import Func, Value, FloatField
+
+from app.handling.models import Port
+
+NEAREST_PORTS_LIMIT = 10
+MAX_NEAREST_PORTS_LIMIT = 50
+MAX_WITHIN_PORTS_LIMIT = 200
+MAX_RADIUS_KM = 1000
+NEAREST_CANDIDATES_FACTOR = 4
+MERIDIAN_DEGREE_KM = 110.5
+
+
+class KNNDistance(Func):
+    """
+    Planar distance of the '<->' operator, ordering by it is served by the GiST index of the geometry.
+    """
+
+    arg_joiner = ' <-> '
+    template = '(%(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, point, **extra):
+        super().__init__(expression, Value(point, output_field=GeometryField(srid=point.srid)), **extra)
+
+
+def get_point(latitude, longitude):
+    return Point(float(longitude), float(latitude), srid=4326)
+
+
+def get_radius_degrees(point, radius):
+    """
+    Returns distance in degrees covering radius in km around point, used to prefilter by the index.
+    """
+
+    latitude = min(abs(point.y) + radius / MERIDIAN_DEGREE_KM, 89.0)
+    return radius / (MERIDIAN_DEGREE_KM * math.cos(math.radians(latitude)))
+
+
+def filter_ports_within(queryset, point, radius):
+    return queryset.filter(
+        coordinates__dwithin=(point, get_radius_degrees(point, radius)),
+        coordinates__distance_lte=(point, D(km=radius)),
+    )
+
+
+def get_ports_within(point, radius, queryset=None):
+    """
+    Returns ports within radius in km around point with distance, nearest first.
+    """
+
+    queryset = Port.objects.all() if queryset is None else queryset
+    return filter_ports_within(queryset, point, radius).annotate(distance=Distance('coordinates', point)) \
+        .order_by('distance')
+
+
+def get_nearest_ports(point, limit=NEAREST_PORTS_LIMIT, queryset=None):
+    """
+    Returns ports nearest to point with distance. Candidates are taken in the index order of planar
+    distance and ordered by distance on the sphere.
+    """
+
+    queryset = Port.objects.all() if queryset is None else queryset
+    queryset = queryset.filter(coordinates__isnull=False)
+    candidates = queryset.order_by(KNNDistance('coordinates', point)).values('id')[:limit * NEAREST_CANDIDATES_FACTOR]
+    return queryset.filter(id__in=candidates).annotate(distance=Distance('coordinates', point)) \
+        .order_by('distance')[:limit]
+
+
+def get_alternative_ports_ids(port_id, radius):
+    """
+    Returns subquery of ids of ports of the same type as port within radius in km around it, including the port.
+    """
+
+    port = Port.objects.filter(id=port_id).only('coordinates', 'port_or_airport').first()
+    if not port or not port.coordinates:
+        return [port_id]
+    return filter_ports_within(Port.objects.filter(port_or_airport=port.port_or_airport), port.coordinates, radius) \
+        .values('id')
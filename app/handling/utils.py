@@ -0,0 +1,124 @@
+import time
+import uuid
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.core.cache import cache
+from django.db.utils import ProgrammingError
+
+from app.core.util.consts import AGE_1HOUR
+from app.handling.models import ExchangeRate, BillingExchangeRate, Currency
+from app.location.models import Country
+
+EXCHANGE_RATES_CACHE_TIMEOUT = AGE_1HOUR
+PLATFORM_EXCHANGE_RATES_CACHE_KEY = 'exchange_rates:platform'
+BILLING_EXCHANGE_RATES_CACHE_KEY = 'exchange_rates:billing:{company_id}'
+
+ExchangeRateSnapshot = namedtuple('ExchangeRateSnapshot', ('rate', 'spread'))
+
+
+def exchange_rates_to_mapping(queryset):
+    rates = dict()
+    for code, rate, spread in queryset.order_by('id').values_list('currency__code', 'rate', 'spread'):
+        rates.setdefault(code, ExchangeRateSnapshot(rate, spread))
+    return rates
+
+
+def get_platform_exchange_rates():
+    rates = cache.get(PLATFORM_EXCHANGE_RATES_CACHE_KEY)
+    if rates is None:
+        rates = exchange_rates_to_mapping(ExchangeRate.objects.filter(is_platforms=True))
+        cache.set(PLATFORM_EXCHANGE_RATES_CACHE_KEY, rates, EXCHANGE_RATES_CACHE_TIMEOUT)
+    return MappingProxyType(rates)
+
+
+def get_billing_exchange_rates(company):
+    """
+    Returns exchange rates of the latest company billing exchange rate or None, if company has no one.
+    """
+
+    cache_key = BILLING_EXCHANGE_RATES_CACHE_KEY.format(company_id=company.id)
+    billing_exchange_rates = cache.get(cache_key)
+    if billing_exchange_rates is None:
+        billing_exchange_rate = BillingExchangeRate.objects.filter(company=company).last()
+        rates = exchange_rates_to_mapping(billing_exchange_rate.rates.all()) if billing_exchange_rate else None
+        billing_exchange_rates = {'rates': rates}
+        cache.set(cache_key, billing_exchange_rates, EXCHANGE_RATES_CACHE_TIMEOUT)
+    rates = billing_exchange_rates['rates']
+    return MappingProxyType(rates) if rates is not None else None
+
+
+def invalidate_platform_exchange_rates():
+    cache.delete(PLATFORM_EXCHANGE_RATES_CACHE_KEY)
+
+
+def invalidate_billing_exchange_rates(company_id):
+    cache.delete(BILLING_EXCHANGE_RATES_CACHE_KEY.format(company_id=company_id))
+
+
+SETTINGS_VERSION_CACHE_KEY = 'settings:version'
+SETTINGS_VERSION_CHECK_INTERVAL = 5
+SETTINGS_TTL = 300
+
+_settings = dict()
+_settings_version = None
+_settings_version_checked_at = 0
+
+
+def get_settings_version():
+    version = cache.get(SETTINGS_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(SETTINGS_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(SETTINGS_VERSION_CACHE_KEY)
+    return version
+
+
+def get_cached_setting(key, loader):
+    """
+    Returns value from in-process settings registry, loading it on miss or after SETTINGS_TTL.
+    Registry is dropped when settings version in the shared cache changes, version is checked
+    once per interval.
+    """
+
+    global _settings_version, _settings_version_checked_at
+    now = time.monotonic()
+    if now - _settings_version_checked_at >= SETTINGS_VERSION_CHECK_INTERVAL:
+        version = get_settings_version()
+        if version != _settings_version:
+            _settings.clear()
+            _settings_version = version
+        _settings_version_checked_at = now
+    entry = _settings.get(key)
+    if entry is None or now - entry[1] >= SETTINGS_TTL:
+        entry = _settings[key] = (loader(), now)
+    return entry[0]
+
+
+def invalidate_settings():
+    global _settings_version_checked_at
+    _settings.clear()
+    _settings_version_checked_at = 0
+    cache.set(SETTINGS_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def get_setting(model):
+    return get_cached_setting(model.__name__, model.load)
+
+
+def load_main_currency_code():
+    return Currency.objects.filter(is_main=True).first().code
+
+
+def get_main_currency_code():
+    return get_cached_setting('main_currency_code', load_main_currency_code)
+
+
+def load_main_country_code():
+    try:
+        return Country.objects.filter(is_main=True).first().code
+    except (ProgrammingError, AttributeError):
+        return 'BR'
+
+
+def get_main_country_code():
+    return get_cached_setting('main_country_code', load_main_country_code)
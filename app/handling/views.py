@@ -1,24 +1,20 @@
 from django.db.models import BooleanField, Case, QuerySet, When, Q
-from django.db.utils import ProgrammingError
 
 from django_filters import rest_framework
 from rest_framework import mixins, viewsets
-from rest_framework.filters import SearchFilter
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
 from app.core.permissions import IsAgentCompany, IsMasterOrBilling
-from app.handling.filters import CarrierFilterSet, PortFilterSet
+from app.handling.filters import CarrierFilterSet, PortFilterSet, TrigramSearchFilterBackend
 from app.handling.models import Carrier, Port, ShippingMode, ShippingType, Currency, PackagingType, BillingExchangeRate
 from app.handling.serializers import CarrierSerializer, CurrencySerializer, PortSerializer, ShippingModeSerializer, \
     ShippingTypeSerializer, PackagingTypeBaseSerializer, BillingExchangeRateBaseSerializer, \
-    BillingExchangeRateListSerializer
-from app.location.models import Country
-
-
-try:
-    MAIN_COUNTRY_CODE = Country.objects.filter(is_main=True).first().code
-except (ProgrammingError, AttributeError):
-    MAIN_COUNTRY_CODE = 'BR'
+    BillingExchangeRateListSerializer, PortDistanceSerializer, PortNearestSerializer, PortWithinSerializer
+from app.handling.search import PortSearch, CarrierSearch
+from app.handling.spatial import get_nearest_ports, get_ports_within
+from app.handling.utils import get_main_country_code
 
 
 class CarrierViewSet(mixins.ListModelMixin,
@@ -27,7 +23,8 @@ class CarrierViewSet(mixins.ListModelMixin,
     serializer_class = CarrierSerializer
     permission_classes = (IsAuthenticated, )
     filter_class = CarrierFilterSet
-    filter_backends = (rest_framework.DjangoFilterBackend,)
+    filter_backends = (TrigramSearchFilterBackend, rest_framework.DjangoFilterBackend,)
+    search_class = CarrierSearch
 
 
 class PortViewSet(mixins.ListModelMixin,
@@ -36,8 +33,8 @@ class PortViewSet(mixins.ListModelMixin,
     serializer_class = PortSerializer
     permission_classes = (IsAuthenticated, )
     filter_class = PortFilterSet
-    filter_backends = (SearchFilter, rest_framework.DjangoFilterBackend,)
-    search_fields = ('code', 'name',)
+    filter_backends = (TrigramSearchFilterBackend, rest_framework.DjangoFilterBackend,)
+    search_class = PortSearch
 
     def get_queryset(self):
         queryset = self.queryset
@@ -45,12 +42,31 @@ class PortViewSet(mixins.ListModelMixin,
             # Ensure queryset is re-evaluated on each request.
             queryset = queryset.all()
         queryset = queryset.annotate(is_local=Case(
-            When(code__startswith=MAIN_COUNTRY_CODE, then=True),
+            When(code__startswith=get_main_country_code(), then=True),
             default=False,
             output_field=BooleanField(),
         ))
         return queryset
 
+    @action(methods=['get'], detail=False, url_path='nearest')
+    def nearest(self, request, *args, **kwargs):
+        serializer = PortNearestSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        queryset = self.filter_queryset(self.get_queryset())
+        if port := data.get('port'):
+            queryset = queryset.exclude(id=port.id)
+        ports = get_nearest_ports(data['point'], data['limit'], queryset)
+        return Response(PortDistanceSerializer(ports, many=True).data)
+
+    @action(methods=['get'], detail=False, url_path='within')
+    def within(self, request, *args, **kwargs):
+        serializer = PortWithinSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        ports = get_ports_within(data['point'], data['radius'], self.filter_queryset(self.get_queryset()))
+        return Response(PortDistanceSerializer(ports[:data['limit']], many=True).data)
+
 
 class ShippingModeViewSet(mixins.ListModelMixin,
                           viewsets.GenericViewSet):
@@ -80,7 +96,7 @@ class CurrencyViewSet(mixins.ListModelMixin,
     permission_classes = (IsAuthenticated, )
 
     def get_queryset(self):
-        return Currency.objects.filter(Q(country__code=MAIN_COUNTRY_CODE) | (Q(is_active=True))).distinct()
+        return Currency.objects.filter(Q(country__code=get_main_country_code()) | (Q(is_active=True))).distinct()
 
 
 class BillingExchangeRateViewSet(mixins.CreateModelMixin,
@@ -0,0 +1,459 @@
+import copy
+import datetime
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.utils.encoders import JSONEncoder
+
+from app.booking.models import AdditionalSurcharge, Booking, CargoGroup, Charge, FreightRate, Rate, \
+    SearchableOffer, Surcharge, UsageFee
+from app.booking.offers import refresh_searchable_offers
+from app.booking.search import FreightRateSearch, invalidate_search_cache
+from app.booking.utils import calculate_freight_rate_charges, freight_rate_search
+from app.booking.views import BookingViesSet, FreightRateViesSet, OperationViewSet
+from app.core.models import Company, Role, Shipper
+from app.handling.models import Carrier, Currency, Port, ShippingMode
+from app.handling.utils import get_main_country_code, get_main_currency_code, get_platform_exchange_rates
+
+BENCHMARK_NAME = 'Benchmark'
+BATCH_SIZE = 5000
+MAX_ROUTES = 999
+CHUNK_SIZE = 10000
+PERCENTILES = (50, 95, 99)
+
+
+class BenchmarkRollback(Exception):
+    pass
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(round(percent / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+def measure(name, function, iterations):
+    """
+    Runs function the given number of times, collecting latency and number of queries,
+    and once more under tracemalloc to get peak memory, as tracing slows down the timed runs.
+    """
+
+    durations, queries = [], []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            function()
+            durations.append((time.perf_counter() - started) * 1000)
+        queries.append(len(context.captured_queries))
+
+    tracemalloc.start()
+    try:
+        function()
+        memory = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+    result = {'name': name, 'iterations': iterations}
+    result.update({f'p{percent}_ms': round(percentile(durations, percent), 2) for percent in PERCENTILES})
+    result.update({
+        'max_ms': round(max(durations), 2),
+        'queries': max(queries),
+        'peak_memory_kb': round(memory, 1),
+    })
+    return result
+
+
+class BenchmarkDataset:
+    """
+    Synthetic agent and client companies with ports, carriers, surcharges, freight rates and operations.
+    """
+
+    def __init__(self, shipping_mode, routes_number, carriers_number, seed):
+        self.shipping_mode = shipping_mode
+        self.container_types = list(shipping_mode.container_types.filter(is_active=True).order_by('id'))
+        self.routes_number = routes_number
+        self.carriers_number = carriers_number
+        self.random = random.Random(seed)
+        self.today = timezone.localtime().date()
+        self.agent_company = self.agent = None
+        self.client_company = self.client = None
+        self.shipper = None
+        self.routes = []
+        self.carriers = []
+        self.surcharges = dict()
+        self.currencies = []
+
+    def get_unique_digits(self, length):
+        return str(uuid.uuid4().int)[:length]
+
+    def create_company(self, company_type):
+        tax_id = self.get_unique_digits(14)
+        company = Company.objects.create(
+            type=company_type,
+            name=f'{BENCHMARK_NAME} {company_type}',
+            state=BENCHMARK_NAME,
+            city=BENCHMARK_NAME,
+            zip_code='00000-000',
+            phone=f'+5511{self.get_unique_digits(9)}',
+            tax_id=f'{tax_id[:2]}.{tax_id[2:5]}.{tax_id[5:8]}/{tax_id[8:12]}-{tax_id[12:]}',
+        )
+        user = get_user_model().objects.create(
+            email=f'{BENCHMARK_NAME.lower()}-{company_type}-{uuid.uuid4().hex[:8]}@example.com',
+            first_name=BENCHMARK_NAME,
+            last_name=company_type,
+        )
+        Role.objects.create(company=company, user=user)
+        user.set_roles(['master'])
+        return company, user
+
+    def create_routes(self):
+        main_country_code = get_main_country_code()
+        ports = []
+        for index in range(self.routes_number):
+            for prefix, latitude in ((main_country_code, -23), ('ZZ', 51)):
+                longitude = self.random.uniform(-180, 180)
+                ports.append(Port(
+                    code=f'{prefix}{index:03d}'[:5],
+                    name=f'{BENCHMARK_NAME} port {prefix} {index}',
+                    coordinates=Point(longitude, latitude),
+                    latitude=latitude,
+                    longitude=longitude,
+                ))
+        ports = Port.objects.bulk_create(ports)
+        self.routes = list(zip(ports[::2], ports[1::2]))
+
+    def create_carriers(self):
+        self.carriers = Carrier.objects.bulk_create([
+            Carrier(title=f'{BENCHMARK_NAME} carrier {index}', shipping_type=self.shipping_mode.shipping_type)
+            for index in range(self.carriers_number)
+        ])
+
+    def create_surcharges(self):
+        start_date = self.today - datetime.timedelta(days=30)
+        expiration_date = self.today + datetime.timedelta(days=365)
+        surcharges = [
+            Surcharge(
+                carrier=carrier,
+                direction=Surcharge.EXPORT,
+                location=origin,
+                start_date=start_date,
+                expiration_date=expiration_date,
+                shipping_mode=self.shipping_mode,
+                company=self.agent_company,
+            ) for carrier in self.carriers for origin, _ in self.routes
+        ]
+        surcharges = Surcharge.objects.bulk_create(surcharges, batch_size=BATCH_SIZE)
+        self.surcharges = {(surcharge.carrier_id, surcharge.location_id): surcharge for surcharge in surcharges}
+
+        additional_surcharges = list(AdditionalSurcharge.objects.all())
+        Charge.objects.bulk_create([
+            Charge(
+                additional_surcharge=additional_surcharge,
+                surcharge=surcharge,
+                currency=self.random.choice(self.currencies),
+                charge=round(self.random.uniform(10, 500), 2),
+                conditions=Charge.FIXED,
+            ) for surcharge in surcharges for additional_surcharge in additional_surcharges
+        ], batch_size=BATCH_SIZE)
+        UsageFee.objects.bulk_create([
+            UsageFee(
+                container_type=container_type,
+                surcharge=surcharge,
+                currency=self.random.choice(self.currencies),
+                charge=round(self.random.uniform(10, 200), 2),
+            ) for surcharge in surcharges for container_type in self.container_types
+        ], batch_size=BATCH_SIZE)
+
+    def create_freight_rates(self, number):
+        """
+        Creates freight rates with a rate per container type in chunks, so even millions of rates
+        are generated in bounded memory, and indexes them for search.
+        """
+
+        rates_per_freight_rate = max(len(self.container_types), 1)
+        freight_rates_number = max(number // rates_per_freight_rate, 1)
+        for chunk_start in range(0, freight_rates_number, CHUNK_SIZE):
+            chunk_size = min(CHUNK_SIZE, freight_rates_number - chunk_start)
+            freight_rates = []
+            for index in range(chunk_start, chunk_start + chunk_size):
+                origin, destination = self.routes[index % len(self.routes)]
+                freight_rates.append(FreightRate(
+                    carrier=self.random.choice(self.carriers),
+                    origin=origin,
+                    destination=destination,
+                    transit_time=self.random.randint(5, 60),
+                    shipping_mode=self.shipping_mode,
+                    company=self.agent_company,
+                ))
+            freight_rates = FreightRate.objects.bulk_create(freight_rates, batch_size=BATCH_SIZE)
+
+            rates = [
+                Rate(
+                    currency=self.random.choice(self.currencies),
+                    rate=round(self.random.uniform(500, 5000), 2),
+                    start_date=self.today - datetime.timedelta(days=self.random.randint(0, 30)),
+                    expiration_date=self.today + datetime.timedelta(days=self.random.randint(30, 180)),
+                    freight_rate=freight_rate,
+                    container_type=container_type,
+                ) for freight_rate in freight_rates for container_type in (self.container_types or [None])
+            ]
+            rates = Rate.objects.bulk_create(rates, batch_size=BATCH_SIZE)
+            Rate.surcharges.through.objects.bulk_create([
+                Rate.surcharges.through(
+                    rate_id=rate.id,
+                    surcharge_id=self.surcharges[(rate.freight_rate.carrier_id, rate.freight_rate.origin_id)].id,
+                ) for rate in rates
+            ], batch_size=BATCH_SIZE)
+            refresh_searchable_offers([freight_rate.id for freight_rate in freight_rates])
+
+    def create_operations(self, number):
+        results_by_route = dict()
+        bookings = []
+        for index in range(number):
+            route = self.routes[index % len(self.routes)]
+            if route not in results_by_route:
+                results_by_route[route] = FreightRateSearch(self.get_search_data(route), self.client_company) \
+                    .get_results()
+            results = results_by_route[route]
+            if not results:
+                continue
+            result = results[index % len(results)]
+            bookings.append(Booking(
+                aceid=f'BM{index:06d}'[:8],
+                date_from=self.today + datetime.timedelta(days=7),
+                date_to=self.today + datetime.timedelta(days=14),
+                status=Booking.CONFIRMED,
+                is_paid=True,
+                is_assigned=True,
+                client_contact_person=self.client,
+                agent_contact_person=self.agent,
+                charges=json.loads(json.dumps(result, cls=JSONEncoder)),
+                freight_rate_id=result['freight_rate']['id'],
+                shipper=self.shipper,
+            ))
+        bookings = Booking.objects.bulk_create(bookings, batch_size=BATCH_SIZE)
+        CargoGroup.objects.bulk_create([
+            CargoGroup(booking=booking, **cargo_group)
+            for booking in bookings for cargo_group in self.get_cargo_groups()
+        ], batch_size=BATCH_SIZE)
+        return bookings
+
+    def get_cargo_groups(self):
+        return [{'container_type': container_type.id, 'volume': 1} for container_type in self.container_types[:2]]
+
+    def get_search_data(self, route):
+        origin, destination = route
+        return {
+            'shipping_mode': self.shipping_mode.id,
+            'origin': origin.id,
+            'destination': destination.id,
+            'date_from': (self.today + datetime.timedelta(days=7)).strftime('%d/%m/%Y'),
+            'date_to': (self.today + datetime.timedelta(days=14)).strftime('%d/%m/%Y'),
+            'cargo_groups': self.get_cargo_groups(),
+        }
+
+    def generate(self, freight_rates_number, operations_number):
+        main_currency_code = get_main_currency_code()
+        currency_codes = {main_currency_code, *get_platform_exchange_rates().keys()}
+        self.currencies = list(Currency.objects.filter(code__in=currency_codes))
+        if not self.currencies:
+            raise CommandError('No currencies found, load fixtures before running benchmark.')
+
+        with transaction.atomic():
+            self.agent_company, self.agent = self.create_company(Company.FREIGHT_FORWARDER)
+            self.client_company, self.client = self.create_company(Company.CLIENT)
+            self.shipper = Shipper.objects.create(
+                name=f'{BENCHMARK_NAME} shipper',
+                city=BENCHMARK_NAME,
+                zip_code='00000-000',
+                contact_name=BENCHMARK_NAME,
+                phone=f'+5511{self.get_unique_digits(9)}',
+                email='benchmark-shipper@example.com',
+                company=self.client_company,
+            )
+            self.create_routes()
+            self.create_carriers()
+            self.create_surcharges()
+        self.create_freight_rates(freight_rates_number)
+        invalidate_search_cache()
+        return self.create_operations(operations_number)
+
+    def delete(self):
+        """
+        Deletes generated data, also after a failed generation. Rate tables are deleted with raw deletes,
+        as collecting millions of rows for deletion signals would take longer than the benchmark itself.
+        """
+
+        if self.client is None:
+            return
+        freight_rates = FreightRate.objects.filter(company=self.agent_company)
+        surcharges = Surcharge.objects.filter(company=self.agent_company)
+        with transaction.atomic():
+            Booking.objects.filter(client_contact_person=self.client).delete()
+            for queryset in (
+                SearchableOffer.objects.filter(company=self.agent_company),
+                Rate.surcharges.through.objects.filter(surcharge__in=surcharges),
+                Rate.objects.filter(freight_rate__in=freight_rates),
+                freight_rates,
+                Charge.objects.filter(surcharge__in=surcharges),
+                UsageFee.objects.filter(surcharge__in=surcharges),
+                surcharges,
+            ):
+                queryset._raw_delete(queryset.db)
+            get_user_model().objects.filter(id__in=(self.agent.id, self.client.id)).delete()
+            Company.objects.filter(id__in=(self.agent_company.id, self.client_company.id)).delete()
+            Port.objects.filter(id__in=[port.id for route in self.routes for port in route]).delete()
+            Carrier.objects.filter(id__in=[carrier.id for carrier in self.carriers]).delete()
+        invalidate_search_cache()
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic freight rates and operations and reports latency percentiles, " \
+           "number of queries and peak memory of booking pricing, search and operation endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rates', type=int, default=1000, help='Number of rates to generate.')
+        parser.add_argument('--routes', type=int, default=10,
+                            help=f'Number of origin-destination routes, at most {MAX_ROUTES}.')
+        parser.add_argument('--carriers', type=int, default=5, help='Number of carriers.')
+        parser.add_argument('--operations', type=int, default=100, help='Number of confirmed operations.')
+        parser.add_argument('--iterations', type=int, default=20, help='Number of runs of every case.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the data generator.')
+        parser.add_argument('--json', dest='json_path', help='Writes results to the given json file.')
+        parser.add_argument('--keep', action='store_true', help='Keeps generated data after the run.')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'BENCHMARK_ENABLED', False):
+            raise CommandError('Benchmark writes to the database, enable BENCHMARK_ENABLED setting '
+                               'in settings of a dedicated database to run it.')
+        if not 1 <= options['routes'] <= MAX_ROUTES:
+            raise CommandError(f'Number of routes must be between 1 and {MAX_ROUTES}.')
+
+        shipping_mode = ShippingMode.objects.filter(
+            has_freight_containers=True,
+            container_types__isnull=False,
+        ).select_related('shipping_type').distinct().first()
+        if not shipping_mode:
+            raise CommandError('No shipping mode with container types found, load fixtures before running benchmark.')
+
+        dataset = BenchmarkDataset(shipping_mode, options['routes'], options['carriers'], options['seed'])
+        self.stdout.write(f'Generating {options["rates"]} rates on {options["routes"]} routes...')
+        try:
+            started = time.perf_counter()
+            bookings = dataset.generate(options['rates'], options['operations'])
+            self.stdout.write(f'Generated in {time.perf_counter() - started:.1f}s.')
+            results = self.run_cases(dataset, bookings, options['iterations'])
+        finally:
+            if not options['keep']:
+                dataset.delete()
+
+        self.print_results(results)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in ('rates', 'routes', 'carriers', 'operations',
+                                                                     'iterations', 'seed')},
+                           'results': results}, file, indent=2)
+
+    def run_cases(self, dataset, bookings, iterations):
+        factory = APIRequestFactory()
+        route = dataset.routes[0]
+        search_data = dataset.get_search_data(route)
+
+        def request_view(view, method, user, path, data=None, **kwargs):
+            request = getattr(factory, method)(path, data, format='json')
+            force_authenticate(request, user=user)
+            return view(request, **kwargs).render()
+
+        search_view = FreightRateViesSet.as_view({'post': 'freight_rate_search_and_calculate'})
+        booking_view = BookingViesSet.as_view({'post': 'create'})
+        operation_list_view = OperationViewSet.as_view({'get': 'list'})
+        operation_retrieve_view = OperationViewSet.as_view({'get': 'retrieve'})
+
+        def search_endpoint_cold():
+            invalidate_search_cache()
+            request_view(search_view, 'post', dataset.client, '/booking/freight-rate/search/', search_data)
+
+        def create_booking():
+            freight_rate_id = bookings[0].freight_rate_id if bookings else \
+                FreightRate.objects.filter(origin=route[0], destination=route[1]).values_list('id', flat=True)[0]
+            data = {
+                'date_from': search_data['date_from'],
+                'date_to': search_data['date_to'],
+                'freight_rate': freight_rate_id,
+                'existing_shipper': dataset.shipper.id,
+                'cargo_groups': dataset.get_cargo_groups(),
+            }
+            try:
+                with transaction.atomic():
+                    request_view(booking_view, 'post', dataset.client, '/booking/booking/', data)
+                    raise BenchmarkRollback
+            except BenchmarkRollback:
+                pass
+
+        pricing_search = FreightRateSearch(copy.deepcopy(search_data), dataset.client_company)
+        pricing_freight_rates = pricing_search.get_freight_rates()
+        pricing_context = pricing_search.load(pricing_freight_rates)
+
+        def calculate_charges():
+            snapshot = pricing_context['pricing_snapshot']
+            snapshot.charge_costs, snapshot.cargo_groups_wm = dict(), None
+            for freight_rate in pricing_freight_rates:
+                calculate_freight_rate_charges(freight_rate,
+                                               dict(),
+                                               pricing_search.cargo_groups,
+                                               pricing_search.shipping_mode,
+                                               pricing_search.main_currency_code,
+                                               pricing_search.date_from,
+                                               pricing_search.date_to,
+                                               pricing_search.container_type_ids_list,
+                                               booking_fee=pricing_search.booking_fee,
+                                               service_fee=pricing_search.service_fee,
+                                               calculate_fees=pricing_search.calculate_fees,
+                                               snapshot=snapshot, )
+
+        cases = [
+            ('freight_rate_search', lambda: list(freight_rate_search(copy.deepcopy(search_data))[0].values('id'))),
+            ('calculate_freight_rate_charges', calculate_charges),
+            ('search results (query and pricing)',
+             lambda: FreightRateSearch(copy.deepcopy(search_data), dataset.client_company).get_results()),
+            ('search endpoint (cold cache)', search_endpoint_cold),
+            ('search endpoint (warm cache)',
+             lambda: request_view(search_view, 'post', dataset.client, '/booking/freight-rate/search/', search_data)),
+            ('booking create', create_booking),
+            ('operation list (client)',
+             lambda: request_view(operation_list_view, 'get', dataset.client, '/booking/operation/')),
+            ('operation list (agent)',
+             lambda: request_view(operation_list_view, 'get', dataset.agent, '/booking/operation/')),
+        ]
+        if bookings:
+            cases.append(('operation retrieve', lambda: request_view(
+                operation_retrieve_view, 'get', dataset.client, f'/booking/operation/{bookings[0].id}/',
+                pk=bookings[0].id,
+            )))
+
+        results = []
+        with mock.patch('app.booking.serializers.create_charge_transaction'), \
+                mock.patch('app.booking.serializers.create_and_assign_notification'), \
+                mock.patch('app.booking.serializers.send_email'):
+            for name, function in cases:
+                self.stdout.write(f'Running {name}...')
+                results.append(measure(name, function, iterations))
+        return results
+
+    def print_results(self, results):
+        columns = ('name', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'queries', 'peak_memory_kb')
+        widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+        self.stdout.write('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+        for result in results:
+            self.stdout.write('  '.join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
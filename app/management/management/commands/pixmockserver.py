@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from django.core.management.base import BaseCommand
+
+from app.booking.payments import PIX_COMPLETED_STATUS
+
+
+class PixMockHandler(BaseHTTPRequestHandler):
+    """
+    Class, that provides a minimal Pix bank api: '/oauth/token' issues tokens, '/cob/<txid>'
+    creates (PUT), reviews (GET) and changes (PATCH) charges. Charges are reported paid
+    after the configured delay.
+    """
+
+    charges = dict()
+    tokens = dict()
+    lock = threading.Lock()
+    expires_in = 600
+    pay_after = 0
+    latency = 0
+
+    def send_json(self, status_code, data):
+        body = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def get_txid(self):
+        path = urlparse(self.path).path.rstrip('/')
+        return path.rsplit('/', 1)[-1] if path.startswith('/cob/') else None
+
+    def is_authorized(self):
+        token = (self.headers.get('Authorization') or '').replace('Bearer ', '')
+        with self.lock:
+            expiration = self.tokens.get(token)
+        if expiration and expiration > time.monotonic():
+            return True
+        self.send_json(401, {'error': 'invalid_token'})
+        return False
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        if urlparse(self.path).path.rstrip('/') != '/oauth/token':
+            return self.send_json(404, {})
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = time.monotonic() + self.expires_in
+        self.send_json(200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.expires_in})
+
+    def do_PUT(self):
+        time.sleep(self.latency)
+        txid = self.get_txid()
+        if not txid:
+            return self.send_json(404, {})
+        if not self.is_authorized():
+            return
+        data = self.read_json()
+        charge = {
+            'status': 'ATIVA',
+            'txid': txid,
+            'revisao': 0,
+            'valor': data.get('valor', {}),
+            'chave': data.get('chave'),
+            'textoImagemQRcode': f'00020101021226870014br.gov.bcb.pix{txid}',
+            'created': time.monotonic(),
+        }
+        with self.lock:
+            self.charges[txid] = charge
+        self.send_json(201, {key: value for key, value in charge.items() if key != 'created'})
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        txid = self.get_txid()
+        if not txid:
+            return self.send_json(404, {})
+        if not self.is_authorized():
+            return
+        with self.lock:
+            charge = dict(self.charges.get(txid) or {})
+        if not charge:
+            return self.send_json(404, {'title': 'Cobrança não encontrada.'})
+        if time.monotonic() - charge.pop('created') >= self.pay_after:
+            charge['status'] = PIX_COMPLETED_STATUS
+            charge['pix'] = [{'txid': txid, 'valor': charge['valor'].get('original'), 'endToEndId': uuid.uuid4().hex}]
+        self.send_json(200, charge)
+
+    def do_PATCH(self):
+        time.sleep(self.latency)
+        txid = self.get_txid()
+        if not txid:
+            return self.send_json(404, {})
+        if not self.is_authorized():
+            return
+        data = self.read_json()
+        with self.lock:
+            if txid not in self.charges:
+                return self.send_json(404, {'title': 'Cobrança não encontrada.'})
+            self.charges[txid]['valor'] = data.get('valor', self.charges[txid]['valor'])
+            self.charges[txid]['revisao'] += 1
+            charge = {key: value for key, value in self.charges[txid].items() if key != 'created'}
+        self.send_json(201, charge)
+
+
+class Command(BaseCommand):
+    help = "Runs a local mock of the Pix bank api, point token_uri, qr_cob_uri and base_url " \
+           "of the pix api settings to it to test payments without the bank"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+        parser.add_argument('--expires-in', type=int, default=600, help='Lifetime of issued tokens in seconds.')
+        parser.add_argument('--pay-after', type=float, default=0,
+                            help='Seconds after which a created charge is reported paid.')
+        parser.add_argument('--latency', type=float, default=0, help='Delay of every response in seconds.')
+
+    def handle(self, *args, **options):
+        PixMockHandler.expires_in = options['expires_in']
+        PixMockHandler.pay_after = options['pay_after']
+        PixMockHandler.latency = options['latency']
+        server = ThreadingHTTPServer((options['host'], options['port']), PixMockHandler)
+        url = f'http://{options["host"]}:{options["port"]}'
+        self.stdout.write(self.style.SUCCESS(
+            f'Pix mock bank api is running: token_uri={url}/oauth/token qr_cob_uri={url}/cob/ base_url={url}/cob/'
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app.booking.offers import rebuild_searchable_offers
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the searchable offers table used by freight rate search"
+
+    def handle(self, *args, **options):
+        number_of_offers = rebuild_searchable_offers()
+        self.stdout.write(self.style.SUCCESS(f"Searchable offers rebuilt: {number_of_offers}"))
@@ -1,23 +1,28 @@
 import json
 
 from urllib import parse
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
-from django.db.models import Q
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
-from app.booking.models import Booking
 from app.websockets.models import Message, Chat, Notification, MessageFile, ChatPermission, Ticket
 from app.websockets.tasks import create_and_assign_notification
-
-from django.utils.translation import ugettext as _
+from app.websockets.utils import get_messages_page, get_notifications_page, get_unread_notifications, \
+    mark_notification_viewed, MESSAGES_PAGE_SIZE, NOTIFICATIONS_PAGE_SIZE
 
 User = get_user_model()
 
 
-class ChatConsumer(WebsocketConsumer):
+class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Class, that provides chat websocket, database access of every command is done in one
+    database_sync_to_async call.
+    """
 
     def get_origin_url(self):
         headers = self.scope['headers']
@@ -36,109 +41,140 @@ class ChatConsumer(WebsocketConsumer):
     def save_files(files_ids, message_id):
         MessageFile.objects.filter(id__in=files_ids).update(message_id=message_id)
 
-    def fetch_messages(self):
-        messages = Message.objects.filter(chat_id=self.chat_id)
+    @database_sync_to_async
+    def has_access(self, user):
+        return Chat.objects.filter(id=self.chat_id, users=user).exists()
+
+    @database_sync_to_async
+    def get_messages(self, cursor=None, page_size=MESSAGES_PAGE_SIZE):
+        messages, older_cursor = get_messages_page(Message.objects.filter(chat_id=self.chat_id), cursor, page_size)
+        if not cursor:
+            ChatPermission.objects.filter(
+                chat_id=self.chat_id,
+                user=self.scope['user'],
+                unread_messages__gt=0,
+            ).update(unread_messages=0)
+        return self.messages_to_json(messages), older_cursor
+
+    @database_sync_to_async
+    def set_online(self, user, is_online):
+        fields = {'is_online': is_online, 'unread_messages': 0} if is_online else {'is_online': is_online}
+        ChatPermission.objects.filter(chat_id=self.chat_id, user=user).update(**fields)
+
+    @database_sync_to_async
+    def create_message(self, user, data):
+        with transaction.atomic():
+            message = Message.objects.create(
+                chat_id=self.chat_id,
+                user=user,
+                text=data['message'])
+            if files_ids := data.get('files'):
+                self.save_files(files_ids, message.id)
+
+            users_offline = ChatPermission.objects.filter(chat_id=self.chat_id, is_online=False)
+            users_to_notify = list(users_offline.filter(unread_messages=0).values_list('user_id', flat=True))
+            users_offline.update(unread_messages=F('unread_messages') + 1)
+
+        if users_to_notify:
+            chat = Chat.objects.filter(id=self.chat_id).values('operation_id').first()
+            if not chat['operation_id']:
+                ticket = Ticket.objects.filter(chat_id=self.chat_id).values('id', 'topic').first()
+                create_and_assign_notification.delay(
+                    Notification.CHATS,
+                    'You have a new message in support chat on topic "{topic}"',
+                    {'topic': ticket['topic'] if ticket else None},
+                    users_to_notify,
+                    Notification.SUPPORT,
+                    object_id=ticket['id'] if ticket else None,
+                )
+        return self.message_to_json(Message.objects.select_related('user').prefetch_related('files')
+                                    .get(id=message.id))
+
+    @database_sync_to_async
+    def get_user_photo(self, user_id):
+        user = User.objects.filter(id=user_id).only('id', 'photo').first()
+        if user:
+            return {'photo': f'{photo.url}' if (photo := user.photo) else None}
+        return None
+
+    @database_sync_to_async
+    def remove_message(self, message_id):
+        Message.objects.filter(id=message_id).delete()
+
+    async def fetch_messages(self, data=None):
+        page_size = (data or {}).get('page_size', MESSAGES_PAGE_SIZE)
+        messages, older_cursor = await self.get_messages(page_size=page_size)
         content = {
             'command': 'messages',
-            'messages': self.messages_to_json(messages),
+            'messages': messages,
+            'older': older_cursor,
         }
-        user = self.scope['user']
-        if user_permission := user.chat_permissions.filter(chat_id=self.chat_id).first():
-            if user_permission.unread_messages > 0:
-                user_permission.unread_messages = 0
-                user_permission.save()
-        self.send_message(content)
+        await self.send_message(content)
 
-    def new_message(self, data):
-        user = self.scope['user']
-        message = Message.objects.create(
-            chat_id=self.chat_id,
-            user=user,
-            text=data['message'])
-        if files_ids := data.get('files'):
-            self.save_files(files_ids, message.id)
+    async def fetch_older_messages(self, data):
+        try:
+            messages, older_cursor = await self.get_messages(data['cursor'],
+                                                             data.get('page_size', MESSAGES_PAGE_SIZE))
+        except (KeyError, ValidationError):
+            content = {
+                'command': 'error',
+                'message': 'Invalid cursor.',
+            }
+        else:
+            content = {
+                'command': 'older_messages',
+                'messages': messages,
+                'older': older_cursor,
+            }
+        await self.send_message(content)
+
+    async def new_message(self, data):
         content = {
             'command': 'new_message',
-            'message': self.message_to_json(message),
+            'message': await self.create_message(self.scope['user'], data),
         }
+        await self.send_chat_message(content)
 
-        users_offline = ChatPermission.objects.filter(chat_id=self.chat_id, is_online=False)
-        ticket = Ticket.objects.filter(chat_id=self.chat_id).values_list('id', flat=True).first()
-
-        if users_offline.exists():
-            for user in users_offline:
-                unread_messages = user.unread_messages
-                if unread_messages == 0:
-                    operation_id = user.chat.operation_id
-                    if operation_id:
-                        aceid = Booking.objects.filter(id=user.chat.operation_id) \
-                            .values_list('aceid', flat=True).first()
-                        message_body = _('You have a new message in chat on operation number {aceid}') \
-                            .format(aceid=aceid)
-                    else:
-                        topic = Ticket.objects.filter(chat_id=self.chat_id) \
-                            .values_list('topic', flat=True).first()
-                        message_body = _('You have a new message in support chat on topic "{topic}"') \
-                            .format(topic=topic)
-
-                        create_and_assign_notification.delay(
-                            Notification.CHATS,
-                            'You have a new message in support chat on topic "{topic}"',
-                            {'topic':topic},
-                            [user.user_id, ],
-                            Notification.OPERATION if operation_id else Notification.SUPPORT,
-                            object_id=operation_id if operation_id else ticket,
-                        )
-                unread_messages += 1
-                user.unread_messages = unread_messages
-                user.save()
-        return self.send_chat_message(content)
-
-    def typing_message(self, data):
+    async def typing_message(self, data):
         user_id = data['user_id']
-        user = User.objects.filter(id=user_id).first()
+        user = await self.get_user_photo(user_id)
         if user:
             content = {
                 'command': 'typing_message',
                 'user_id': user_id,
-                'photo': f'{photo.url}' if (photo := user.photo) else None,
+                'photo': user['photo'],
             }
-            return self.send_chat_message(content)
+            await self.send_chat_message(content)
 
-    def stop_typing_message(self, data):
-        user_id = data['user_id']
-        user = User.objects.filter(id=user_id).first()
-        if user:
-            content = {
-                'command': 'stop_typing_message',
-                'user_id': user_id,
-            }
-            return self.send_chat_message(content)
+    async def stop_typing_message(self, data):
+        content = {
+            'command': 'stop_typing_message',
+            'user_id': data['user_id'],
+        }
+        await self.send_chat_message(content)
 
-    def delete_message(self, data):
+    async def delete_message(self, data):
         message_id = data['message_id']
-        Message.objects.filter(id=message_id).delete()
+        await self.remove_message(message_id)
         content = {
             'command': 'delete_message',
             'message_id': message_id,
         }
-        return self.send_chat_message(content)
+        await self.send_chat_message(content)
 
-    def file_uploading(self, data):
-        message_id = data['message_id']
+    async def file_uploading(self, data):
         content = {
             'command': 'file_uploading',
-            'message_id': message_id,
+            'message_id': data['message_id'],
         }
-        return self.send_chat_message(content)
+        await self.send_chat_message(content)
 
-    def file_uploaded(self, data):
-        message_id = data['message_id']
+    async def file_uploaded(self, data):
         content = {
             'command': 'file_uploaded',
-            'message_id': message_id,
+            'message_id': data['message_id'],
         }
-        return self.send_chat_message(content)
+        await self.send_chat_message(content)
 
     def messages_to_json(self, messages):
         result = []
@@ -159,6 +195,7 @@ class ChatConsumer(WebsocketConsumer):
 
     commands = {
         'fetch_messages': fetch_messages,
+        'fetch_older_messages': fetch_older_messages,
         'new_message': new_message,
         'typing_message': typing_message,
         'delete_message': delete_message,
@@ -167,40 +204,40 @@ class ChatConsumer(WebsocketConsumer):
         'file_uploaded': file_uploaded,
     }
 
-    def connect(self):
+    async def connect(self):
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
         user = self.scope['user']
         self.group_name = self.chat_id
 
-        if user.is_anonymous or not Chat.objects.filter(id=self.chat_id, users=user).exists():
-            self.close()
+        if user.is_anonymous or not await self.has_access(user):
+            await self.close()
+            return
 
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
-        self.accept()
+        await self.accept()
 
-        self.fetch_messages()
+        await self.fetch_messages()
 
-        ChatPermission.objects.filter(chat_id=self.chat_id, user_id=user).update(is_online=True, unread_messages=0)
+        await self.set_online(user, True)
 
-    def disconnect(self, close_code):
-        self.chat_id = self.scope['url_route']['kwargs']['chat_id']
+    async def disconnect(self, close_code):
         user = self.scope['user']
-        self.group_name = self.chat_id
-        async_to_sync(self.channel_layer.group_discard)(
+        await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
-        ChatPermission.objects.filter(chat_id=self.chat_id, user_id=user).update(is_online=False)
+        if not user.is_anonymous:
+            await self.set_online(user, False)
 
-    def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         data = json.loads(text_data)
-        self.commands[data['command']](self, data)
+        await self.commands[data['command']](self, data)
 
-    def send_chat_message(self, message):
-        async_to_sync(self.channel_layer.group_send)(
+    async def send_chat_message(self, message):
+        await self.channel_layer.group_send(
             self.group_name,
             {
                 'type': 'chat_message',
@@ -208,94 +245,114 @@ class ChatConsumer(WebsocketConsumer):
             }
         )
 
-    def send_message(self, message):
-        self.send(text_data=json.dumps(message))
+    async def send_message(self, message):
+        await self.send(text_data=json.dumps(message))
 
-    def chat_message(self, event):
+    async def chat_message(self, event):
         message = event['message']
-        self.send(text_data=json.dumps(message))
-
-
-class NotificationConsumer(WebsocketConsumer):
-
-    def fetch_notifications(self):
-        notifications = Notification.objects.filter(Q(users=self.scope['user']))
-        if self.scope['path'] == '/ws/notification/':
-            notification = notifications.filter(~Q(section=Notification.CHATS))
-            command = 'notifications'
-            type = ''
-        else:
-            notification = notifications.filter(Q(section=Notification.CHATS))
+        await self.send(text_data=json.dumps(message))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Class, that provides notifications websocket. On connect and on 'fetch_notifications' only
+    a page of the inbox is sent, 'cursor' requests older notifications and 'since' only the ones
+    newer than the last notification the client has.
+    """
+
+    def is_chat_notifications(self):
+        return self.scope['path'] != '/ws/notification/'
+
+    def get_counter_field_name(self):
+        return 'chat_notifications' if self.is_chat_notifications() else 'notifications'
+
+    @database_sync_to_async
+    def get_notifications(self, cursor=None, since=None, page_size=NOTIFICATIONS_PAGE_SIZE):
+        user_id = self.scope['user'].id
+        notifications, older_cursor = get_notifications_page(user_id, self.is_chat_notifications(), cursor, since,
+                                                             page_size)
+        unread = get_unread_notifications([user_id])[user_id][self.get_counter_field_name()]
+        return notifications, older_cursor, unread
+
+    @database_sync_to_async
+    def view(self, notification_id):
+        user_id = self.scope['user'].id
+        mark_notification_viewed(notification_id, user_id)
+        return get_unread_notifications([user_id])[user_id][self.get_counter_field_name()]
+
+    async def fetch_notifications(self, data=None):
+        data = data or {}
+        if self.is_chat_notifications():
             command = 'chat_notifications'
             type = 'chat_'
+        else:
+            command = 'notifications'
+            type = ''
+
+        try:
+            notifications, older_cursor, unread = await self.get_notifications(
+                int(data['cursor']) if data.get('cursor') else None,
+                int(data['since']) if data.get('since') else None,
+                int(data.get('page_size', NOTIFICATIONS_PAGE_SIZE)),
+            )
+        except (ValueError, TypeError):
+            await self.send_message({'command': 'error', 'message': 'Invalid cursor.'})
+            return
 
         content = {
             'command': command,
-            f'{type}notifications': self.notifications_to_json(notification)
-
+            f'{type}notifications': notifications,
+            'older': older_cursor,
+            'unread': unread,
         }
-        self.send_message(content)
-
-    def view_notification(self, data):
-        user = self.scope['user']
-        notification = Notification.objects.filter(id=data['id']).first()
-        if notification:
-            if notification.section == Notification.CHATS:
-                notification.delete()
-            else:
-                notification_seen = notification.users_seen.filter(user=user).first()
-                notification_seen.is_viewed = True
-                notification_seen.save()
-
-    def notifications_to_json(self, notifications):
-        result = []
-        for notification in notifications:
-            result.append(self.notification_to_json(notification))
-        return result
+        await self.send_message(content)
 
-    def notification_to_json(self, notification):
-        user = self.scope['user']
-        notification_seen = notification.users_seen.filter(user=user).first()
-        return {
-            'id': notification.id,
-            'section': Notification.get_section_choices_label_value(notification.section),
-            'text': notification.text,
-            'is_viewed': notification_seen.is_viewed,
-            'date_created': str(notification.date_created),
-            'object_id': f'{notification.object_id if notification.object_id else ""}',
-            'action_path': Notification.get_action_choices_label_value(notification.action_path),
-        }
+    async def view_notification(self, data):
+        unread = await self.view(data['id'])
+        await self.channel_layer.group_send(
+            self.group_name,
+            {
+                'type': 'notify',
+                'data': {
+                    'command': 'unread_notifications',
+                    'unread': unread,
+                },
+            }
+        )
 
     commands = {
         'fetch_notifications': fetch_notifications,
         'view_notification': view_notification,
     }
 
-    def connect(self):
+    async def connect(self):
         user = self.scope['user']
 
         if user.is_anonymous:
-            self.close()
+            await self.close()
         else:
-            condition = self.scope['path'] == '/ws/notification/'
-            self.group_name = f'{user.id}{"" if condition else "_chat"}'
-            async_to_sync(self.channel_layer.group_add)(
+            self.group_name = f'{user.id}{"_chat" if self.is_chat_notifications() else ""}'
+            await self.channel_layer.group_add(
                 self.group_name,
                 self.channel_name
             )
-            self.accept()
+            await self.accept()
 
-            self.fetch_notifications()
+            await self.fetch_notifications()
 
-    def disconnect(self, close_code):
-        self.close()
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
 
-    def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         data = json.loads(text_data)
-        self.commands[data['command']](self, data)
+        await self.commands[data['command']](self, data)
 
-    def notify(self, event):
-        self.send(text_data=json.dumps(event['data']))
+    async def notify(self, event):
+        await self.send(text_data=json.dumps(event['data']))
 
-    def send_message(self, message):
-        self.send(text_data=json.dumps(message))
+    async def send_message(self, message):
+        await self.send(text_data=json.dumps(message))
@@ -1,4 +1,3 @@
-import os
 from urllib import parse
 
 from channels.auth import AuthMiddlewareStack
@@ -10,8 +9,6 @@ from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-os.environ["DJANGO_ALLOW_ASYNC_UNSAFE"] = "true"
-
 
 @database_sync_to_async
 def get_user(token_key):
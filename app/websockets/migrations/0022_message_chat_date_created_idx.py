@@ -0,0 +1,17 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('websockets', '0021_merge_20210726_1913'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'date_created', 'id'], name='message_chat_date_created_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.5 on 2026-10-17 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_unread_notifications_counters(apps, schema_editor):
+    NotificationSeen = apps.get_model('websockets', 'NotificationSeen')
+    UnreadNotificationsCounter = apps.get_model('websockets', 'UnreadNotificationsCounter')
+
+    condition = models.Q(notification__section='chats')
+    counters = [
+        UnreadNotificationsCounter(
+            user_id=row['user_id'],
+            notifications=row['notifications'],
+            chat_notifications=row['chat_notifications'],
+        ) for row in NotificationSeen.objects.filter(is_viewed=False).order_by().values('user_id').annotate(
+            notifications=models.Count('id', filter=~condition),
+            chat_notifications=models.Count('id', filter=condition),
+        )
+    ]
+    UnreadNotificationsCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('websockets', '0022_message_chat_date_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationsCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notifications', models.PositiveIntegerField(default=0, verbose_name='Number of unread notifications')),
+                ('chat_notifications', models.PositiveIntegerField(default=0, verbose_name='Number of unread chat notifications')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='unread_notifications_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Unread notifications counter',
+                'verbose_name_plural': 'Unread notifications counters',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['section', 'object_id'], name='notification_section_obj_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['date_created'], name='notification_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationseen',
+            index=models.Index(fields=['user', '-notification'], name='notification_seen_user_idx'),
+        ),
+        migrations.RunPython(fill_unread_notifications_counters, migrations.RunPython.noop),
+    ]
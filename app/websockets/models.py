@@ -101,6 +101,9 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['date_created', ]
+        indexes = [
+            models.Index(fields=['chat', 'date_created', 'id'], name='message_chat_date_created_idx'),
+        ]
         verbose_name = _("Message")
         verbose_name_plural = _("Messages")
 
@@ -201,6 +204,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-date_created', ]
+        indexes = [
+            models.Index(fields=['section', 'object_id'], name='notification_section_obj_idx'),
+            models.Index(fields=['date_created'], name='notification_date_created_idx'),
+        ]
         verbose_name = _("Notification")
         verbose_name_plural = _("Notifications")
 
@@ -236,6 +243,43 @@ class NotificationSeen(models.Model):
         default=False,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-notification'], name='notification_seen_user_idx'),
+        ]
+
+
+class UnreadNotificationsCounter(models.Model):
+    """
+    Model for number of user's unread notifications, maintained when notifications are
+    created, viewed or deleted.
+    """
+
+    user = models.OneToOneField(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='unread_notifications_counter',
+    )
+    notifications = models.PositiveIntegerField(
+        _('Number of unread notifications'),
+        default=0,
+    )
+    chat_notifications = models.PositiveIntegerField(
+        _('Number of unread chat notifications'),
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = _("Unread notifications counter")
+        verbose_name_plural = _("Unread notifications counters")
+
+    def __str__(self):
+        return f'Unread notifications counter of user [{self.user_id}]'
+
+    @staticmethod
+    def get_field_name(section):
+        return 'chat_notifications' if section == Notification.CHATS else 'notifications'
+
 
 class Ticket(models.Model):
     """
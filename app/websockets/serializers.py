@@ -1,6 +1,8 @@
 from rest_framework import serializers
 
 from app.websockets.models import Chat, Message, MessageFile, Ticket, ChatPermission
+from app.websockets.utils import MESSAGES_PAGE_SIZE, MAX_MESSAGES_PAGE_SIZE, NOTIFICATIONS_PAGE_SIZE, \
+    MAX_NOTIFICATIONS_PAGE_SIZE
 
 
 class ChatBaseSerializer(serializers.ModelSerializer):
@@ -25,6 +27,31 @@ class MessageBaseSerializer(serializers.ModelSerializer):
         )
 
 
+class MessageListSerializer(MessageBaseSerializer):
+    files = serializers.SerializerMethodField()
+
+    class Meta(MessageBaseSerializer.Meta):
+        model = Message
+        fields = MessageBaseSerializer.Meta.fields + ('date_created', 'files',)
+
+    def get_files(self, obj):
+        return [file.get_absolute_file_upload_url() for file in obj.files.all()]
+
+
+class MessagePageSerializer(serializers.Serializer):
+    chat = serializers.IntegerField(required=False)
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=MAX_MESSAGES_PAGE_SIZE, default=MESSAGES_PAGE_SIZE)
+
+
+class NotificationPageSerializer(serializers.Serializer):
+    chats = serializers.BooleanField(default=False)
+    cursor = serializers.IntegerField(required=False, min_value=1)
+    since = serializers.IntegerField(required=False, min_value=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=MAX_NOTIFICATIONS_PAGE_SIZE,
+                                         default=NOTIFICATIONS_PAGE_SIZE)
+
+
 class MessageFileBaseSerializer(serializers.ModelSerializer):
     class Meta:
         model = MessageFile
@@ -1,28 +1,27 @@
+import asyncio
 import datetime
 import logging
-import smtplib
+from collections import Counter
+from itertools import groupby
 
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from django.core.mail import send_mail
-from django.template.loader import get_template
 
-from app.websockets.utils import notification_to_json
-from config import settings
+from app.core.util.mailing import build_email, send_emails
+from app.websockets.utils import notification_to_json, notification_seen_to_json, get_unread_notifications, \
+    change_unread_notifications, recalculate_unread_notifications
 from config.celery import celery_app
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone, translation
 
 from app.booking.models import Booking
-from app.websockets.models import Chat, Notification
+from app.websockets.models import Chat, Notification, NotificationSeen, UnreadNotificationsCounter
 
 from django.utils.translation import ugettext_lazy as _
 
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
 logger = logging.getLogger("acemaven.task.logging")
 User = get_user_model()
 
@@ -42,58 +41,135 @@ def create_chat_for_operation(operation_id):
     chat.users.set(users)
 
 
-@celery_app.task(name='create_and_assign_notification')
-def create_and_assign_notification(section, text_body, text_params, users_ids, action_path, object_id=None):
-    users = User.objects.filter(id__in=users_ids)
+def group_send_many(messages):
+    """
+    Sends list of (group name, message) pairs to the channel layer concurrently in one event loop run.
+    """
 
-    for user in users:
-        code = user.language
-        translation.activate(code)
-        text = _(text_body)
-        if text_params:
-            text = text.format(**text_params)
-        translation.deactivate()
+    channel_layer = get_channel_layer()
 
-        notification = Notification.objects.create(
-            section=section,
-            text=text,
-            action_path=action_path,
-            object_id=object_id,
-        )
+    async def send_messages():
+        await asyncio.gather(*(channel_layer.group_send(group, message) for group, message in messages))
 
-        notification.users.add(user)
-        translation.deactivate()
+    if messages:
+        async_to_sync(send_messages)()
 
 
-@celery_app.task(name='send_notification')
-def send_notification(notification_id):
-    channel_layer = get_channel_layer()
+def push_notifications(notifications_users):
+    """
+    Sends notifications to channel groups of their users concurrently in one event loop run,
+    notifications_users is a list of (notification, users ids) pairs.
+    """
 
-    notification = Notification.objects.filter(id=notification_id).first()
-    if notification:
+    counters = get_unread_notifications({user_id for _notification, users_ids in notifications_users
+                                         for user_id in users_ids})
+    messages = []
+    for notification, users_ids in notifications_users:
         data = notification_to_json(notification)
-        for user in notification.users.all():
-            logger.info(f'{user.id}{"_chat" if notification.section == Notification.CHATS else ""}')
-            condition = notification.section == Notification.CHATS
-            async_to_sync(channel_layer.group_send)(
-                f'{user.id}{"_chat" if condition else ""}',
+        condition = notification.section == Notification.CHATS
+        field_name = UnreadNotificationsCounter.get_field_name(notification.section)
+        for user_id in users_ids:
+            messages.append((
+                f'{user_id}{"_chat" if condition else ""}',
                 {
                     'type': 'notify',
                     'data': {
                         'command': f'{"chat_" if condition else ""}notification',
                         f'{"chat_" if condition else ""}notification': data,
+                        'unread': counters[user_id][field_name],
                     },
                 },
-            )
+            ))
+
+    group_send_many(messages)
+
+
+def create_notifications(section, text_body, text_params, objects_users, action_path):
+    """
+    Creates notifications about objects for their users, objects_users is a list of (object id, users ids)
+    pairs. Text is translated once per language, notifications and their users are created in bulk.
+    Returns number of notified users.
+    """
+
+    users_languages = dict(User.objects.filter(
+        id__in={user_id for _object_id, users_ids in objects_users for user_id in users_ids},
+    ).values_list('id', 'language'))
+
+    texts = dict()
+    for code in set(users_languages.values()):
+        translation.activate(code)
+        text = _(text_body)
+        if text_params:
+            text = text.format(**text_params)
+        texts[code] = str(text)
+        translation.deactivate()
+
+    notifications_users = []
+    for object_id, users_ids in objects_users:
+        users_ids = sorted((user_id for user_id in set(users_ids) if user_id in users_languages),
+                           key=lambda user_id: users_languages[user_id] or '')
+        for code, language_users_ids in groupby(users_ids, key=lambda user_id: users_languages[user_id]):
+            notifications_users.append((
+                Notification(
+                    section=section,
+                    text=texts[code],
+                    action_path=action_path,
+                    object_id=object_id,
+                ),
+                list(language_users_ids),
+            ))
+
+    users_notifications_numbers = Counter(user_id for _notification, users_ids in notifications_users
+                                          for user_id in users_ids)
+    users_by_notifications_number = dict()
+    for user_id, notifications_number in users_notifications_numbers.items():
+        users_by_notifications_number.setdefault(notifications_number, []).append(user_id)
+
+    with transaction.atomic():
+        Notification.objects.bulk_create([notification for notification, _users_ids in notifications_users])
+        NotificationSeen.objects.bulk_create([
+            NotificationSeen(notification=notification, user_id=user_id)
+            for notification, language_users_ids in notifications_users for user_id in language_users_ids
+        ], batch_size=1000)
+        for notifications_number, users_ids in users_by_notifications_number.items():
+            change_unread_notifications(users_ids, section, notifications_number)
+    push_notifications(notifications_users)
+    return len(users_notifications_numbers)
+
+
+@celery_app.task(name='create_and_assign_notification')
+def create_and_assign_notification(section, text_body, text_params, users_ids, action_path, object_id=None):
+    users_number = create_notifications(section, text_body, text_params, [(object_id, users_ids)], action_path)
+    logger.info(f'Notification with text "{text_body}" was sent to {users_number} users.')
+
+
+@celery_app.task(name='create_and_assign_notifications')
+def create_and_assign_notifications(section, text_body, text_params, objects_users, action_path):
+    users_number = create_notifications(section, text_body, text_params, objects_users, action_path)
+    logger.info(f'{len(objects_users)} notifications with text "{text_body}" were sent to {users_number} users.')
+
+
+@celery_app.task(name='send_notification')
+def send_notification(notification_id):
+    notification = Notification.objects.filter(id=notification_id).first()
+    if notification:
+        push_notifications([(notification, list(notification.users.values_list('id', flat=True)))])
         logger.info(f'Notification [{notification_id}] with text "{notification.text}" was sent.')
 
 
 @celery_app.task(name='delete_old_notifications')
 def daily_delete_old_notifications():
     now_date = timezone.localtime()
-    Notification.objects.filter(
+    notifications = Notification.objects.filter(
         date_created__lt=now_date - datetime.timedelta(days=30),
-    ).delete()
+    )
+    users_ids = list(NotificationSeen.objects.filter(
+        notification__in=notifications,
+        is_viewed=False,
+    ).order_by().values_list('user_id', flat=True).distinct())
+    with transaction.atomic():
+        notifications.delete()
+        recalculate_unread_notifications(users_ids)
 
 
 @celery_app.task(name='reassign_notifications_after_change_request_confirm')
@@ -102,17 +178,19 @@ def reassign_confirmed_operation_notifications(old_operation_id, new_operation_i
         section=Notification.OPERATIONS,
         object_id=old_operation_id,
     )
-    users_ids = list(set(notifications.values_list('users__id', flat=True)))
+    notifications_seen = list(NotificationSeen.objects.filter(notification__in=notifications)
+                              .select_related('notification').order_by('-notification_id'))
     notifications.update(object_id=new_operation_id)
 
-    channel_layer = get_channel_layer()
-    for user_id in users_ids:
-        async_to_sync(channel_layer.group_send)(
-            f'{user_id}',
-            {
-                'type': 'fetch_notifications',
-            },
-        )
+    changed_notifications = dict()
+    for notification_seen in notifications_seen:
+        notification_seen.notification.object_id = new_operation_id
+        changed_notifications.setdefault(notification_seen.user_id, []).append(
+            notification_seen_to_json(notification_seen))
+    group_send_many([
+        (f'{user_id}', {'type': 'notify', 'data': {'command': 'notifications_changed', 'notifications': data}})
+        for user_id, data in changed_notifications.items()
+    ])
 
 
 @celery_app.task(name='delete_accepted_booking_notifications')
@@ -122,65 +200,57 @@ def delete_accepted_booking_notifications(booking_id):
         action_path=Notification.BOOKING,
         object_id=booking_id,
     )
-    users_ids = list(set(notifications.values_list('users__id', flat=True)))
-    notifications.delete()
-
-    channel_layer = get_channel_layer()
-    for user_id in users_ids:
-        async_to_sync(channel_layer.group_send)(
-            f'{user_id}',
-            {
-                'type': 'fetch_notifications',
-            },
-        )
+    deleted_notifications = dict()
+    for notification_id, user_id in NotificationSeen.objects.filter(notification__in=notifications) \
+            .values_list('notification_id', 'user_id'):
+        deleted_notifications.setdefault(user_id, []).append(notification_id)
+    with transaction.atomic():
+        notifications.delete()
+        recalculate_unread_notifications(list(deleted_notifications))
+
+    counters = get_unread_notifications(list(deleted_notifications))
+    group_send_many([
+        (f'{user_id}', {'type': 'notify', 'data': {
+            'command': 'notifications_deleted',
+            'ids': notifications_ids,
+            'unread': counters[user_id]['notifications'],
+        }})
+        for user_id, notifications_ids in deleted_notifications.items()
+    ])
 
 
 @celery_app.task(name='send_emails')
 def send_email(text_body, text_params, users_ids, object_id=None, data=None):
+    data = list(data.items()) if data else None
+    return send_digest_emails(text_body, text_params, [(user_id, object_id, data) for user_id in users_ids])
+
 
-    users = User.objects.filter(id__in=users_ids)
+@celery_app.task(name='send_digest_emails')
+def send_digest_emails(text_body, text_params, digests):
+    """
+    Sends an email to every user of digests, a list of (user id, link, data) triples, data being a list
+    of (title, value) pairs, so every user gets own link and data in a single email. Text is translated
+    once per language.
+    """
 
-    for user in users:
-        msg = MIMEMultipart('alternative')
+    statuses = dict()
+    digests = {user_id: (link, data) for user_id, link, data in digests}
+    users = User.objects.filter(id__in=digests).order_by('language')
 
-        msg['Subject'] = 'Acemaven'
-        msg['From'] = settings.EMAIL_HOST_USER
-        msg['To'] = user.email
-        code = user.language
+    for code, language_users in groupby(users, key=lambda user: user.language):
         translation.activate(code)
         text = _(text_body)
         if text_params:
             text = text.format(**text_params)
-
-        body_text = text
-
-        context = {
-            "person": f'{user.first_name} {user.last_name}',
-            "text": text,
-            "data": data,
-            "link": object_id,
-        }
-
-        template_html = get_template(f"core/emails_templates/index.html")
-        message_html = template_html.render(context)
-
-        part1 = MIMEText(body_text, 'plain')
-        part2 = MIMEText(message_html, 'html')
-
-        msg.attach(part1)
-        msg.attach(part2)
-
-        mail = smtplib.SMTP("smtp.outlook.office365.com", 587, timeout=20)
-        mail.starttls()
-        recepient = [user.email,]
-
-        mail.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
-
-        logger.debug(f"sending email to {user.email}")
-        mail.sendmail(settings.EMAIL_HOST_USER, recepient, msg.as_string())
-
-        logger.debug(f"sending email to {user.email}")
-        # send_mail(text, text, settings.EMAIL_HOST_USER, [user.email, ], html_message=message_html)
-        logger.info(f"email has been sent to {user.email}")
-        mail.quit()
+        text = str(text)
+        messages = [
+            build_email(user.email, 'Acemaven', text, {
+                "person": f'{user.first_name} {user.last_name}',
+                "text": text,
+                "data": digests[user.id][1],
+                "link": digests[user.id][0],
+            }) for user in language_users
+        ]
         translation.deactivate()
+        statuses.update(send_emails(messages))
+    return statuses
@@ -4,6 +4,7 @@ from django.urls import path
 from app.websockets.views import (ChatViewSet,
                                   MessageViewSet,
                                   MessageFileViewSet,
+                                  NotificationViewSet,
                                   TicketViewSet, TicketView, IndexView, )
 
 app_name = 'websockets'
@@ -12,6 +13,7 @@ router = DefaultRouter()
 router.register(r'chat', ChatViewSet, basename='chat')
 router.register(r'message', MessageViewSet, basename='message')
 router.register(r'file', MessageFileViewSet, basename='message-file')
+router.register(r'notification', NotificationViewSet, basename='notification')
 router.register(r'ticket', TicketViewSet, basename='support-chat')
 
 urlpatterns = router.urls
@@ -1,6 +1,19 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q, F, Count, Value
+from django.db.models.functions import Greatest
 from django.forms import model_to_dict
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from app.websockets.models import Notification, NotificationSeen, UnreadNotificationsCounter
 
-from app.websockets.models import Notification
+MESSAGES_PAGE_SIZE = 50
+MAX_MESSAGES_PAGE_SIZE = 200
+NOTIFICATIONS_PAGE_SIZE = 30
+MAX_NOTIFICATIONS_PAGE_SIZE = 100
 
 
 def notification_to_json(notification):
@@ -8,3 +21,144 @@ def notification_to_json(notification):
     data['action_path'] = Notification.get_action_choices_label_value(data['action_path'])
     data['section'] = Notification.get_section_choices_label_value(data['section'])
     return data
+
+
+def encode_message_cursor(message):
+    position = {'date_created': message.date_created.isoformat(), 'id': message.id}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_message_cursor(cursor):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        date_created = parse_datetime(position['date_created'])
+        if date_created is None:
+            raise ValueError
+        return date_created, int(position['id'])
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        raise serializers.ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def get_messages_page(queryset, cursor=None, page_size=MESSAGES_PAGE_SIZE):
+    """
+    Returns (messages, cursor of older messages) for the latest page_size messages before cursor,
+    messages are ordered from older to newer, cursor is None if there are no older messages.
+    Keyset pagination by (date_created, id) uses the index of Message, so the cost of a page
+    does not depend on the length of the chat.
+    """
+
+    try:
+        page_size = min(max(int(page_size), 1), MAX_MESSAGES_PAGE_SIZE)
+    except (ValueError, TypeError):
+        page_size = MESSAGES_PAGE_SIZE
+    queryset = queryset.select_related('user').prefetch_related('files').order_by('-date_created', '-id')
+    if cursor:
+        date_created, message_id = decode_message_cursor(cursor)
+        queryset = queryset.filter(Q(date_created__lt=date_created) | Q(date_created=date_created, id__lt=message_id))
+    messages = list(queryset[:page_size + 1])
+    older_cursor = encode_message_cursor(messages[page_size - 1]) if len(messages) > page_size else None
+    return messages[:page_size][::-1], older_cursor
+
+
+def notification_seen_to_json(notification_seen):
+    notification = notification_seen.notification
+    return {
+        'id': notification.id,
+        'section': Notification.get_section_choices_label_value(notification.section),
+        'text': notification.text,
+        'is_viewed': notification_seen.is_viewed,
+        'date_created': str(notification.date_created),
+        'object_id': f'{notification.object_id if notification.object_id else ""}',
+        'action_path': Notification.get_action_choices_label_value(notification.action_path),
+    }
+
+
+def get_notifications_page(user_id, chats=False, cursor=None, since=None, page_size=NOTIFICATIONS_PAGE_SIZE):
+    """
+    Returns (notifications json, cursor of older notifications) of user's inbox, newest first.
+    Cursor is id of the last notification of the page, since limits the page to notifications
+    newer than the one the client already has.
+    """
+
+    condition = Q(notification__section=Notification.CHATS)
+    queryset = NotificationSeen.objects.filter(
+        condition if chats else ~condition,
+        user_id=user_id,
+    ).select_related('notification').order_by('-notification_id')
+    if cursor:
+        queryset = queryset.filter(notification_id__lt=cursor)
+    if since:
+        queryset = queryset.filter(notification_id__gt=since)
+    page_size = min(max(page_size, 1), MAX_NOTIFICATIONS_PAGE_SIZE)
+    notifications_seen = list(queryset[:page_size + 1])
+    older_cursor = notifications_seen[page_size - 1].notification_id if len(notifications_seen) > page_size else None
+    return [notification_seen_to_json(notification_seen) for notification_seen in notifications_seen[:page_size]], \
+        older_cursor
+
+
+def get_unread_notifications(users_ids):
+    """
+    Returns dict of user id to dict of unread notifications and chat notifications numbers.
+    """
+
+    counters = {user_id: {'notifications': 0, 'chat_notifications': 0} for user_id in users_ids}
+    for user_id, notifications, chat_notifications in UnreadNotificationsCounter.objects.filter(
+            user_id__in=users_ids,
+    ).values_list('user_id', 'notifications', 'chat_notifications'):
+        counters[user_id] = {'notifications': notifications, 'chat_notifications': chat_notifications}
+    return counters
+
+
+def change_unread_notifications(users_ids, section, value):
+    field_name = UnreadNotificationsCounter.get_field_name(section)
+    UnreadNotificationsCounter.objects.bulk_create(
+        [UnreadNotificationsCounter(user_id=user_id) for user_id in set(users_ids)],
+        ignore_conflicts=True,
+    )
+    UnreadNotificationsCounter.objects.filter(user_id__in=users_ids).update(
+        **{field_name: Greatest(F(field_name) + value, Value(0))},
+    )
+
+
+def recalculate_unread_notifications(users_ids=None):
+    """
+    Sets counters of users (of all users if users_ids is None) to the number of their unread notifications.
+    """
+
+    condition = Q(notification__section=Notification.CHATS)
+    notifications_seen = NotificationSeen.objects.filter(is_viewed=False)
+    if users_ids is not None:
+        notifications_seen = notifications_seen.filter(user_id__in=users_ids)
+    counts = {
+        row['user_id']: row for row in notifications_seen.order_by().values('user_id').annotate(
+            notifications=Count('id', filter=~condition),
+            chat_notifications=Count('id', filter=condition),
+        )
+    }
+    users_ids = set(counts) if users_ids is None else set(users_ids)
+    UnreadNotificationsCounter.objects.bulk_create([UnreadNotificationsCounter(user_id=user_id)
+                                                    for user_id in users_ids], ignore_conflicts=True)
+    counters = list(UnreadNotificationsCounter.objects.filter(user_id__in=users_ids))
+    for counter in counters:
+        row = counts.get(counter.user_id, {})
+        counter.notifications = row.get('notifications', 0)
+        counter.chat_notifications = row.get('chat_notifications', 0)
+    UnreadNotificationsCounter.objects.bulk_update(counters, ['notifications', 'chat_notifications'], batch_size=1000)
+
+
+def mark_notification_viewed(notification_id, user_id):
+    """
+    Marks notification viewed by user, chat notifications are removed once viewed by all their users.
+    """
+
+    notification = Notification.objects.filter(id=notification_id).first()
+    if not notification:
+        return
+    if notification.section == Notification.CHATS:
+        deleted, _ = notification.users_seen.filter(user_id=user_id).delete()
+        if not notification.users_seen.exists():
+            notification.delete()
+    else:
+        deleted = notification.users_seen.filter(user_id=user_id, is_viewed=False).update(is_viewed=True)
+    if deleted:
+        change_unread_notifications([user_id], notification.section, -deleted)
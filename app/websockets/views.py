@@ -2,11 +2,15 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 from rest_framework import mixins, viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 
 from app.websockets.models import Chat, Message, MessageFile, Ticket
 from app.websockets.serializers import ChatBaseSerializer, MessageBaseSerializer, MessageFileBaseSerializer, \
-    TicketBaseSerializer, TicketPermissionSerializer
+    TicketBaseSerializer, TicketPermissionSerializer, MessageListSerializer, MessagePageSerializer, \
+    NotificationPageSerializer
+from app.websockets.utils import get_messages_page, get_notifications_page, get_unread_notifications, \
+    mark_notification_viewed
 
 from rest_framework.response import Response
 from rest_framework import status
@@ -32,6 +36,60 @@ class MessageViewSet(mixins.ListModelMixin,
     serializer_class = MessageBaseSerializer
     permission_classes = (IsAuthenticated,)
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return MessageListSerializer
+        return self.serializer_class
+
+    def get_queryset(self):
+        user = self.request.user
+        return self.queryset.filter(chat__users=user)
+
+    def list(self, request, *args, **kwargs):
+        page_serializer = MessagePageSerializer(data=request.query_params)
+        page_serializer.is_valid(raise_exception=True)
+        params = page_serializer.validated_data
+        queryset = self.filter_queryset(self.get_queryset())
+        if chat_id := params.get('chat'):
+            queryset = queryset.filter(chat_id=chat_id)
+        messages, older_cursor = get_messages_page(queryset, params.get('cursor'), params['page_size'])
+        serializer = self.get_serializer(messages, many=True)
+        return Response({'results': serializer.data, 'older': older_cursor})
+
+
+class NotificationViewSet(viewsets.ViewSet):
+    """
+    Notifications inbox of the user, paginated by id of the last notification of the page.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    lookup_value_regex = r'\d+'
+
+    def list(self, request, *args, **kwargs):
+        page_serializer = NotificationPageSerializer(data=request.query_params)
+        page_serializer.is_valid(raise_exception=True)
+        params = page_serializer.validated_data
+        user_id = request.user.id
+        notifications, older_cursor = get_notifications_page(user_id, params['chats'], params.get('cursor'),
+                                                             params.get('since'), params['page_size'])
+        unread = get_unread_notifications([user_id])[user_id]
+        return Response({
+            'results': notifications,
+            'older': older_cursor,
+            'unread': unread['chat_notifications' if params['chats'] else 'notifications'],
+        })
+
+    @action(methods=['get'], detail=False, url_path='unread')
+    def unread(self, request, *args, **kwargs):
+        user_id = request.user.id
+        return Response(get_unread_notifications([user_id])[user_id])
+
+    @action(methods=['post'], detail=True, url_path='view')
+    def view(self, request, pk=None, *args, **kwargs):
+        user_id = request.user.id
+        mark_notification_viewed(pk, user_id)
+        return Response(get_unread_notifications([user_id])[user_id])
+
 
 class MessageFileViewSet(mixins.CreateModelMixin,
                          viewsets.GenericViewSet):
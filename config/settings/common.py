@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.gis',
+    'django.contrib.postgres',
     "storages",
 
     'corsheaders',
@@ -94,6 +95,7 @@ DATE_INPUT_FORMATS = ['%d/%m/%Y']
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.core.middleware.QueryBudgetMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -107,6 +109,12 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# Sql instrumentation of requests and query budget headers are enabled by QUERY_BUDGET_ENABLED setting,
+# DEBUG by default, so it's not set here to follow DEBUG of local settings
+
+# Raise instead of logging a warning, when a view exceeds its query budget
+QUERY_BUDGET_RAISE = False
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -205,6 +213,33 @@ STATIC_URL = '/assets/'
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# Mail delivery, one SMTP session is reused by all emails sent by a worker process
+SMTP_HOST = 'smtp.outlook.office365.com'
+SMTP_PORT = 587
+SMTP_USE_TLS = True
+SMTP_TIMEOUT = 20
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
+SMTP_IDLE_CHECK_SECONDS = 30
+
+# Sea tracking api polling
+SEA_TRACKING_CONCURRENCY = 8
+SEA_TRACKING_TIMEOUT = 30
+SEA_TRACKING_RETRIES = 3
+
+# Pix bank api client
+PIX_API_CONNECT_TIMEOUT = 5
+PIX_API_READ_TIMEOUT = 20
+PIX_API_POOL_SIZE = 10
+PIX_API_TOKEN_DEFAULT_EXPIRATION = 600
+PIX_API_TOKEN_EXPIRATION_MARGIN = 60
+PIX_API_CIRCUIT_FAILURES = 5
+PIX_API_CIRCUIT_RESET_TIMEOUT = 60
+PIX_CHARGE_ISSUE_RETRIES = 5
+PIX_CHARGE_ISSUE_RETRY_DELAY = 10
+
+# Allows the benchmark command to generate and delete synthetic data, enable only for a dedicated database
+BENCHMARK_ENABLED = False
+
 # Celery
 CELERY_BROKER_URL = 'redis://0.0.0.0:6379'
 CELERY_RESULT_BACKEND = 'redis://0.0.0.0:6379'
@@ -244,6 +279,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'notify_users_of_import_sea_shipment_arrival',
         'schedule': crontab(hour=0, minute=0),
     },
+    'reconcile-pix-payments': {
+        'task': 'reconcile_pix_payments',
+        'schedule': crontab(minute='*/15'),
+    },
 }
 
 # JWT
@@ -269,6 +308,17 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://0.0.0.0:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
 # Model order in admin panel
 ADMIN_REORDER = (
 
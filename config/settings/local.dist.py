@@ -23,5 +23,9 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_HOST_USER = ''
 EMAIL_HOST_PASSWORD = ''
+# Local debugging server: python -m smtpd -n -c DebuggingServer localhost:1025
+# SMTP_HOST = 'localhost'
+# SMTP_PORT = 1025
+# SMTP_USE_TLS = False
 
 DOMAIN_ADDRESS = ''